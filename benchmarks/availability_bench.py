@@ -0,0 +1,146 @@
+"""
+Đo tìm phòng trống theo khoảng ngày (search_available_rooms) trên index lịch trống.
+
+Dataset: N phòng (nhiều loại / khu vực), mỗi phòng có lịch đặt trước nối tiếp trong `--days` ngày tới
+(khoảng trống ngẫu nhiên giữa các lịch), một ít phòng bảo trì / đang giữ chỗ.
+
+Usage:
+    python benchmarks/availability_bench.py --rooms 500 --days 365 --queries 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("REALTIME_MIRROR", "0")
+os.environ.setdefault("HOLD_SWEEPER", "0")
+
+from src import db  # noqa: E402
+from src.availability import AvailabilityIndex, to_seconds  # noqa: E402
+from src.models import BookingStatus, BookingType, RoomStatus  # noqa: E402
+
+TYPES = ["STD", "SUP", "DLX", "VIP", "FAM"]
+AREAS = ["Khu A", "Khu B", "Khu C", "Khu D"]
+
+
+def seed(client, rooms: int, days: int, seed_value: int) -> int:
+    rng = random.Random(seed_value)
+    now = datetime.now().replace(second=0, microsecond=0)
+    room_docs, booking_docs = [], []
+    for i in range(rooms):
+        room_id = f"{100 + i}"
+        status = RoomStatus.AVAILABLE.value
+        extra = {}
+        roll = rng.random()
+        if roll < 0.02:
+            status = RoomStatus.MAINTENANCE.value
+        elif roll < 0.05:
+            status = RoomStatus.TEMP_LOCKED.value
+            extra = {"locked_by": f"s{i}", "locked_until": now + timedelta(minutes=5)}
+        room_docs.append((room_id, {
+            "id": room_id,
+            "room_type_code": TYPES[i % len(TYPES)],
+            "floor": AREAS[i % len(AREAS)],
+            "status": status,
+            **extra,
+        }))
+        t = now - timedelta(hours=rng.randrange(0, 24))
+        end_horizon = now + timedelta(days=days)
+        k = 0
+        while t < end_horizon:
+            nights = rng.randint(1, 4)
+            check_out = t + timedelta(days=nights)
+            booking_id = f"B{i:04d}{k:04d}"
+            booking_docs.append((booking_id, {
+                "id": booking_id,
+                "room_id": room_id,
+                "booking_type": BookingType.DAILY.value,
+                "status": BookingStatus.CHECKED_IN.value if k == 0 else BookingStatus.CONFIRMED.value,
+                "check_in": t,
+                "check_out_expected": check_out,
+            }))
+            t = check_out + timedelta(hours=rng.choice([2, 12, 24, 48, 72]))
+            k += 1
+    client.store.bulk_load("rooms", room_docs)
+    client.store.bulk_load("bookings", booking_docs)
+    return len(booking_docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark availability search")
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    client = db.get_db()
+    stays = seed(client, args.rooms, args.days, args.seed)
+    for code in TYPES:
+        db.save_room_type_to_db({"type_code": code, "name": code, "pricing": {"daily_price": 500000}})
+
+    t0 = time.perf_counter()
+    index = db.get_availability_index()
+    build_ms = (time.perf_counter() - t0) * 1000
+    print(f"Dataset: {args.rooms} rooms, {stays:,} active stays over {args.days} days")
+    print(f"Index build (first load, incl. fetch): {build_ms:.1f} ms | {index.stats()}")
+
+    # Kiểm tra kết quả với cách quét tuyến tính (so trực tiếp mọi khoảng của mọi phòng)
+    rng = random.Random(args.seed + 1)
+    now = datetime.now().replace(second=0, microsecond=0)
+    bookings = db.get_active_bookings_dict()
+    naive = AvailabilityIndex(db.get_all_rooms(), bookings)
+
+    def stay_end(b):
+        end = to_seconds(b["check_out_expected"])
+        if b["status"] == BookingStatus.CHECKED_IN.value:
+            return max(end, to_seconds(naive.expires_at))
+        return end
+
+    def linear_free(check_in, check_out, type_code):
+        start, end = to_seconds(check_in), to_seconds(check_out)
+        busy = {b["room_id"] for b in bookings.values() if to_seconds(b["check_in"]) < end and stay_end(b) > start}
+        return sorted(
+            r["id"] for r in naive.rooms.values()
+            if r["room_type_code"] == type_code and r["id"] not in busy
+            and r.get("status") not in (RoomStatus.MAINTENANCE.value, RoomStatus.TEMP_LOCKED.value)
+        )
+
+    queries = []
+    for _ in range(args.queries):
+        check_in = (now + timedelta(days=rng.randrange(1, args.days))).replace(hour=14, minute=0)
+        check_out = check_in + timedelta(days=rng.randint(1, 5), hours=-2)
+        queries.append((check_in, check_out, rng.choice(TYPES + [None]), rng.choice(AREAS + [None] * 4)))
+
+    mismatches = 0
+    for check_in, check_out, type_code, _ in queries[:200]:
+        if type_code is None:
+            continue
+        got = sorted(r["id"] for r in db.search_available_rooms(check_in, check_out, type_code=type_code)["rooms"])
+        mismatches += got != linear_free(check_in, check_out, type_code)
+    print(f"Equivalence vs linear scan: {mismatches} mismatches")
+
+    elapsed = []
+    found = 0
+    for check_in, check_out, type_code, area in queries:
+        t0 = time.perf_counter()
+        result = db.search_available_rooms(
+            check_in, check_out, BookingType.DAILY, type_code=type_code, area=area
+        )
+        elapsed.append((time.perf_counter() - t0) * 1000)
+        found += len(result["rooms"])
+    elapsed.sort()
+    p50 = statistics.median(elapsed)
+    p95 = elapsed[int(len(elapsed) * 0.95) - 1]
+    print(f"search_available_rooms x{len(queries)}: p50 {p50:.2f} ms | p95 {p95:.2f} ms | "
+          f"max {elapsed[-1]:.2f} ms | avg rooms found {found / len(queries):.1f}")
+    sys.exit(1 if mismatches or p95 >= 10 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Stress test chống overbooking: nhiều luồng cùng đặt một nhóm nhỏ phòng với khung giờ chồng nhau
+trên local backend (transaction optimistic như Firestore).
+
+Kiểm tra sau khi chạy:
+- Không phòng nào có 2 booking đang hoạt động trùng khoảng thời gian.
+- current_booking_id của mỗi phòng trỏ tới 1 booking đã được ghi.
+- Mọi lần thất bại đều là BookingConflictError / xung đột transaction (không có lỗi lạ).
+
+Usage:
+    python benchmarks/booking_stress.py --attempts 400 --rooms 5 --backend memory
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("REALTIME_MIRROR", "0")
+os.environ.setdefault("HOLD_SWEEPER", "0")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent booking stress test")
+    parser.add_argument("--attempts", type=int, default=400)
+    parser.add_argument("--rooms", type=int, default=5)
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = args.backend
+    if args.backend == "sqlite":
+        os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "stress.sqlite3")
+
+    from src import db
+    from src.availability import to_seconds
+    from src.models import Booking, BookingType, RoomStatus
+
+    client = db.get_db()
+    room_ids = [f"S{i:02d}" for i in range(args.rooms)]
+    client.store.bulk_load("rooms", [
+        (rid, {"id": rid, "room_type_code": "STD", "floor": "Khu A", "status": RoomStatus.AVAILABLE.value})
+        for rid in room_ids
+    ])
+
+    # Mỗi lần đặt: 1 phòng ngẫu nhiên, 1-3 đêm bắt đầu trong 10 ngày tới -> chồng lịch dày đặc.
+    # 1/4 số lần là nhận phòng ngay (walk-in) để tranh chấp cả trạng thái phòng.
+    rng = random.Random(args.seed)
+    base = datetime.now().replace(hour=14, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    plans = []
+    for i in range(args.attempts):
+        walk_in = rng.random() < 0.25
+        check_in = datetime.now() if walk_in else base + timedelta(days=rng.randrange(0, 10))
+        plans.append((walk_in, Booking(
+            room_id=rng.choice(room_ids),
+            customer_name=f"Khách {i}",
+            customer_phone=f"09{i:08d}",
+            booking_type=BookingType.DAILY,
+            check_in=check_in,
+            check_out_expected=check_in + timedelta(days=rng.randint(1, 3)),
+            price_original=500000,
+        )))
+
+    barrier = threading.Barrier(len(plans))
+    results = [None] * len(plans)
+
+    def worker(i, walk_in, booking):
+        barrier.wait()
+        results[i] = db.create_booking(booking, is_checkin_now=walk_in, session_id=f"s{i}")
+
+    threads = [threading.Thread(target=worker, args=(i, w, b)) for i, (w, b) in enumerate(plans)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    outcomes = Counter()
+    for (ok, result), (_, booking) in zip(results, plans):
+        if ok:
+            outcomes["booked"] += 1
+        elif result.startswith(f"Phòng {booking.room_id} "):
+            # BookingConflictError (index lịch trống hoặc kiểm tra lại trong transaction)
+            outcomes["conflict"] += 1
+        elif "changed during transaction" in result:
+            outcomes["retries exhausted"] += 1
+        else:
+            outcomes[f"other: {result}"] += 1
+
+    # Kiểm tra bất biến trên dữ liệu đã ghi
+    bookings = {}
+    for doc in client.collection("bookings").where("status", "in", db.ACTIVE_BOOKING_STATUSES).stream():
+        bookings[doc.id] = doc.to_dict()
+    overlaps = 0
+    for rid in room_ids:
+        spans = sorted(
+            (to_seconds(b["check_in"]), to_seconds(b["check_out_expected"]))
+            for b in bookings.values() if b["room_id"] == rid
+        )
+        overlaps += sum(1 for a, b in zip(spans, spans[1:]) if b[0] < a[1])
+    dangling = [
+        doc.id for doc in client.collection("rooms").stream()
+        if doc.to_dict().get("current_booking_id") not in bookings
+    ]
+
+    print(f"{len(plans)} concurrent attempts on {args.rooms} rooms ({args.backend}) in {elapsed:.2f}s")
+    for name, count in sorted(outcomes.items()):
+        print(f"  {name}: {count}")
+    print(f"Active bookings stored: {len(bookings)} | overlapping pairs: {overlaps} | "
+          f"rooms pointing to missing booking: {len(dangling)}")
+    failed = overlaps or dangling or any(name.startswith("other") for name in outcomes)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Đo lưới lịch phòng 90 ngày (get_inventory_grid) so với quét toàn bộ booking.
+
+Dataset: N phòng chia đều các khu vực, mỗi phòng có lịch ở nối tiếp trong `--days` ngày tới.
+Lịch tồn phòng được dựng bằng rebuild_inventory_calendar (giống backfill lần đầu), sau đó
+kiểm tra lưới đọc từ vài document khớp với cách tính trực tiếp từ bookings.
+
+Usage:
+    python benchmarks/inventory_bench.py --rooms 200 --areas 4 --days 120
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("REALTIME_MIRROR", "0")
+os.environ.setdefault("HOLD_SWEEPER", "0")
+
+from src import db, inventory  # noqa: E402
+from src.models import BookingStatus, BookingType, RoomStatus  # noqa: E402
+
+GRID_DAYS = 90
+
+
+def seed(client, rooms: int, areas: int, days: int, seed_value: int) -> int:
+    rng = random.Random(seed_value)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    room_docs, booking_docs = [], []
+    for i in range(rooms):
+        room_id = f"{100 + i}"
+        room_docs.append((room_id, {
+            "id": room_id, "room_type_code": "STD", "floor": f"Khu {chr(65 + i % areas)}",
+            "status": RoomStatus.AVAILABLE.value,
+        }))
+        t, k = now + timedelta(hours=rng.randrange(0, 48)), 0
+        while t < now + timedelta(days=days):
+            check_out = t + timedelta(days=rng.randint(1, 5))
+            booking_docs.append((f"B{i:04d}{k:03d}", {
+                "id": f"B{i:04d}{k:03d}", "room_id": room_id, "booking_type": BookingType.DAILY.value,
+                "status": BookingStatus.CONFIRMED.value, "check_in": t, "check_out_expected": check_out,
+            }))
+            t = check_out + timedelta(days=rng.choice([0, 1, 2, 4]), hours=2)
+            k += 1
+    client.store.bulk_load("rooms", room_docs)
+    client.store.bulk_load("bookings", booking_docs)
+    return len(booking_docs)
+
+
+def grid_from_bookings(start: date) -> dict:
+    """Cách cũ: quét mọi booking đang hoạt động, tô từng ngày."""
+    rows = {r["id"]: [inventory.FREE] * GRID_DAYS for r in db.get_all_rooms()}
+    for b in db._fetch_active_bookings_dict().values():
+        for d in inventory.stay_days(b["check_in"], b["check_out_expected"]):
+            i = (d - start).days
+            if 0 <= i < GRID_DAYS and rows[b["room_id"]][i] == inventory.FREE:
+                rows[b["room_id"]][i] = inventory.booking_code(b)
+    return {room_id: "".join(codes) for room_id, codes in rows.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inventory calendar grid")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--areas", type=int, default=4)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    client = db.get_db()
+    stays = seed(client, args.rooms, args.areas, args.days, args.seed)
+    ok, msg = db.rebuild_inventory_calendar(months=5)
+    print(f"Dataset: {args.rooms} rooms / {args.areas} areas, {stays:,} active stays | rebuild: {msg}")
+
+    start = date.today()
+    t0 = time.perf_counter()
+    expected = grid_from_bookings(start)
+    scan_ms = (time.perf_counter() - t0) * 1000
+
+    db._get_inventory_docs_cached.clear()
+    t0 = time.perf_counter()
+    grid = db.get_inventory_grid(start, GRID_DAYS)
+    grid_ms = (time.perf_counter() - t0) * 1000
+    reads = len(inventory.month_range(start, GRID_DAYS)) * args.areas
+
+    mismatches = sum(grid.row(room_id) != codes for room_id, codes in expected.items())
+    print(f"Scan all bookings: {stays:,} reads, {scan_ms:.1f} ms")
+    print(f"Inventory grid:    {reads} reads, {grid_ms:.1f} ms (first load) | "
+          f"{GRID_DAYS} days x {len(grid.codes)} rooms, {mismatches} mismatching rows")
+    sys.exit(1 if mismatches or not ok else 0)
+
+
+if __name__ == "__main__":
+    main()
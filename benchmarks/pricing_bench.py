@@ -0,0 +1,128 @@
+"""
+So sánh báo giá scalar (calculate_stay_price, vòng lặp Python) với PriceTable.quote
+(NumPy, 1 lần gọi cho cả đoàn).
+
+Kiểm tra kết quả khớp trên dữ liệu ngẫu nhiên (lễ / cuối tuần / lố bảng giá giờ + phụ thu / trần giá ngày / ở nhiều đêm vắt qua
+cuối tuần, Tết...) rồi đo thời gian.
+
+Usage:
+    python benchmarks/pricing_bench.py --rooms 1000 --cases 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.logic import calculate_stay_price  # noqa: E402
+from src.models import BookingType  # noqa: E402
+from src.pricing import PriceTable, quote_rate_plan  # noqa: E402
+
+
+def make_room_types(rng: random.Random, count: int = 12) -> list:
+    types = []
+    for i in range(count):
+        base = rng.randrange(3, 20) * 50000
+        blocks = {str(h): base // 3 * h for h in sorted(rng.sample(range(1, 9), rng.randint(0, 5)))}
+        types.append({
+            "type_code": f"T{i}",
+            "name": f"Loại {i}",
+            "pricing": {"hourly_blocks": blocks, "overnight_price": base, "daily_price": base * 1.5,
+                        "hourly_overflow_price": rng.choice([0, 20000, base // 10]),
+                        "hourly_daily_cap": rng.random() < 0.7},
+            "pricing_weekend": rng.choice([
+                None, {},
+                {"hourly_blocks": {k: v * 1.2 for k, v in blocks.items()}, "overnight_price": base * 1.2,
+                 "daily_price": base * 1.8},
+                {"hourly_blocks": blocks, "overnight_price": 0, "daily_price": 0},
+            ]),
+            "pricing_holiday": rng.choice([
+                None,
+                {"hourly_blocks": {k: v * 2 for k, v in blocks.items()}, "overnight_price": base * 2,
+                 "daily_price": base * 3},
+            ]),
+        })
+    return types
+
+
+def make_system_config(rng: random.Random) -> dict:
+    start = date(datetime.now().year, 1, 1)
+    holidays = sorted({(start + timedelta(days=rng.randrange(730))).isoformat() for _ in range(40)})
+    return {"holidays": holidays, "weekend_weekdays": [5, 6]}
+
+
+def scalar_quote(type_map, system_config, type_code, mode, check_in, check_out) -> float:
+    return calculate_stay_price(check_in, check_out, mode, type_map.get(type_code, {}), system_config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized pricing")
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    room_types = make_room_types(rng)
+    system_config = make_system_config(rng)
+    type_map = {t["type_code"]: t for t in room_types}
+    table = PriceTable(room_types, system_config)
+    modes = list(BookingType)
+
+    # 1. Kiểm tra tương đương trên dữ liệu ngẫu nhiên
+    codes, bmodes, cis, cos = [], [], [], []
+    base = datetime(datetime.now().year, 1, 1)
+    for _ in range(args.cases):
+        ci = base + timedelta(minutes=rng.randrange(730 * 24 * 60))
+        codes.append(rng.choice(list(type_map) + ["MISSING"]))
+        bmodes.append(rng.choice(modes))
+        cis.append(ci)
+        cos.append(ci + timedelta(minutes=rng.randrange(-30, 10 * 24 * 60)))
+    expected = np.array([scalar_quote(type_map, system_config, *c) for c in zip(codes, bmodes, cis, cos)])
+    got = table.quote(codes, bmodes, cis, cos)
+    # Theo ngày: cộng dồn bằng prefix sum -> cho phép sai số làm tròn float (< 0.01 đ)
+    mismatches = int(np.sum(np.abs(expected - got) > 0.01))
+    print(f"Equivalence: {args.cases:,} random cases, {mismatches} mismatches")
+
+    # 1b. Rate plan lưu trên booking: tính lại từ snapshot phải khớp báo giá lúc đặt
+    plan_mismatches, plan_bytes = 0, []
+    for code, mode, ci_, co_, price in zip(codes, bmodes, cis, cos, expected):
+        plan = table.rate_plan(code, mode, ci_, co_)
+        if plan is None:
+            continue
+        plan_bytes.append(len(json.dumps(plan).encode("utf-8")))
+        plan_mismatches += abs(quote_rate_plan(plan, ci_, co_) - price) > 0.01
+    print(f"Rate plan: {len(plan_bytes):,} snapshots, {plan_mismatches} mismatches, "
+          f"avg {sum(plan_bytes) / max(len(plan_bytes), 1):.0f} bytes")
+    mismatches += plan_mismatches
+
+    # 2. Báo giá đoàn: N phòng, cùng giờ vào / ra
+    room_codes = [rng.choice(list(type_map)) for _ in range(args.rooms)]
+    ci = datetime.now().replace(second=0, microsecond=0)
+    table.quote(room_codes, BookingType.HOURLY, ci, ci + timedelta(hours=1))  # warm-up
+    for mode, hours in ((BookingType.HOURLY, 5), (BookingType.OVERNIGHT, 12), (BookingType.DAILY, 72)):
+        co = ci + timedelta(hours=hours)
+        t0 = time.perf_counter()
+        loop = [scalar_quote(type_map, system_config, c, mode, ci, co) for c in room_codes]
+        t_loop = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        vec = table.quote(room_codes, mode, ci, co)
+        t_vec = (time.perf_counter() - t0) * 1000
+        same = np.allclose(np.array(loop), vec, rtol=0, atol=0.01)
+        print(f"{mode.value:10} {args.rooms} rooms: loop {t_loop:7.2f} ms | vectorized {t_vec:6.2f} ms | "
+              f"match={same}")
+
+    t0 = time.perf_counter()
+    PriceTable(room_types, system_config)
+    print(f"Compile price table: {(time.perf_counter() - t0) * 1000:.2f} ms")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+So sánh dung lượng / thời gian đọc của các danh sách booking: cả document vs projection (select()).
+
+Dataset: booking online có ảnh chụp thanh toán base64 cũ (~200KB / booking) + booking đã hoàn tất.
+
+Usage:
+    python benchmarks/projection_bench.py --online 200 --completed 5000 --screenshot-kb 200
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("REALTIME_MIRROR", "0")
+os.environ.setdefault("HOLD_SWEEPER", "0")
+
+from src import db  # noqa: E402
+
+
+def seed(client, online: int, completed: int, screenshot_kb: int, seed_value: int):
+    rng = random.Random(seed_value)
+    now = datetime.now().replace(microsecond=0)
+    screenshot = base64.b64encode(rng.randbytes(screenshot_kb * 1024)).decode("ascii")
+    docs = []
+    for i in range(online):
+        docs.append((f"ON{i:06d}", {
+            "id": f"ON{i:06d}",
+            "room_id": f"{100 + i % 50}",
+            "customer_name": f"Khách online {i}",
+            "customer_phone": f"09{rng.randrange(10**8):08d}",
+            "booking_type": "Theo ngày",
+            "status": "Đã đặt",
+            "check_in": now + timedelta(days=i % 30),
+            "check_out_expected": now + timedelta(days=i % 30 + 1),
+            "is_online": True,
+            "online_payment_type": "deposit",
+            "online_payment_status": ["pending", "waiting_confirm", "confirmed"][i % 3],
+            "payment_screenshot_b64": screenshot,
+            "payment_screenshot_name": "chuyen_khoan.png",
+            "payment_screenshot_mime": "image/png",
+            "note": "x" * 200,
+        }))
+    for i in range(completed):
+        check_out = now - timedelta(hours=rng.randrange(24 * 30))
+        amount = float(rng.randrange(150, 3000) * 1000)
+        docs.append((f"BK{i:07d}", {
+            "id": f"BK{i:07d}",
+            "room_id": f"{100 + i % 50}",
+            "customer_name": f"Khách {i}",
+            "customer_phone": f"09{rng.randrange(10**8):08d}",
+            "booking_type": "Theo giờ",
+            "status": "Hoàn tất",
+            "check_in": check_out - timedelta(hours=3),
+            "check_out_expected": check_out,
+            "check_out_actual": check_out,
+            "total_amount": amount,
+            "price_original": amount,
+            "service_fee": 0.0,
+            "payment_method": "Tiền mặt",
+            "service_items": [{"name": f"Dịch vụ {k}", "qty": 1, "total": 20000.0} for k in range(20)],
+            "note": "y" * 500,
+        }))
+    client.store.bulk_load("bookings", docs)
+
+
+def measure(fn, repeat: int):
+    result, elapsed = None, []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed.append((time.perf_counter() - t0) * 1000)
+    size = len(json.dumps(result, default=str).encode("utf-8"))
+    return size, min(elapsed), len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark field projection for booking list queries")
+    parser.add_argument("--online", type=int, default=200)
+    parser.add_argument("--completed", type=int, default=5000)
+    parser.add_argument("--screenshot-kb", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    client = db.get_db()
+    seed(client, args.online, args.completed, args.screenshot_kb, args.seed)
+    month_ago = datetime.now() - timedelta(days=31)
+
+    cases = [
+        ("Dashboard: chờ xác nhận",
+         lambda f: db.get_pending_online_bookings(fields=f), db.ONLINE_BOOKING_LIST_FIELDS),
+        ("Dashboard: đã xác nhận",
+         lambda f: db.get_confirmed_online_bookings(limit=20, fields=f), db.ONLINE_BOOKING_LIST_FIELDS),
+        ("Finance: hoàn tất 30 ngày",
+         lambda f: db.get_completed_bookings(start_dt=month_ago, fields=f), db.FINANCE_BOOKING_FIELDS),
+        ("Rollup doanh thu",
+         lambda f: db.get_completed_bookings(start_dt=month_ago, fields=f), db.REVENUE_BOOKING_FIELDS),
+    ]
+
+    print(f"{'Trang / truy vấn':28} {'docs':>6} {'full KB':>10} {'proj KB':>10} {'saved':>7} "
+          f"{'full ms':>9} {'proj ms':>9}")
+    for name, fn, fields in cases:
+        full_size, full_ms, count = measure(lambda: fn(None), args.repeat)
+        proj_size, proj_ms, _ = measure(lambda: fn(fields), args.repeat)
+        saved = 1 - proj_size / full_size if full_size else 0.0
+        print(f"{name:28} {count:>6} {full_size / 1024:>10.1f} {proj_size / 1024:>10.1f} "
+              f"{saved:>6.0%} {full_ms:>9.1f} {proj_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Tạo dataset tổng hợp cho backend cục bộ (SQLite) để benchmark / load test trên laptop.
+
+Usage:
+    python benchmarks/seed_local_db.py --rooms 500 --bookings 1000000 --path config/local.db
+
+Sau đó chạy app với:
+    STORAGE_BACKEND=sqlite LOCAL_DB_PATH=config/local.db streamlit run main.py
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models import BookingStatus, BookingType, RoomStatus
+from src.storage import create_local_client
+
+ROOM_TYPES = [
+    {"type_code": "STD", "name": "Standard", "default_adults": 2, "default_children": 0,
+     "pricing": {"hourly_blocks": {"1": 150000, "2": 250000}, "overnight_price": 400000,
+                 "daily_price": 600000, "enable_hourly": True, "enable_overnight": True, "enable_daily": True}},
+    {"type_code": "DLX", "name": "Deluxe", "default_adults": 2, "default_children": 1,
+     "pricing": {"hourly_blocks": {"1": 250000, "2": 400000}, "overnight_price": 700000,
+                 "daily_price": 1000000, "enable_hourly": True, "enable_overnight": True, "enable_daily": True}},
+    {"type_code": "VIL", "name": "Villa", "default_adults": 4, "default_children": 2,
+     "pricing": {"hourly_blocks": {}, "overnight_price": 1500000,
+                 "daily_price": 2500000, "enable_hourly": False, "enable_overnight": True, "enable_daily": True}},
+]
+AREAS = ["Khu A", "Khu B", "Khu C", "Khu D", "Khu E"]
+PAYMENT_METHODS = ["Tiền mặt", "Chuyển khoản", "Thẻ"]
+
+
+def make_rooms(count: int) -> list:
+    rooms = []
+    for i in range(count):
+        area = AREAS[i % len(AREAS)]
+        room_id = f"{100 * (i % len(AREAS) + 1) + i // len(AREAS) + 1}"
+        rooms.append({
+            "id": room_id,
+            "room_type_code": ROOM_TYPES[i % len(ROOM_TYPES)]["type_code"],
+            "floor": area,
+            "status": RoomStatus.AVAILABLE.value,
+            "note": "",
+            "current_booking_id": None,
+        })
+    return rooms
+
+
+def make_bookings(rooms: list, count: int, active_ratio: float, seed: int):
+    """Sinh booking lịch sử (Hoàn tất / Hủy) trải đều 3 năm + một phần nhỏ đang hoạt động."""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=3 * 365)
+    span = int((now - start).total_seconds())
+
+    for i in range(count):
+        room = rooms[i % len(rooms)]
+        booking_type = rng.choice(list(BookingType))
+        check_in = start + timedelta(seconds=rng.randrange(span))
+        hours = rng.randint(1, 4) if booking_type == BookingType.HOURLY else 24 * rng.randint(1, 3)
+        check_out = check_in + timedelta(hours=hours)
+        amount = float(rng.randrange(150, 3000) * 1000)
+
+        if i < count * active_ratio:
+            status = BookingStatus.CONFIRMED
+        else:
+            status = BookingStatus.CANCELLED if rng.random() < 0.05 else BookingStatus.COMPLETED
+        completed = status == BookingStatus.COMPLETED
+
+        yield f"BK{i:08d}", {
+            "id": f"BK{i:08d}",
+            "room_id": room["id"],
+            "customer_name": f"Khách {i}",
+            "customer_phone": f"09{rng.randrange(10**8):08d}",
+            "customer_type": "Khách lẻ",
+            "booking_type": booking_type.value,
+            "status": status.value,
+            "check_in": check_in,
+            "check_out_expected": check_out,
+            "price_original": amount,
+            "deposit": 0.0,
+            "note": "",
+            "check_out_actual": check_out if completed else None,
+            "total_amount": amount if completed else 0.0,
+            "service_fee": 0.0,
+            "payment_method": rng.choice(PAYMENT_METHODS) if completed else "",
+            "is_online": rng.random() < 0.2,
+        }
+
+
+def _chunks(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic dataset into a local storage backend")
+    parser.add_argument("--path", default="config/local.db")
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--bookings", type=int, default=1_000_000)
+    parser.add_argument("--active-ratio", type=float, default=0.0002)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        print(f"⚠️ {args.path} already exists, remove it first to reseed.")
+        sys.exit(1)
+
+    client = create_local_client("sqlite", args.path)
+    store = client.store
+    t0 = time.perf_counter()
+
+    store.bulk_load("config_room_types", [(t["type_code"], t) for t in ROOM_TYPES])
+    rooms = make_rooms(args.rooms)
+    store.bulk_load("rooms", [(r["id"], r) for r in rooms])
+
+    written = 0
+    for chunk in _chunks(make_bookings(rooms, args.bookings, args.active_ratio, args.seed), 20_000):
+        store.bulk_load("bookings", chunk)
+        written += len(chunk)
+        print(f"  bookings: {written:,}/{args.bookings:,}", end="\r")
+
+    client.close()
+    print(f"\n✅ Seeded {args.rooms} rooms, {written:,} bookings into {args.path} "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
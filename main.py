@@ -1,7 +1,7 @@
 import streamlit as st
 from datetime import date, datetime
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu
-from src.db import get_all_rooms, get_all_bookings, get_bookings_for_today
+from src.db import get_all_rooms, get_bookings_for_today
 from src.models import RoomStatus, BookingStatus
 from src.config import AppConfig
 
@@ -30,7 +30,8 @@ rooms = get_all_rooms()
 total_rooms = len(rooms)
 available_rooms = len([r for r in rooms if r.get("status") == RoomStatus.AVAILABLE])
 
-bookings = get_all_bookings()
+# Chỉ lấy booking có check-in hôm nay (projection), không quét toàn bộ bookings
+today_bookings = get_bookings_for_today()
 today = date.today()
 
 # Xác định các booking "đặt trước hôm nay" (chưa nhận phòng)
@@ -44,7 +45,7 @@ except Exception:
     pass
 
 today_reserved = []
-for b in bookings:
+for b in today_bookings:
     status = b.get("status")
     if hasattr(status, "value"):
         status = status.value
@@ -78,8 +79,7 @@ with col3:
 st.markdown("---")
 st.markdown("##### 📅 Khách đặt phòng hôm nay")
 
-# Fetch optimized data
-today_bookings = get_bookings_for_today()
+# Dùng lại today_bookings đã fetch ở trên
 today_reserved = []
 
 # Filter logic can be simpler now, or trust the query.
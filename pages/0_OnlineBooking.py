@@ -1,4 +1,3 @@
-import base64
 from datetime import datetime, timedelta, date, time as dtime
 import os
 import sys
@@ -16,19 +15,23 @@ from src.db import (
     get_all_rooms,
     get_all_room_types,
     create_booking,
+    check_room_availability,
+    search_available_rooms,
     update_online_payment_proof,
     update_online_payment_proof,
     get_payment_config,
     get_booking_by_id,
-    get_system_config,
-    hold_room,         # New
-    release_room_hold, # New
+    get_price_table,
+    get_quote,
+    get_hold_leases,
+    begin_db_run,
 )
-from src.models import Booking, BookingType, RoomStatus
+from src.metrics import current_session_and_page
+from src.models import Booking, BookingType
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu
-from src.logic import calculate_estimated_price, get_applicable_price_config # Import hàm logic mới
 
 st.set_page_config(page_title="Đặt phòng Online", layout="wide")
+begin_db_run()  # Trang public không qua require_login
 apply_sidebar_style()
 #create_custom_sidebar_menu()
 
@@ -47,29 +50,16 @@ st.markdown("### 1️⃣ Thông tin đặt phòng")
 
 rooms = get_all_rooms()
 room_types = get_all_room_types()
-# Lấy cấu hình hệ thống
-try:
-    system_config = get_system_config("special_days")
-except:
-    system_config = {}
+# Bảng giá biên dịch sẵn (loại phòng + ngày lễ/cuối tuần)
+price_table = get_price_table()
 
 type_map = {t["type_code"]: t for t in room_types}
 
-# Filter available rooms AND rooms held by THIS session
 session_id = st.session_state["user_session_id"]
-available_rooms = []
-for r in rooms:
-    status = r.get("status")
-    # Phòng OK nếu AVAILABLE
-    if status == RoomStatus.AVAILABLE:
-        available_rooms.append(r)
-    # HOẶC nếu đang TEMP_LOCKED bởi chính mình
-    elif status == RoomStatus.TEMP_LOCKED and r.get("locked_by") == session_id:
-        available_rooms.append(r)
-
-available_room_ids = [r["id"] for r in available_rooms]
-
-if not available_rooms:
+# Lease giữ phòng của session: rerun không gọi lại DB, heartbeat gia hạn khi sắp hết hạn
+leases = get_hold_leases(session_id)
+
+if not rooms:
     st.warning("Hiện tại chưa có phòng trống để đặt online. Vui lòng liên hệ lễ tân.")
     st.stop()
 
@@ -92,50 +82,6 @@ with col_room:
         format_func=lambda x: type_options[x],
     )
 
-    # Lọc phòng trống theo loại đã chọn
-    filtered_rooms = [
-        r for r in available_rooms if r["room_type_code"] == selected_type_code
-    ]
-    filtered_room_ids = [r["id"] for r in filtered_rooms]
-
-    if not filtered_rooms:
-        st.warning("Loại phòng này hiện đã hết. Vui lòng chọn loại khác.")
-
-    # Logic chọn phòng & Giữ chỗ (Hold)
-    def on_room_change():
-        # Release old room if exists
-        old_room = st.session_state.get("last_held_room")
-        if old_room:
-             release_room_hold(old_room, session_id)
-        
-        # Hold new room
-        new_room = st.session_state.get("selected_room_id_key")
-        if new_room:
-             success, msg = hold_room(new_room, session_id, duration_minutes=5)
-             if success:
-                 st.session_state["last_held_room"] = new_room
-                 st.toast(f"Đang giữ phòng {new_room} trong 5 phút", icon="⏳")
-             else:
-                 st.error(f"Không thể giữ phòng: {msg}")
-                 # Force reload to update list
-                 
-    selected_room_id = st.selectbox(
-        "Chọn phòng (nếu muốn chọn cụ thể)",
-        options=filtered_room_ids or available_room_ids,
-        key="selected_room_id_key",
-        on_change=on_room_change
-    )
-    
-    # Trigger hold on first load / default selection
-    if selected_room_id and st.session_state.get("last_held_room") != selected_room_id:
-         # Initial hold for default selection
-         success, msg = hold_room(selected_room_id, session_id, duration_minutes=5)
-         if success:
-             st.session_state["last_held_room"] = selected_room_id
-         else:
-             # Should warn user but it's tricky inside render loop
-             pass
-
 def _generate_time_slots(selected_date: date) -> list[dtime]:
     """Sinh danh sách mốc giờ theo bước 15 phút.
 
@@ -233,20 +179,65 @@ with col_time:
         )
         check_out_time = datetime.combine(out_date, out_time)
 
+with col_room:
+    # Phòng trống theo đúng thời gian lưu trú đã chọn (index lịch trống), mọi loại phòng cho phép hình thức thuê
+    if check_out_time <= check_in_time:
+        st.warning("Giờ trả phải lớn hơn Giờ đến.")
+        st.stop()
+    search = search_available_rooms(check_in_time, check_out_time, booking_mode, session_id=session_id)
+    available_room_ids = [r["id"] for r in search["rooms"]]
+    filtered_room_ids = [r["id"] for r in search["rooms"] if r["room_type_code"] == selected_type_code]
+
+    if not available_room_ids:
+        st.warning("Thời gian đã chọn hiện đã hết phòng. Vui lòng chọn thời gian khác hoặc liên hệ lễ tân.")
+        st.stop()
+    if not filtered_room_ids:
+        st.warning("Loại phòng này đã hết trong thời gian đã chọn. Vui lòng chọn loại khác.")
+    else:
+        st.caption(f"Còn {search['counts'].get(selected_type_code, 0)} phòng trống")
+
+    selected_room_id = st.selectbox(
+        "Chọn phòng (nếu muốn chọn cụ thể)",
+        options=filtered_room_ids or available_room_ids,
+        key="selected_room_id_key",
+    )
+
+    # Giữ chỗ (Hold): chỉ giữ đúng phòng đang chọn (đổi phòng -> nhả phòng cũ); phòng đã giữ còn hạn
+    # thì không gọi DB. Đã tạo booking thì không giữ thêm.
+    if selected_room_id and not st.session_state.get("online_booking_id"):
+        ok, result = leases.sync([selected_room_id], page=current_session_and_page()[1])
+        if not ok:
+            st.error(f"Không thể giữ phòng: {result.get(selected_room_id, '')}")
+
+    @st.fragment(run_every=30)
+    def _hold_heartbeat():
+        # Chạy lại mỗi 30s trên trình duyệt: gia hạn lease khi sắp hết (khách điền form / chuyển khoản lâu)
+        lost = leases.heartbeat()
+        expires = leases.held().get(selected_room_id)
+        if expires:
+            st.caption(f"⏳ Đang giữ phòng {selected_room_id} đến {expires.strftime('%H:%M')}")
+        elif selected_room_id in lost:
+            st.warning("Đã hết thời gian giữ phòng. Chọn lại phòng để giữ tiếp.")
+
+    if selected_room_id and not st.session_state.get("online_booking_id"):
+        _hold_heartbeat()
+
 # --- TÍNH TIỀN DỰ KIẾN & CHỌN HÌNH THỨC THANH TOÁN ---
 st.markdown("### 2️⃣ Thanh toán")
 
 # Logic chọn giá (Regular / Weekend / Holiday)
-t_info = type_map.get(selected_type_code, {})
-effective_pricing = get_applicable_price_config(check_in_time.date(), t_info, system_config)
+special_nights = price_table.special_nights(selected_type_code, booking_mode, check_in_time, check_out_time)
 
-estimated_price = calculate_estimated_price(
-    check_in_time, check_out_time, booking_mode, effective_pricing
+estimated_price = get_quote(
+    selected_type_code, booking_mode, check_in_time, check_out_time
 )
 
 # Debug info
-if effective_pricing != t_info.get('pricing', {}):
-    st.info("💡 Đang áp dụng giá đặc biệt (Lễ/Tết hoặc Cuối tuần)")
+if special_nights:
+    if booking_mode == BookingType.DAILY:
+        st.info(f"💡 Đang áp dụng giá đặc biệt (Lễ/Tết hoặc Cuối tuần) cho {special_nights} đêm")
+    else:
+        st.info("💡 Đang áp dụng giá đặc biệt (Lễ/Tết hoặc Cuối tuần)")
 
 col_pay_left, col_pay_right = st.columns([1, 1])
 
@@ -288,10 +279,18 @@ btn_book = st.button(
 )
 
 if btn_book:
+    room_conflict = (
+        check_room_availability([selected_room_id], check_in_time, check_out_time, session_id=session_id)
+        .get(selected_room_id)
+        if selected_room_id and check_out_time > check_in_time
+        else None
+    )
     if not c_name or not c_phone:
         st.error("Vui lòng nhập đầy đủ Họ tên và Số điện thoại.")
     elif check_out_time <= check_in_time:
         st.error("Giờ trả phải lớn hơn Giờ đến.")
+    elif room_conflict:
+        st.error(f"Phòng {selected_room_id} {room_conflict}. Vui lòng chọn phòng hoặc thời gian khác.")
     else:
         new_bk = Booking(
             room_id=selected_room_id,
@@ -302,6 +301,7 @@ if btn_book:
             check_in=check_in_time,
             check_out_expected=check_out_time,
             price_original=estimated_price,
+            rate_plan=price_table.rate_plan(selected_type_code, booking_mode, check_in_time, check_out_time),
             deposit=float(deposit),
             note=c_note,
             is_online=True,
@@ -309,12 +309,13 @@ if btn_book:
             online_payment_status="pending",
         )
 
-        ok, result = create_booking(new_bk, is_checkin_now=False)
+        ok, result = create_booking(new_bk, is_checkin_now=False, session_id=session_id)
         if ok:
             st.success(
                 "Đã tạo yêu cầu đặt phòng! Vui lòng quét mã QR bên dưới và tải lên hình chụp thanh toán."
             )
             st.session_state["online_booking_id"] = result
+            leases.forget([new_bk.room_id])  # Hold đã chuyển thành booking
         else:
             st.error(f"Lỗi hệ thống khi tạo booking: {result}")
 
@@ -362,7 +363,6 @@ if booking_id:
 
         if uploaded is not None:
             img_bytes = uploaded.read()
-            img_b64 = base64.b64encode(img_bytes).decode("utf-8")
 
             if st.button(
                 "📤 Gửi hình chụp thanh toán cho lễ tân",
@@ -372,7 +372,7 @@ if booking_id:
                 try:
                     update_online_payment_proof(
                         booking_id,
-                        img_b64,
+                        img_bytes,
                         uploaded.name,
                         uploaded.type,
                     )
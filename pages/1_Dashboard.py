@@ -8,11 +8,18 @@ from src.db import (
     get_confirmed_online_bookings,
     confirm_online_booking,
     get_active_bookings_dict,
-    get_system_update_counter,
+    get_payment_screenshot,
+    get_payment_screenshot_thumbnail,
+    get_inventory_grid,
+    rebuild_inventory_calendar,
+    extend_booking,
 )
 from src.models import RoomStatus, Permission
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu, require_login, require_permission
 from src.config import AppConfig
+from src.inventory import FREE, RESERVED, PENDING, OCCUPIED, CODE_LABELS
+from datetime import date, datetime, time, timedelta
+import pandas as pd
 
 st.set_page_config(page_title="Sơ đồ phòng", layout="wide")
 
@@ -24,46 +31,10 @@ create_custom_sidebar_menu()
 
 st.title(f"🏨 Sơ đồ phòng - {AppConfig.RESORT_NAME}")
 
-# --- SMART POLLING (Counter-based) --- TẠM TẮT ---
-# # Init session state
-# if "sp_counter" not in st.session_state:
-#     st.session_state["sp_counter"] = -1  # Force first fetch
-# if "sp_rooms" not in st.session_state:
-#     st.session_state["sp_rooms"] = None
-# if "sp_bookings" not in st.session_state:
-#     st.session_state["sp_bookings"] = None
-#
-# st.sidebar.markdown("### ⏱ Cài đặt")
-# enable_polling = st.sidebar.toggle("Tự động cập nhật (Real-time)", value=True, help="Tự động kiểm tra thay đổi mỗi 5 giây. Chi phí: ~1 read/5s (rất rẻ).")
-#
-# if enable_polling:
-#     try:
-#         from streamlit_autorefresh import st_autorefresh
-#         st_autorefresh(interval=5000, key="dashboard_autorefresh")
-#     except ImportError:
-#         st.sidebar.error("⚠️ Cần cài: pip install streamlit-autorefresh")
-#
-# # Force Reload Button
-# if st.sidebar.button("🔄 Tải lại ngay", use_container_width=True):
-#     st.session_state["sp_counter"] = -1  # Force re-fetch
-#     st.rerun()
-#
-# # --- CHECK COUNTER (1 read) ---
-# server_counter = get_system_update_counter()
-# local_counter = st.session_state["sp_counter"]
-#
-# if server_counter != local_counter or st.session_state["sp_rooms"] is None:
-#     rooms = get_all_rooms()
-#     active_bookings_map = get_active_bookings_dict()
-#     st.session_state["sp_rooms"] = rooms
-#     st.session_state["sp_bookings"] = active_bookings_map
-#     st.session_state["sp_counter"] = server_counter
-# else:
-#     rooms = st.session_state["sp_rooms"]
-#     active_bookings_map = st.session_state["sp_bookings"]
-# --- END TẠM TẮT ---
-
-# Luôn fetch dữ liệu mới khi tải trang
+# --- REALTIME ---
+# rooms / bookings / loại phòng được đồng bộ bởi listener nền (src/realtime.py),
+# nên mỗi lần rerun đọc thẳng từ bộ nhớ. Nếu listener chưa sẵn sàng sẽ dùng snapshot chung.
+
 rooms = get_all_rooms()
 active_bookings_map = get_active_bookings_dict()
 
@@ -106,23 +77,22 @@ with col_pending:
                 if check_out:
                     st.write(f"- Check-out dự kiến: {check_out.strftime('%d/%m/%Y %H:%M')}")
 
-                # Hiển thị thumbnail hình chụp thanh toán (nếu có)
-                img_b64 = b.get("payment_screenshot_b64")
-                if img_b64:
-                    import base64
-
+                # Hiển thị thumbnail hình chụp thanh toán (nếu có); ảnh gốc chỉ tải khi bấm xem
+                if b.get("payment_screenshot_ref") or b.get("payment_screenshot_name"):
                     st.write("Hình chụp thanh toán (thu nhỏ):")
-                    st.image(
-                        base64.b64decode(img_b64),
-                        caption=b.get("payment_screenshot_name", ""),
-                        width=260,
-                    )
-                    with st.expander("🔍 Xem ảnh kích thước lớn"):
-                        st.image(
-                            base64.b64decode(img_b64),
-                            caption=b.get("payment_screenshot_name", ""),
-                            use_column_width=True,
-                        )
+                    thumb = get_payment_screenshot_thumbnail(b)
+                    if thumb:
+                        st.image(thumb, caption=b.get("payment_screenshot_name", ""), width=260)
+                    if st.toggle("🔍 Xem ảnh kích thước lớn", key=f"show_proof_{booking_id}") or not thumb:
+                        full_img = get_payment_screenshot(b)
+                        if full_img:
+                            st.image(
+                                full_img,
+                                caption=b.get("payment_screenshot_name", ""),
+                                use_column_width=True,
+                            )
+                        else:
+                            st.caption("⚠️ Không tải được ảnh thanh toán.")
 
                 # Nút xác nhận đã nhận tiền
                 if status_raw != "confirmed" and booking_id:
@@ -174,21 +144,18 @@ with col_history:
                         f"Check-in dự kiến: {check_in.strftime('%d/%m/%Y %H:%M')}"
                     )
 
-                img_b64 = b.get("payment_screenshot_b64")
-                if img_b64:
-                    import base64
-
-                    st.image(
-                        base64.b64decode(img_b64),
-                        caption="Ảnh thanh toán (thu nhỏ)",
-                        width=220,
-                    )
-                    with st.expander("🔍 Xem ảnh chi tiết", expanded=False):
-                        st.image(
-                            base64.b64decode(img_b64),
-                            caption=b.get("payment_screenshot_name", ""),
-                            use_column_width=True,
-                        )
+                if b.get("payment_screenshot_ref") or b.get("payment_screenshot_name"):
+                    thumb = get_payment_screenshot_thumbnail(b)
+                    if thumb:
+                        st.image(thumb, caption="Ảnh thanh toán (thu nhỏ)", width=220)
+                    if st.toggle("🔍 Xem ảnh chi tiết", key=f"show_proof_hist_{b.get('id', room_id)}") or not thumb:
+                        full_img = get_payment_screenshot(b)
+                        if full_img:
+                            st.image(
+                                full_img,
+                                caption=b.get("payment_screenshot_name", ""),
+                                use_column_width=True,
+                            )
 
                 st.markdown("---")
 
@@ -270,6 +237,43 @@ with col_stats:
                     f"- Phòng **{r['id']}** – {bk.get('customer_name','')} ({bk.get('customer_phone','')})"
                 )
 
+# --- 2b. LỊCH PHÒNG 90 NGÀY (từ lịch tồn phòng: vài document / khu vực / tháng) ---
+with st.expander("📅 Lịch phòng 90 ngày tới", expanded=False):
+    grid = get_inventory_grid(date.today(), 90)
+    grid_rooms = sorted(
+        r["id"] for r in rooms if not filter_floor or str(r.get("floor", "")) in filter_floor
+    )
+    if not grid_rooms:
+        st.caption("Không có phòng phù hợp với bộ lọc.")
+    else:
+        occupancy = grid.occupancy()
+        st.caption(
+            f"Công suất dự kiến: 7 ngày tới {sum(occupancy[:7]) / 7:.0%} · 30 ngày tới {sum(occupancy[:30]) / 30:.0%} | "
+            + " · ".join(f"{code} = {label}" for code, label in CODE_LABELS.items())
+        )
+        grid_df = pd.DataFrame(
+            [list(grid.row(rid)) for rid in grid_rooms],
+            index=grid_rooms,
+            columns=[d.strftime("%d/%m") for d in grid.dates],
+        )
+        cell_colors = {
+            FREE: "",
+            RESERVED: "background-color: #ffe0b2",
+            PENDING: "background-color: #dbeafe",
+            OCCUPIED: "background-color: #ffcdd2",
+        }
+        st.dataframe(grid_df.style.map(lambda v: cell_colors.get(v, "")), use_container_width=True)
+
+    from src.ui import has_permission
+    if has_permission(Permission.MANAGE_SYSTEM_CONFIG):
+        if st.button("🔄 Dựng lại lịch phòng từ booking", key="rebuild_inventory"):
+            ok, msg = rebuild_inventory_calendar()
+            if ok:
+                st.success(msg)
+                st.rerun()
+            else:
+                st.error(msg)
+
 # --- 3. VẼ SƠ ĐỒ PHÒNG (GRID) ---
 if rooms:
     # ... (CSS styles) ...
@@ -348,6 +352,31 @@ if rooms:
                                     st.write(f"**{booking_info.get('customer_name', '')}**")
                                     st.write(f"Check-in: {booking_info.get('check_in').strftime('%d/%m %H:%M') if booking_info.get('check_in') else ''}")
                             
+                                from src.ui import has_permission
+                                if has_permission(Permission.UPDATE_BOOKING):
+                                    current_out = booking_info.get("check_out_expected")
+                                    if current_out is not None and current_out.tzinfo:
+                                        current_out = current_out.replace(tzinfo=None)
+                                    new_out_date = st.date_input(
+                                        "Gia hạn tới ngày",
+                                        value=(current_out.date() if current_out else date.today()) + timedelta(days=1),
+                                        min_value=date.today(),
+                                        format="DD/MM/YYYY",
+                                        key=f"extend_date_{room['id']}",
+                                    )
+                                    if st.button("⏩ Gia hạn", key=f"extend_{room['id']}", use_container_width=True):
+                                        out_time = current_out.time() if current_out else time(12, 0)
+                                        ok, msg = extend_booking(
+                                            booking_id,
+                                            datetime.combine(new_out_date, out_time),
+                                            session_id=st.session_state.get("user_session_id"),
+                                        )
+                                        if ok:
+                                            st.success(msg)
+                                            st.rerun()
+                                        else:
+                                            st.error(msg)
+
                             c_yes, c_no = st.columns(2)
                             if c_yes.button("Trả phòng", key=f"co_yes_{room['id']}", type="primary", use_container_width=True):
                                 st.session_state["prefill_checkout_room_id"] = room["id"]
@@ -1,9 +1,9 @@
 import streamlit as st
 from datetime import datetime, timedelta
-from src.db import get_all_rooms, get_all_room_types, create_booking, get_db, find_customer_by_phone, hold_room, release_room_hold # New
-from src.models import Booking, BookingType, RoomStatus, BookingStatus, Permission
-from src.logic import calculate_estimated_price
+from src.db import get_all_rooms, get_all_room_types, create_bookings, get_db, find_customer_by_phone, search_customers_by_phone, get_hold_leases, get_price_table, get_quotes, check_room_availability, search_available_rooms
+from src.models import Booking, BookingType, BookingStatus, Permission
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu, require_login, require_permission, has_permission
+from src.metrics import current_session_and_page
 
 st.set_page_config(page_title="Đặt phòng", layout="wide")
 
@@ -23,17 +23,8 @@ if "user_session_id" not in st.session_state:
 if "booking_success_data" not in st.session_state:
     st.session_state["booking_success_data"] = None
 
-# Lấy cấu hình hệ thống (cho giá đặc biệt)
-try:
-    from src.db import get_system_config
-    system_config = get_system_config("special_days")
-except Exception as e:
-    # st.error(f"Lỗi tải config: {e}") # Có thể uncomment để debug
-    print(f"Error loading system config: {e}")
-    system_config = {}
-
-# Import hàm mới
-from src.logic import get_applicable_price_config
+# Bảng giá biên dịch sẵn (loại phòng + ngày lễ/cuối tuần), báo giá cả đoàn trong 1 lần gọi
+price_table = get_price_table()
 
 # Hàm reset để quay lại màn hình đặt phòng
 def reset_page():
@@ -53,6 +44,11 @@ def check_customer_phone():
              # if info.get("customer_type"):
              #    st.session_state["c_type"] = info["customer_type"]
              st.toast(f"Đã tìm thấy khách cũ: {info['customer_name']}", icon="👤")
+        else:
+            # Gợi ý khách có SĐT bắt đầu bằng số vừa nhập
+            suggestions = search_customers_by_phone(phone, limit=3)
+            if suggestions:
+                st.toast("Gợi ý: " + ", ".join(f"{c['phone']} ({c.get('customer_name', '')})" for c in suggestions), icon="🔎")
 
 # === MÀN HÌNH 1: KẾT QUẢ THÀNH CÔNG (HIỆN BILL) ===
 if st.session_state["booking_success_data"]:
@@ -106,21 +102,8 @@ try:
     room_types = get_all_room_types()
     type_map = {t['type_code']: t for t in room_types}
 
-    # Lọc phòng trống
-    # Lọc phòng trống HOẶC phòng đang giữ bởi session này
-    available_rooms = []
+    rooms_by_id = {r['id']: r for r in rooms}
     current_session_id = st.session_state.get("user_session_id")
-    
-    for r in rooms:
-        status = r.get('status')
-        # Case 1: Available
-        if status == RoomStatus.AVAILABLE or str(status) == "AVAILABLE" or status == "available":
-            available_rooms.append(r)
-        # Case 2: Held by ME
-        elif status == RoomStatus.TEMP_LOCKED and r.get("locked_by") == current_session_id:
-             available_rooms.append(r)
-
-    available_room_ids = [r['id'] for r in available_rooms]
 
 except Exception as e:
     st.error(f"Lỗi tải dữ liệu: {e}")
@@ -132,8 +115,8 @@ def update_out_date():
     if in_d:
         st.session_state["out_date"] = in_d + timedelta(days=1)
 
-if not available_rooms:
-    st.warning("⚠️ Hết phòng trống!")
+if not rooms:
+    st.warning("⚠️ Chưa có phòng nào!")
     if st.button("Tải lại"): st.rerun()
     st.stop()
 
@@ -242,27 +225,29 @@ with st.container(border=True):
         st.caption("2. Chọn phòng")
         prefill_room_id = st.session_state.pop("prefill_room_id", None)
 
-        # Filter rooms based on booking mode
-        compatible_room_ids = []
-        for r in available_rooms:
-            t = type_map.get(r['room_type_code'], {})
-            p = t.get('pricing', {})
-            
-            is_compat = False
-            if booking_mode == BookingType.HOURLY and p.get('enable_hourly', True): is_compat = True
-            elif booking_mode == BookingType.OVERNIGHT and p.get('enable_overnight', True): is_compat = True
-            elif booking_mode == BookingType.DAILY and p.get('enable_daily', True): is_compat = True
-            
-            if is_compat:
-                compatible_room_ids.append(r['id'])
+        # Phòng trống theo đúng giờ vào / ra + hình thức thuê (index lịch trống: đặt trước, bảo trì, giữ chỗ)
+        area_options = sorted({r.get('floor') for r in rooms if r.get('floor')})
+        area = st.selectbox(
+            "Khu vực", [""] + area_options, label_visibility="collapsed",
+            format_func=lambda x: "Tất cả khu vực" if x == "" else x,
+        ) if len(area_options) > 1 else ""
+        search = search_available_rooms(
+            check_in_time, check_out_time, booking_mode,
+            area=area or None, session_id=current_session_id,
+        ) if check_out_time > check_in_time else {"rooms": [], "counts": {}}
+        compatible_room_ids = [r['id'] for r in search["rooms"]]
+        if search["counts"]:
+            st.caption("Còn trống: " + " · ".join(
+                f"{type_map.get(code, {}).get('name', code)}: {n}" for code, n in search["counts"].items()
+            ))
+        elif not st.session_state.get("last_admin_held_rooms"):
+            st.warning("⚠️ Hết phòng trống trong thời gian đã chọn!")
         
         # Logic chọn phòng & Giữ chỗ (Hold) - WORKFLOW MỚI
         
         # 1. Hàm xử lý khi bấm nút "Thoát" hoặc "Huỷ chọn"
         def release_all_held_rooms():
-            current_held = st.session_state.get("last_admin_held_rooms", [])
-            for rid in current_held:
-                release_room_hold(rid, st.session_state["user_session_id"])
+            get_hold_leases(st.session_state["user_session_id"]).release_all()
             st.session_state["last_admin_held_rooms"] = []
             st.session_state["admin_selected_rooms"] = [] # Reset multiselect
             st.session_state["admin_single_room"] = None # Reset single select
@@ -271,7 +256,10 @@ with st.container(border=True):
         # 2. UI chọn phòng
         selected_rooms = []
         is_held = False # Trạng thái đã giữ chỗ thành công chưa
-        current_held = st.session_state.get("last_admin_held_rooms", [])
+        # Phòng đã được nhả (rời trang / hết hạn) thì không còn tính là đang giữ
+        held_now = get_hold_leases(st.session_state["user_session_id"]).held()
+        current_held = [rid for rid in st.session_state.get("last_admin_held_rooms", []) if rid in held_now]
+        st.session_state["last_admin_held_rooms"] = current_held
 
         if c_type == "Khách đoàn":
             # Nếu đang giữ phòng, không cho chọn lại (phải huỷ trước)
@@ -312,18 +300,17 @@ with st.container(border=True):
         if not is_held:
             st.warning(f"Bạn chọn: {', '.join(selected_rooms)}. Bấm xác nhận để giữ phòng.")
             if st.button("🔒 Xác nhận giữ phòng (5 phút)", type="primary"):
-                 # Thực hiện Hold
-                valid_holds = []
-                for rid in selected_rooms:
-                    success, msg = hold_room(rid, st.session_state["user_session_id"], duration_minutes=5)
-                    if success:
-                        valid_holds.append(rid)
-                    else:
-                        st.error(f"Phòng {rid}: {msg}")
-                
-                if valid_holds:
-                    st.session_state["last_admin_held_rooms"] = valid_holds
+                # Giữ tất cả phòng trong 1 transaction: 1 phòng lỗi -> không giữ phòng nào
+                # (qua lease của session: rời trang Booking -> tự nhả)
+                success, result = get_hold_leases(st.session_state["user_session_id"]).acquire(
+                    selected_rooms, page=current_session_and_page()[1]
+                )
+                if success:
+                    st.session_state["last_admin_held_rooms"] = result
                     st.rerun() # Reload để update UI sang trạng thái "Đang giữ"
+                else:
+                    for rid, msg in result.items():
+                        st.error(f"Phòng {rid}: {msg}")
         else:
             # Đang giữ -> Cho phép Huỷ/Thoát
             if st.button("❌ Huỷ chọn & Thoát", type="secondary"):
@@ -333,7 +320,7 @@ with st.container(border=True):
         # Hiển thị thông tin phòng
         if selected_rooms and len(selected_rooms) == 1:
             rid = selected_rooms[0]
-            r_obj = next((r for r in available_rooms if r['id'] == rid), None)
+            r_obj = rooms_by_id.get(rid)
             if r_obj:
                 t_info = type_map.get(r_obj['room_type_code'], {})
                 p_info = t_info.get('pricing', {})
@@ -363,18 +350,20 @@ with st.container(border=True):
     with col_pay:
         st.caption("3. Xác nhận & Thanh toán")
         
-        # Logic tính tiền (Tổng các phòng)
-        total_est_price = 0
-        details_text = []
-
-        for rid in selected_rooms:
-            ro = next((r for r in available_rooms if r['id'] == rid), None)
-            if ro:
-                ti = type_map.get(ro['room_type_code'], {})
-                price_cfg = get_applicable_price_config(check_in_time.date(), ti, system_config)
-                p = calculate_estimated_price(check_in_time, check_out_time, booking_mode, price_cfg)
-                total_est_price += p
-                details_text.append(f"- {rid}: {p:,.0f} đ")
+        # Logic tính tiền (Tổng các phòng): báo giá hàng loạt qua cache, dùng lại khi tạo booking
+        room_by_id = rooms_by_id
+        quote_rooms = [rid for rid in selected_rooms if rid in room_by_id]
+        room_prices = dict(zip(
+            quote_rooms,
+            get_quotes(
+                [room_by_id[rid]['room_type_code'] for rid in quote_rooms],
+                booking_mode,
+                check_in_time,
+                check_out_time,
+            ),
+        )) if quote_rooms else {}
+        total_est_price = sum(room_prices.values())
+        details_text = [f"- {rid}: {p:,.0f} đ" for rid, p in room_prices.items()]
         
         # Show breakdown if multiple
         if len(selected_rooms) > 1:
@@ -382,13 +371,14 @@ with st.container(border=True):
                  for l in details_text: st.write(l)
 
         # Debug info (optional)
-        if selected_rooms:
-            first_ro = next((r for r in available_rooms if r['id'] == selected_rooms[0]), None)
-            if first_ro:
-                first_ti = type_map.get(first_ro['room_type_code'], {})
-                first_pricing = get_applicable_price_config(check_in_time.date(), first_ti, system_config)
-                if first_pricing != first_ti.get('pricing', {}):
-                     st.caption("ℹ️ Đang áp dụng giá đặc biệt")
+        if quote_rooms:
+            first_code = room_by_id[quote_rooms[0]]['room_type_code']
+            special = price_table.special_nights(first_code, booking_mode, check_in_time, check_out_time)
+            if special:
+                if booking_mode == BookingType.DAILY:
+                    st.caption(f"ℹ️ Đang áp dụng giá đặc biệt cho {special} đêm")
+                else:
+                    st.caption("ℹ️ Đang áp dụng giá đặc biệt")
 
         st.metric("Tổng tạm tính", f"{total_est_price:,.0f} đ")
         deposit = st.number_input("Tiền cọc", step=50000, format="%d")
@@ -396,6 +386,15 @@ with st.container(border=True):
         # st.write("")
         is_checkin_now = st.checkbox("Check-in ngay?", value=True)
         btn_label = "✅ CHECK-IN" if is_checkin_now else "💾 LƯU"
+
+        # Kiểm tra lịch trống theo giờ vào / ra đã chọn (đặt trước trùng lịch, bảo trì, người khác giữ...)
+        if quote_rooms and check_out_time > check_in_time:
+            room_conflicts = check_room_availability(
+                quote_rooms, check_in_time, check_out_time,
+                session_id=current_session_id, starts_now=is_checkin_now or None,
+            )
+            for rid, reason in room_conflicts.items():
+                st.warning(f"⚠️ Phòng {rid} {reason}")
         
         if has_permission(Permission.CREATE_BOOKING):
             if st.button(btn_label, type="primary", use_container_width=True):
@@ -406,42 +405,45 @@ with st.container(border=True):
                 elif check_out_time <= check_in_time:
                     st.error("Giờ ra sai!")
                 else:
-                    success_count = 0
-                    created_ids = []
+                    new_bookings = []
                     
                     # Avg deposit
                     avg_deposit = deposit / len(selected_rooms) if selected_rooms and deposit else 0
 
-                    for rid in selected_rooms:
-                        # Recalculate price
-                        ro = next((r for r in available_rooms if r['id'] == rid), None)
-                        if ro:
-                            ti = type_map.get(ro['room_type_code'], {})
-                            price_cfg = get_applicable_price_config(check_in_time.date(), ti, system_config)
-                            p_room = calculate_estimated_price(check_in_time, check_out_time, booking_mode, price_cfg)
-                            
-                            new_bk = Booking(
-                                room_id=rid,
-                                customer_name=c_name,
-                                customer_phone=c_phone,
-                                customer_type=c_type,
-                                booking_type=booking_mode,
-                                check_in=check_in_time,
-                                check_out_expected=check_out_time,
-                                price_original=p_room,
-                                deposit=avg_deposit,
-                                status=BookingStatus.CHECKED_IN if is_checkin_now else BookingStatus.CONFIRMED,
-                                source="direct"
-                            )
-                            suc, rez_id = create_booking(new_bk.to_dict())
-                            if suc:
-                                success_count += 1
-                                created_ids.append(rez_id)
+                    # Snapshot bảng giá theo loại phòng (lưu lên booking để trả phòng không đọc lại bảng giá)
+                    rate_plans = {}
+                    for rid in quote_rooms:
+                        code = room_by_id[rid]['room_type_code']
+                        if code not in rate_plans:
+                            rate_plans[code] = price_table.rate_plan(code, booking_mode, check_in_time, check_out_time)
+
+                    for rid in quote_rooms:
+                        # Giá đã báo ở trên (cùng giờ vào/ra)
+                        new_bookings.append(Booking(
+                            room_id=rid,
+                            customer_name=c_name,
+                            customer_phone=c_phone,
+                            customer_type=c_type,
+                            booking_type=booking_mode,
+                            check_in=check_in_time,
+                            check_out_expected=check_out_time,
+                            price_original=room_prices[rid],
+                            deposit=avg_deposit,
+                            rate_plan=rate_plans[room_by_id[rid]['room_type_code']],
+                        ))
                     
-                    if success_count == len(selected_rooms):
-                         st.success(f"Đã tạo {success_count} booking thành công!")
+                    # Tạo tất cả booking trong 1 transaction (lỗi 1 phòng -> không phòng nào bị ghi)
+                    suc, result = create_bookings(
+                        new_bookings,
+                        is_checkin_now=is_checkin_now,
+                        session_id=st.session_state["user_session_id"],
+                    )
+                    if suc:
+                         st.success(f"Đã tạo {len(result)} booking thành công!")
                          # Clear state
                          st.session_state["selected_rooms"] = []
+                         st.session_state["last_admin_held_rooms"] = []
+                         get_hold_leases(st.session_state["user_session_id"]).forget([b.room_id for b in new_bookings])
                          st.rerun()
                     else:
-                        st.error(f"Có lỗi xảy ra! Chỉ tạo được {success_count}/{len(selected_rooms)} phòng.")
\ No newline at end of file
+                        st.error(f"Không tạo được booking: {result}")
\ No newline at end of file
@@ -7,14 +7,13 @@ from src.db import (
     get_occupied_rooms,
     get_booking_by_id,
     process_checkout,
-    get_all_room_types,
+    quote_booking,
     update_room_status,
     get_payment_config,
-    calculate_service_total,
-    get_orders_by_booking,
+    get_booking_service_total,
+    get_booking_service_items,
 )
 from src.models import RoomStatus, Permission
-from src.logic import calculate_estimated_price, BookingType
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu, require_login, require_permission, has_permission
 
 st.set_page_config(page_title="Trả phòng & Thanh toán", layout="wide")
@@ -319,35 +318,20 @@ with col_select:
 with col_bill:
     st.subheader("🧾 Hóa đơn chi tiết")
     
-    # Lấy cấu hình giá của loại phòng này để tính lại tiền (nếu cần)
-    room_types = get_all_room_types()
-    # Tìm pricing config
-    r_type_code = selected_room.get('room_type_code')
-    pricing = {}
-    for rt in room_types:
-        if rt['type_code'] == r_type_code:
-            pricing = rt.get('pricing', {})
-            break
-            
     # --- TÍNH TOÁN THỜI GIAN THỰC TẾ ---
     check_in = booking.get('check_in')
     check_out_now = datetime.now()
     
-    # Tính lại tiền phòng dựa trên giờ thực tế (Realtime calculation)
-    # Lưu ý: Convert string booking_type sang Enum nếu cần, ở đây logic.py nhận string cũng được nếu xử lý khéo,
-    # nhưng tốt nhất ta truyền đúng. Trong logic.py hiện tại đang so sánh Enum.
-    
-    # Mapping string sang Enum cho logic tính toán
-    b_type_str = booking.get('booking_type')
-    b_type_enum = BookingType.HOURLY
-    if b_type_str == "Qua đêm": b_type_enum = BookingType.OVERNIGHT
-    elif b_type_str == "Theo ngày": b_type_enum = BookingType.DAILY
-    
-    room_fee = calculate_estimated_price(check_in, check_out_now, b_type_enum, pricing)
+    # Tính lại tiền phòng dựa trên giờ thực tế, theo bảng giá đã chốt lúc đặt (rate_plan trên booking).
+    # Booking cũ chưa có rate_plan: tính theo bảng giá hiện hành của loại phòng.
+    room_fee = quote_booking(booking, check_out_now, room_type_code=selected_room.get('room_type_code'))
+    if not booking.get('rate_plan'):
+        st.caption("ℹ️ Booking cũ: tính theo bảng giá hiện hành")
     
     # --- TÍNH TIỀN DỊCH VỤ (New) ---
-    calc_service_fee = calculate_service_total(booking_id)
-    service_orders = get_orders_by_booking(booking_id)
+    # Lấy từ tổng đã cộng dồn trên booking (không cần query service_orders)
+    calc_service_fee = get_booking_service_total(booking)
+    service_orders = get_booking_service_items(booking)
     
     if service_orders:
         with st.expander(f"🛒 Chi tiết dịch vụ đã gọi ({calc_service_fee:,.0f} đ)", expanded=True):
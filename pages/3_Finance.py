@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date, time, timedelta
 
-from src.db import get_completed_bookings, get_all_rooms, get_all_room_types
+from src.db import get_completed_bookings, get_all_rooms, get_all_room_types, get_revenue_summary, rebuild_revenue_rollups, FINANCE_BOOKING_FIELDS
 from src.models import Permission
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu, require_login, require_permission, has_permission
 
@@ -17,7 +17,7 @@ st.title("📊 Finance - Báo cáo doanh thu")
 
 # --- ACTION BUTTONS (Moved Up) ---
 c_btn1, c_btn2, c_btn3 = st.columns([1, 1, 1])
-st.caption("Nguồn dữ liệu: collection `bookings` (chỉ tính các booking đã trả phòng / có `check_out_actual`).")
+st.caption("Nguồn dữ liệu: số liệu tổng hợp `revenue_daily` / `revenue_monthly` (cập nhật khi trả phòng); bảng chi tiết lấy từ `bookings` (chỉ tải khi bật).")
 
 # Placeholder for Metrics (Top of Page)
 metrics_container = st.container()
@@ -57,10 +57,19 @@ with st.container(border=True):
     with c_group:
         group_mode = st.radio("Nhóm theo", ["Ngày", "Tháng"], horizontal=True)
 
+    # Bảng chi tiết đọc từng booking trong khoảng (1 read / bill) -> chỉ tải khi cần xem / xuất / in
+    show_detail = st.toggle(
+        "📄 Tải bảng chi tiết (xem / xuất / in)",
+        value=False,
+        help="Đọc từng booking đã trả phòng trong khoảng thời gian. Số liệu tổng ở trên không cần bật.",
+    )
+
 # --- 2. DATA FETCHING & PROCESSING ---
 start_dt = datetime.combine(d_from, time.min)
 end_dt = datetime.combine(d_to, time.max)
-bookings = get_completed_bookings(start_dt=start_dt, end_dt=end_dt)
+bookings = get_completed_bookings(start_dt=start_dt, end_dt=end_dt, fields=FINANCE_BOOKING_FIELDS) if show_detail else []
+# Tổng hợp từ rollup (tối đa ~31 read) thay vì cộng dồn từng booking
+summary = get_revenue_summary(d_from, d_to, group_by="month" if group_mode == "Tháng" else "day")
 
 # Fetch Metadata
 rooms = get_all_rooms()
@@ -69,9 +78,6 @@ room_map = {r.get("id"): r for r in rooms}
 type_map = {t.get("type_code"): t for t in room_types}
 
 rows = []
-total_rev = 0.0
-room_rev = 0.0
-service_rev = 0.0
 # Set for counting unique guests
 unique_guests = set()
 missing_ts = 0
@@ -89,11 +95,6 @@ for b in bookings:
     # Amounts
     total = float(b.get("total_amount") or b.get("price_original") or 0.0)
     svc = float(b.get("service_fee") or 0.0)
-    rf = total - svc
-    
-    total_rev += total
-    service_rev += svc
-    room_rev += rf
 
     # Guests
     c_name = b.get("customer_name", "").strip()
@@ -119,8 +120,11 @@ for b in bookings:
     })
 
 df = pd.DataFrame(rows)
-num_bills = len(df)
-num_guests = len(unique_guests)
+total_rev = summary["total_revenue"]
+room_rev = summary["room_revenue"]
+service_rev = summary["service_revenue"]
+num_bills = summary["bill_count"]
+num_guests = len(unique_guests) if show_detail else None
 
 # --- 3. DISPLAY METRICS (In Top Placeholder) ---
 with metrics_container:
@@ -128,9 +132,15 @@ with metrics_container:
     m1, m2, m3, m4, m5 = st.columns([1.5, 0.8, 0.8, 1.5, 1.5])
     m1.metric("Tổng doanh thu", f"{total_rev:,.0f} đ", delta_color="off")
     m2.metric("Tổng số bill", f"{num_bills}")
-    m3.metric("Tổng khách thuê", f"{num_guests}")
+    m3.metric("Tổng khách thuê", f"{num_guests}" if num_guests is not None else "—",
+              help=None if num_guests is not None else "Bật 'Tải bảng chi tiết' để đếm khách")
     m4.metric("Doanh thu phòng", f"{room_rev:,.0f} đ")
     m5.metric("Doanh thu dịch vụ", f"{service_rev:,.0f} đ")
+    if summary["by_payment_method"]:
+        st.caption(" · ".join(f"{k}: {v:,.0f} đ" for k, v in sorted(summary["by_payment_method"].items())))
+    if len(df) and num_bills < len(df):
+        # Dữ liệu trước khi có rollup -> cần tính lại 1 lần
+        st.warning("Số liệu tổng hợp chưa đầy đủ cho khoảng thời gian này. Vui lòng bấm 'Tính lại số liệu tổng hợp' bên dưới.")
     st.divider()
 
 # --- 4. ACTION BUTTONS & DETAILED TABLE ---
@@ -208,7 +218,9 @@ if c_btn1.button("👁️ Xem / Làm mới", use_container_width=True):
 # --- TABLE DISPLAY ---
 st.subheader(f"📄 Chi tiết doanh thu {d_from.strftime('%d/%m/%Y')} - {d_to.strftime('%d/%m/%Y')}")
 
-if df.empty:
+if not show_detail:
+    st.info("Bật 'Tải bảng chi tiết' ở trên để xem danh sách bill.")
+elif df.empty:
     st.info("Không có dữ liệu trong khoảng thời gian này.")
 else:
     st.dataframe(
@@ -224,38 +236,48 @@ else:
     )
 
 # --- CHARTS (If Data Exists) ---
-if not df.empty:
+if summary["series"]:
     st.divider()
-    df = df.sort_values("check_out_actual")
-    df["date"] = df["check_out_actual"].dt.date
-    df["month"] = df["check_out_actual"].dt.to_period("M").astype(str)
-
-    group_key = "date" if group_mode == "Ngày" else "month"
-    ts = df.groupby(group_key, as_index=False)["total_amount"].sum().rename(columns={"total_amount": "revenue"})
+    ts = pd.DataFrame(summary["series"], columns=["period", "total_revenue"])\
+        .rename(columns={"total_revenue": "revenue"})
 
     col_chart, col_top = st.columns([1.6, 1])
     with col_chart:
         st.subheader("Biểu đồ doanh thu")
-        st.line_chart(ts.set_index(group_key)["revenue"])
+        st.line_chart(ts.set_index("period")["revenue"])
 
     with col_top:
         st.subheader("Top phòng doanh thu cao")
-        top_rooms = (
-            df.groupby("room_id", as_index=False)["total_amount"]
-            .sum()
-            .sort_values("total_amount", ascending=False)
-            .head(10)
-            .rename(columns={"total_amount": "revenue"})
-        )
-        st.dataframe(
-            top_rooms, 
-            column_config={
-                "room_id": "Phòng",
-                "revenue": st.column_config.NumberColumn("Doanh thu", format="%d đ")
-            },
-            use_container_width=True, 
-            hide_index=True
-        )
+        if df.empty:
+            st.caption("Bật 'Tải bảng chi tiết' để xem.")
+        else:
+            top_rooms = (
+                df.groupby("room_id", as_index=False)["total_amount"]
+                .sum()
+                .sort_values("total_amount", ascending=False)
+                .head(10)
+                .rename(columns={"total_amount": "revenue"})
+            )
+            st.dataframe(
+                top_rooms, 
+                column_config={
+                    "room_id": "Phòng",
+                    "revenue": st.column_config.NumberColumn("Doanh thu", format="%d đ")
+                },
+                use_container_width=True, 
+                hide_index=True
+            )
+
+if has_permission(Permission.MANAGE_SYSTEM_CONFIG):
+    with st.expander("⚙️ Tính lại số liệu tổng hợp"):
+        st.caption("Tính lại rollup doanh thu từ các booking đã trả phòng (trọn các tháng trong khoảng đang chọn).")
+        if st.button("🔄 Tính lại số liệu tổng hợp"):
+            ok, msg = rebuild_revenue_rollups(d_from, d_to)
+            if ok:
+                st.success(msg)
+                st.rerun()
+            else:
+                st.error(msg)
 
 if missing_ts > 0:
     st.caption(f"Ghi chú: có {missing_ts} booking thiếu `check_out_actual` nên đã bị loại khỏi báo cáo.")
\ No newline at end of file
@@ -7,7 +7,7 @@ from src.models import ServiceItem, ServiceCategory, ServiceOrder, RoomStatus, P
 from src.db import (
     get_all_services, save_service, delete_service,
     get_occupied_rooms, add_service_order, get_orders_by_booking,
-    get_all_rooms, get_recent_service_orders
+    get_all_rooms, get_recent_service_orders, reconcile_service_totals
 )
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu, require_login, require_permission, has_permission
 
@@ -129,10 +129,12 @@ with tab_order:
                         total_value=total_order,
                         note=note
                     )
-                    add_service_order(new_order.to_dict())
-                    st.success(f"Đã gọi món cho phòng {s_room_id} thành công!")
-                    st.session_state["cart"] = {}
-                    st.rerun()
+                    if add_service_order(new_order.to_dict()):
+                        st.success(f"Đã gọi món cho phòng {s_room_id} thành công!")
+                        st.session_state["cart"] = {}
+                        st.rerun()
+                    else:
+                        st.error("Không lưu được order, vui lòng thử lại.")
 
     # ===================== CỘT PHẢI: Chọn Món/Dịch vụ =====================
     with c_right:
@@ -309,6 +311,11 @@ with tab_menu:
 # ---------------------------------------------------------
 with tab_history:
     st.subheader("📜 Nhật ký Order (20 đơn gần nhất)")
+
+    if has_permission(Permission.MANAGE_SERVICES):
+        if st.button("🔁 Đối soát tiền dịch vụ (phòng đang ở)", help="Tính lại tổng tiền dịch vụ trên booking từ các order"):
+            checked, fixed = reconcile_service_totals()
+            st.toast(f"Đã kiểm tra {checked} booking, sửa {fixed} booking lệch", icon="🔁")
     
     orders = get_recent_service_orders(limit=20)
     
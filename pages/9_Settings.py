@@ -26,6 +26,12 @@ from src.db import (
     get_all_role_permissions,
     save_role_permissions,
     init_default_permissions,
+    get_permission_check_stats,
+    get_hold_sweeper_stats,
+    get_quote_cache_stats,
+    get_db_op_stats,
+    save_db_budgets,
+    reset_db_op_stats,
 )
 from src.models import Room, RoomStatus, PriceConfig, RoomType, User, UserRole, Permission, PERMISSION_METADATA
 from src.ui import apply_sidebar_style, create_custom_sidebar_menu, require_login, has_permission
@@ -202,6 +208,7 @@ def dialog_add_room_type():
         hn_n = price_input("Thường (+)", 20000, "add_hnn", c1)
         hn_w = price_input("C.tuần (+)", 0, "add_hnw", c2)
         hn_h = price_input("Lễ/Tết (+)", 0, "add_hnh", c3)
+        daily_cap = st.checkbox("Ở lâu theo giờ: tự chuyển sang giá ngày nếu rẻ hơn", value=True, key="add_dcap")
         
         st.markdown("---")
         st.markdown("**⚙️ Cho phép đặt**")
@@ -220,6 +227,7 @@ def dialog_add_room_type():
                     return PriceConfig(
                         daily_price=float(d), overnight_price=float(o),
                         hourly_blocks={"1": h1, "2": h2, "3": h3, "4": h3 + hn},
+                        hourly_overflow_price=float(hn), hourly_daily_cap=daily_cap,
                         enable_hourly=en_h, enable_overnight=en_o, enable_daily=en_d
                     )
                 
@@ -288,7 +296,9 @@ with tab_types:
                             return int(d.get(key, default))
                         def _b(blk, key, default=0):
                             return int(blk.get(key, default))
-                        def _next(blk):
+                        def _next(blk, cfg=None):
+                            if cfg and cfg.get('hourly_overflow_price'):
+                                return int(cfg['hourly_overflow_price'])
                             if blk.get('4') and blk.get('3'):
                                 d = int(blk['4']) - int(blk['3'])
                                 return d if d > 0 else 20000
@@ -335,9 +345,13 @@ with tab_types:
                         
                         st.caption("Mỗi giờ tiếp theo (+)")
                         c1, c2, c3 = st.columns(3)
-                        e_hn_n = price_input("Thường (+)", _next(blocks), f"ie_hnn_{tc}", c1)
-                        e_hn_w = price_input("C.tuần (+)", _next(blocks_w) if blocks_w else 20000, f"ie_hnw_{tc}", c2)
-                        e_hn_h = price_input("Lễ/Tết (+)", _next(blocks_h) if blocks_h else 20000, f"ie_hnh_{tc}", c3)
+                        e_hn_n = price_input("Thường (+)", _next(blocks, pricing), f"ie_hnn_{tc}", c1)
+                        e_hn_w = price_input("C.tuần (+)", _next(blocks_w, p_weekend) if blocks_w else 20000, f"ie_hnw_{tc}", c2)
+                        e_hn_h = price_input("Lễ/Tết (+)", _next(blocks_h, p_holiday) if blocks_h else 20000, f"ie_hnh_{tc}", c3)
+                        e_daily_cap = st.checkbox(
+                            "Ở lâu theo giờ: tự chuyển sang giá ngày nếu rẻ hơn",
+                            value=pricing.get('hourly_daily_cap', True), key=f"ie_dcap_{tc}"
+                        )
                         
                         st.markdown("---")
                         st.markdown("**⚙️ Cho phép đặt**")
@@ -356,6 +370,7 @@ with tab_types:
                                 return PriceConfig(
                                     daily_price=float(d), overnight_price=float(o),
                                     hourly_blocks={"1": h1, "2": h2, "3": h3, "4": h3 + hn},
+                                    hourly_overflow_price=float(hn), hourly_daily_cap=e_daily_cap,
                                     enable_hourly=en_h, enable_overnight=en_o, enable_daily=en_d
                                 )
                             
@@ -434,16 +449,20 @@ with tab_types:
                     r3.write(fmt(blocks_w.get('3')))
                     r4.write(fmt(blocks_h.get('3')))
                     
-                    def calc_next(blk):
+                    def calc_next(blk, cfg=None):
+                        if cfg and cfg.get('hourly_overflow_price'):
+                            return float(cfg['hourly_overflow_price'])
                         if blk.get('4') and blk.get('3'):
                             diff = float(blk['4']) - float(blk['3'])
                             return diff if diff > 0 else 0
                         return 0
                     r1, r2, r3, r4 = st.columns([1.5, 1, 1, 1])
                     r1.write("⏱️ Mỗi giờ tiếp (+)")
-                    r2.write(f"**{fmt(calc_next(blocks))}**")
-                    r3.write(fmt(calc_next(blocks_w)))
-                    r4.write(fmt(calc_next(blocks_h)))
+                    r2.write(f"**{fmt(calc_next(blocks, pricing))}**")
+                    r3.write(fmt(calc_next(blocks_w, p_weekend)))
+                    r4.write(fmt(calc_next(blocks_h, p_holiday)))
+                    if pricing.get('hourly_daily_cap', True):
+                        st.caption("⏱️ Ở lâu theo giờ: tự chuyển sang giá ngày nếu rẻ hơn")
                     
                     extra_adult = pricing.get('extra_adult_surcharge', 0)
                     extra_child = pricing.get('extra_child_surcharge', 0)
@@ -972,6 +991,109 @@ with tab_system:
                 "Nhập Mã ngân hàng (VietQR bankId/BIN) và Số tài khoản ở bên trái để tạo QR tự động."
             )
 
+    with st.expander("⏱️ Tự động nhả phòng giữ chỗ hết hạn (process hiện tại)"):
+        sweeper_stats = get_hold_sweeper_stats()
+        if not sweeper_stats:
+            st.caption("Sweeper đang tắt (HOLD_SWEEPER=0).")
+        else:
+            s1, s2, s3, s4 = st.columns(4)
+            s1.metric("Leader", "Có" if sweeper_stats["is_leader"] else "Không")
+            s2.metric("Đã nhả (tổng)", sweeper_stats["released_total"])
+            s3.metric("Quét TB (ms)", sweeper_stats["avg_sweep_ms"])
+            s4.metric("Quét max (ms)", sweeper_stats["max_sweep_ms"])
+            st.caption(
+                f"Số lượt quét: {sweeper_stats['sweeps']} · Hold đang chờ: {sweeper_stats['pending_holds']}"
+                + (f" · Lỗi gần nhất: {sweeper_stats['last_error']}" if sweeper_stats["last_error"] else "")
+            )
+
+    with st.expander("💲 Cache báo giá (process hiện tại)"):
+        quote_stats = get_quote_cache_stats()
+        q1, q2, q3, q4 = st.columns(4)
+        q1.metric("Hit rate", f"{quote_stats['hit_rate']:.0%}")
+        q2.metric("Hits", quote_stats["hits"])
+        q3.metric("Misses", quote_stats["misses"])
+        q4.metric("Số báo giá đang lưu", f"{quote_stats['size']}/{quote_stats['maxsize']}")
+        st.caption(f"Số lần xóa cache (đổi bảng giá / ngày đặc biệt): {quote_stats['invalidations']}")
+
+    if has_permission(Permission.MANAGE_SYSTEM_CONFIG):
+        with st.expander("🔥 Thống kê đọc/ghi Firestore theo trang (process hiện tại)"):
+            import pandas as pd
+            op_stats = get_db_op_stats(recent=100)
+            if not op_stats["enabled"]:
+                st.caption("Đang tắt (DB_METRICS=0).")
+            else:
+                st.dataframe(
+                    pd.DataFrame(
+                        [
+                            {
+                                "Trang": page,
+                                "Số lần chạy": v["runs"],
+                                "Read TB/lần": v["avg_reads"],
+                                "Read max/lần": v["max_reads"],
+                                "Ngân sách": v["budget"] or "—",
+                                "Vượt ngân sách": v["over_budget_runs"],
+                                "Tổng read": v["reads"],
+                                "Tổng write": v["writes"],
+                                "Transaction": v["transactions"],
+                                "KB": round(v["bytes"] / 1024, 1),
+                                "Latency (ms)": v["latency_ms"],
+                            }
+                            for page, v in sorted(op_stats["pages"].items(), key=lambda kv: -kv[1]["reads"])
+                        ]
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+                st.markdown("**Nhật ký các lần chạy gần nhất**")
+                st.dataframe(
+                    pd.DataFrame(
+                        [
+                            {
+                                "Lúc": r["started_at"].strftime("%H:%M:%S"),
+                                "Trang": r["page"],
+                                "Read": r["reads"],
+                                "Write": r["writes"],
+                                "KB": round(r["bytes"] / 1024, 1),
+                                "ms": r["latency_ms"],
+                                "Vượt": "⚠️" if r["over_budget"] else "",
+                                "Hàm tốn read nhất": ", ".join(f"{k}: {v}" for k, v in r["top_calls"].items()),
+                            }
+                            for r in op_stats["recent"]
+                        ]
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+                st.markdown("**Ngân sách read mỗi lần chạy trang**")
+                with st.form("db_budgets_form"):
+                    default_budget = st.number_input(
+                        "Mặc định (0 = không giới hạn)", min_value=0, step=50,
+                        value=int(op_stats["default_budget"]),
+                    )
+                    budget_df = st.data_editor(
+                        pd.DataFrame(
+                            [{"Trang": k, "Read tối đa": v} for k, v in op_stats["budgets"].items()],
+                            columns=["Trang", "Read tối đa"],
+                        ),
+                        num_rows="dynamic",
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+                    if st.form_submit_button("💾 Lưu ngân sách"):
+                        save_db_budgets(
+                            {
+                                row["Trang"]: row["Read tối đa"]
+                                for _, row in budget_df.dropna().iterrows()
+                            },
+                            default_budget,
+                        )
+                        st.success("Đã lưu ngân sách read.")
+                if st.button("🧹 Xóa số liệu thống kê", key="reset_db_stats"):
+                    reset_db_op_stats()
+                    st.rerun()
+
 # --- TAB 4: QUẢN LÝ NHÂN VIÊN ---
 with tab_staff:
     st.subheader("👥 Quản lý Nhân viên & Phân quyền")
@@ -1321,3 +1443,15 @@ with tab_permissions:
         import pandas as pd
         df_summary = pd.DataFrame(summary_data)
         st.dataframe(df_summary, use_container_width=True, hide_index=True)
+
+        with st.expander("📈 Thống kê kiểm tra quyền (process hiện tại)"):
+            perm_stats = get_permission_check_stats()
+            st.caption(f"Số lần load cấu hình: {perm_stats['loads']} · Tổng số lần kiểm tra: {perm_stats['total_checks']}")
+            st.dataframe(
+                pd.DataFrame(
+                    [{"Trang": k, "Số lần kiểm tra": v} for k, v in perm_stats["checks_by_page"].items()],
+                    columns=["Trang", "Số lần kiểm tra"],
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
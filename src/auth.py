@@ -0,0 +1,169 @@
+"""
+Session token ký HMAC (stateless) + cache dùng cho xác thực.
+
+- Token = base64url(payload JSON) + "." + base64url(HMAC-SHA256(secret, payload)).
+  Kiểm tra chữ ký và hạn dùng hoàn toàn trong process, không cần query Firestore.
+- `TTLCache`: cache nhỏ có hạn (user record) để mở trang không tốn read.
+- `RevocationList`: danh sách session đã đăng xuất (theo `sid`), load lại theo TTL.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+
+_MISSING = object()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def generate_secret() -> str:
+    """Sinh secret ngẫu nhiên (dùng khi chưa cấu hình SESSION_SECRET)."""
+    return secrets.token_urlsafe(48)
+
+
+class SessionSigner:
+    """
+    Phát hành / kiểm tra session token.
+
+    Payload: u = username, v = session_version của user (đổi mật khẩu -> tăng version
+    -> mọi token cũ mất hiệu lực), sid = id phiên (dùng để thu hồi), iat / exp = epoch giây.
+    """
+
+    def __init__(self, secret: str | bytes, ttl_seconds: int = 7 * 24 * 3600):
+        if not secret:
+            raise ValueError("Session secret is empty")
+        self._secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, payload: bytes) -> str:
+        return _b64encode(hmac.new(self._secret, payload, hashlib.sha256).digest())
+
+    def issue(self, username: str, session_version: int = 0, now: float | None = None) -> str:
+        now = int(now if now is not None else time.time())
+        payload = json.dumps(
+            {
+                "u": username,
+                "v": session_version,
+                "sid": secrets.token_hex(8),
+                "iat": now,
+                "exp": now + self.ttl_seconds,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return f"{_b64encode(payload)}.{self._sign(payload)}"
+
+    def verify(self, token: str, now: float | None = None) -> dict | None:
+        """Trả về payload nếu chữ ký đúng và chưa hết hạn, ngược lại None."""
+        if not token or token.count(".") != 1:
+            return None
+        body, signature = token.split(".")
+        try:
+            payload = _b64decode(body)
+        except (ValueError, TypeError):
+            return None
+        if not hmac.compare_digest(self._sign(payload), signature):
+            return None
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not data.get("u"):
+            return None
+        if data.get("exp", 0) < (now if now is not None else time.time()):
+            return None
+        return data
+
+
+class TTLCache:
+    """Cache key -> value, mỗi entry sống `ttl_seconds` (thread-safe)."""
+
+    def __init__(self, ttl_seconds: float = 60.0, maxsize: int = 1024):
+        self._ttl = ttl_seconds
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """Lấy value của `key`, gọi `loader(key)` nếu chưa có hoặc đã hết hạn."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = loader(key)
+        with self._lock:
+            if len(self._data) >= self._maxsize:
+                # Bỏ các entry hết hạn; vẫn đầy thì xóa hết (cache nhỏ, đơn giản)
+                self._data = {k: v for k, v in self._data.items() if v[1] > now}
+                if len(self._data) >= self._maxsize:
+                    self._data.clear()
+            self._data[key] = (value, now + self._ttl)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class RevocationList:
+    """
+    Danh sách `sid` đã bị thu hồi (đăng xuất), dạng {sid: exp_epoch}.
+
+    `loader` đọc danh sách từ DB; kết quả dùng lại trong `ttl_seconds`.
+    Thu hồi trong chính process này có hiệu lực ngay (`add`).
+    """
+
+    def __init__(self, loader, ttl_seconds: float = 60.0):
+        self._loader = loader
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._loaded_at = None
+        self.loads = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self._ttl:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self._ttl:
+                return
+            revoked = dict(self._loader() or {})
+            revoked.update(self._revoked)
+            self._revoked = revoked
+            self._loaded_at = now
+            self.loads += 1
+
+    def is_revoked(self, sid: str) -> bool:
+        self._refresh()
+        return sid in self._revoked
+
+    def add(self, sid: str, exp: float):
+        with self._lock:
+            self._revoked[sid] = exp
+            # Token đã hết hạn thì không cần nhớ nữa
+            now = time.time()
+            self._revoked = {k: v for k, v in self._revoked.items() if v >= now}
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
@@ -0,0 +1,272 @@
+"""
+Lịch trống của phòng theo khoảng thời gian (availability engine).
+
+Mỗi phòng có 1 `RoomSchedule`: các khoảng [start, end) sắp xếp theo start, kèm prefix max của end.
+- STAY: booking đang hoạt động (Đã đặt / Đang ở), [check_in, check_out_expected).
+  Khách đang ở quá giờ trả: giữ phòng tới ít nhất `now + overstay_minutes` (index được dựng lại định kỳ).
+- MAINTENANCE: phòng đang Bảo trì (không thời hạn) + lịch `maintenance_blocks` trên document phòng.
+
+Giữ chỗ (TEMP_LOCKED) không gắn với ngày cụ thể: chặn mọi khoảng thời gian của phòng tới khi hết hạn,
+trừ session đang giữ; hạn giữ được so tại thời điểm tra cứu.
+
+`RoomSchedule.overlaps(start, end)`: bisect các khoảng bắt đầu trước `end`, prefix max cho biết có
+khoảng nào kết thúc sau `start` -> O(log n) mỗi phòng.
+"""
+import math
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from src.models import BookingStatus, RoomStatus
+
+STAY, MAINTENANCE = "stay", "maintenance"
+
+CHECKED_IN_STATUSES = (BookingStatus.CHECKED_IN.value, "CheckedIn")
+# Trạng thái phòng cho phép nhận khách ngay (check-in bây giờ)
+READY_NOW_STATUSES = (
+    RoomStatus.AVAILABLE.value,
+    RoomStatus.RESERVED.value,
+    RoomStatus.PENDING_PAYMENT.value,
+    RoomStatus.TEMP_LOCKED.value,
+    "AVAILABLE",
+    "available",
+)
+OPEN_END = math.inf
+
+
+def to_seconds(dt) -> float:
+    """
+    Giờ booking / lịch bảo trì -> epoch giây. Các giờ này được ghi dạng naive (giờ local); Firestore trả
+    về có tzinfo UTC nhưng giữ nguyên giá trị đã ghi -> bỏ tzinfo (như logic.py), không đổi múi giờ.
+    """
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=None).timestamp()
+
+
+def instant_seconds(dt) -> float:
+    """Thời điểm tuyệt đối (hạn giữ phòng `locked_until`, ghi có tzinfo) -> epoch giây. Naive = giờ local."""
+    if dt is None:
+        return None
+    return dt.timestamp()
+
+
+def stay_interval(booking: dict, overstay_until: float) -> tuple | None:
+    """
+    Khoảng [start, end) (epoch giây) phòng bị chiếm bởi 1 booking đang hoạt động.
+    Thiếu giờ trả / giờ trả <= giờ nhận: tính 1 giờ. Khách Đang ở: tới ít nhất `overstay_until`.
+    """
+    start = to_seconds(booking.get("check_in"))
+    if start is None:
+        return None
+    end = to_seconds(booking.get("check_out_expected"))
+    if end is None or end <= start:
+        end = start + 3600
+    if booking.get("status") in CHECKED_IN_STATUSES:
+        end = max(end, overstay_until)
+    return start, end
+
+
+class BookingConflictError(ValueError):
+    """Phòng không nhận được booking (trùng lịch / đang bị giữ / chưa sẵn sàng) - phát hiện trong transaction."""
+
+    def __init__(self, room_id: str, reason: str):
+        self.room_id = room_id
+        self.reason = reason
+        super().__init__(f"Phòng {room_id} {reason}")
+
+
+def _fmt(seconds: float) -> str:
+    if seconds in (OPEN_END, -OPEN_END):
+        return "không thời hạn"
+    return datetime.fromtimestamp(seconds).strftime("%H:%M %d/%m")
+
+
+class RoomSchedule:
+    """Các khoảng bận [start, end) của 1 phòng (epoch giây), sắp theo start."""
+
+    def __init__(self, intervals: list | None = None):
+        # (start, end, kind, ref)
+        items = sorted(intervals or [], key=lambda it: (it[0], it[1]))
+        self.intervals = items
+        self._starts = [it[0] for it in items]
+        self._max_end = []
+        running = -OPEN_END
+        for it in items:
+            running = max(running, it[1])
+            self._max_end.append(running)
+
+    def overlaps(self, start: float, end: float) -> bool:
+        i = bisect_left(self._starts, end)
+        return i > 0 and self._max_end[i - 1] > start
+
+    def conflicts(self, start: float, end: float) -> list:
+        """Các khoảng giao với [start, end) (để báo lỗi / hiển thị)."""
+        if not self.overlaps(start, end):
+            return []
+        i = bisect_left(self._starts, end)
+        return [it for it in self.intervals[:i] if it[1] > start]
+
+    def next_after(self, start: float, kind: str = STAY, exclude=None):
+        """Khoảng `kind` đầu tiên bắt đầu từ `start` trở đi (bỏ qua ref = exclude)."""
+        for it in self.intervals[bisect_left(self._starts, start):]:
+            if it[2] == kind and it[3] != exclude:
+                return it
+        return None
+
+    def __len__(self):
+        return len(self.intervals)
+
+
+class AvailabilityIndex:
+    """
+    Index lịch trống của toàn bộ phòng, dựng từ danh sách phòng + booking đang hoạt động.
+
+    Args:
+        rooms: Danh sách phòng (dict như `get_all_rooms()`).
+        active_bookings: {booking_id: booking} hoặc list booking (status Đã đặt / Đang ở).
+        now: Thời điểm dựng index (mặc định datetime.now()).
+        overstay_minutes: Khách đang ở quá giờ trả giữ phòng thêm bấy nhiêu phút tính từ `now`;
+            cũng là tuổi tối đa của index (`expires_at`).
+    """
+
+    def __init__(self, rooms: list, active_bookings, now: datetime | None = None, overstay_minutes: int = 5):
+        now = now or datetime.now()
+        self.built_at = now
+        self.expires_at = now + timedelta(minutes=overstay_minutes)
+        overstay_until = to_seconds(self.expires_at)
+        if isinstance(active_bookings, dict):
+            active_bookings = [dict(b, id=b.get("id") or bk_id) for bk_id, b in active_bookings.items()]
+
+        self.rooms = {}
+        self._by_type = {}
+        self._holds = {}
+        self._not_ready = {}
+        intervals = {}
+        for room in rooms:
+            room_id = room.get("id")
+            if not room_id:
+                continue
+            self.rooms[room_id] = room
+            self._by_type.setdefault(room.get("room_type_code"), []).append(room_id)
+            items = intervals.setdefault(room_id, [])
+            status = room.get("status")
+            if status == RoomStatus.MAINTENANCE:
+                items.append((-OPEN_END, OPEN_END, MAINTENANCE, None))
+            for block in room.get("maintenance_blocks") or []:
+                start, end = to_seconds(block.get("start")), to_seconds(block.get("end"))
+                if start is not None and end is not None and end > start:
+                    items.append((start, end, MAINTENANCE, block.get("note")))
+            if status == RoomStatus.TEMP_LOCKED and room.get("locked_until"):
+                self._holds[room_id] = (room.get("locked_by"), instant_seconds(room.get("locked_until")))
+            if status not in READY_NOW_STATUSES:
+                self._not_ready[room_id] = status
+
+        for bk in active_bookings:
+            room_id = bk.get("room_id")
+            span = stay_interval(bk, overstay_until) if room_id in intervals else None
+            if span is not None:
+                intervals[room_id].append((span[0], span[1], STAY, bk.get("id")))
+
+        self._schedules = {room_id: RoomSchedule(items) for room_id, items in intervals.items()}
+
+    # --- Tra cứu ---
+
+    def schedule(self, room_id: str) -> RoomSchedule:
+        return self._schedules.get(room_id) or RoomSchedule()
+
+    def conflict(
+        self,
+        room_id: str,
+        check_in: datetime,
+        check_out: datetime,
+        session_id: str | None = None,
+        starts_now: bool | None = None,
+        now: datetime | None = None,
+    ) -> str | None:
+        """
+        Lý do phòng không nhận được booking [check_in, check_out), hoặc None nếu trống.
+        `starts_now`: khách nhận phòng ngay (mặc định: check_in <= now) -> phòng phải sẵn sàng
+        (không Đang ở / Chưa dọn).
+        """
+        if room_id not in self.rooms:
+            return "không tồn tại"
+        start, end = to_seconds(check_in), to_seconds(check_out)
+        if end <= start:
+            return "giờ trả phải sau giờ nhận"
+        now_s = to_seconds(now or datetime.now())
+        if starts_now is None:
+            starts_now = start <= now_s
+        return self._conflict(room_id, start, end, session_id, starts_now, now_s)
+
+    @staticmethod
+    def describe(interval: tuple) -> str:
+        """Lý do (tiếng Việt) cho 1 khoảng bận (start, end, kind, ref)."""
+        c_start, c_end, kind, _ = interval
+        if kind == MAINTENANCE:
+            return "đang bảo trì" if c_start == -OPEN_END else f"bảo trì {_fmt(c_start)} → {_fmt(c_end)}"
+        return f"đã có lịch {_fmt(c_start)} → {_fmt(c_end)}"
+
+    def _conflict(self, room_id: str, start: float, end: float, session_id, starts_now: bool, now_s: float):
+        hold = self._holds.get(room_id)
+        if hold is not None and hold[0] != session_id and hold[1] > now_s:
+            return "đang được người khác giữ"
+        if starts_now and room_id in self._not_ready:
+            return f"chưa sẵn sàng nhận khách ({self._not_ready[room_id]})"
+
+        schedule = self._schedules.get(room_id)
+        if schedule is None or not schedule.overlaps(start, end):
+            return None
+        return self.describe(schedule.conflicts(start, end)[0])
+
+    def is_free(self, room_id: str, check_in: datetime, check_out: datetime, **kwargs) -> bool:
+        return self.conflict(room_id, check_in, check_out, **kwargs) is None
+
+    def free_rooms(
+        self,
+        check_in: datetime,
+        check_out: datetime,
+        type_codes=None,
+        area: str | None = None,
+        session_id: str | None = None,
+        starts_now: bool | None = None,
+        now: datetime | None = None,
+    ) -> list:
+        """
+        Danh sách room_id trống cho [check_in, check_out).
+        `type_codes`: mã loại phòng (str) hoặc list mã để lọc; `area`: khu vực / tầng (field `floor`).
+        """
+        start, end = to_seconds(check_in), to_seconds(check_out)
+        if end <= start:
+            return []
+        now_s = to_seconds(now or datetime.now())
+        if starts_now is None:
+            starts_now = start <= now_s
+        if type_codes is None:
+            candidates = self.rooms
+        else:
+            if isinstance(type_codes, str):
+                type_codes = [type_codes]
+            candidates = [rid for code in type_codes for rid in self._by_type.get(code, [])]
+        rooms = self.rooms
+        return [
+            room_id
+            for room_id in candidates
+            if (area is None or rooms[room_id].get("floor") == area)
+            and self._conflict(room_id, start, end, session_id, starts_now, now_s) is None
+        ]
+
+    def areas(self) -> list:
+        return sorted({r.get("floor") for r in self.rooms.values() if r.get("floor")})
+
+    def next_reservation(self, room_id: str, after: datetime, exclude: str | None = None):
+        """booking_id của lịch ở kế tiếp của phòng (bắt đầu từ `after`), bỏ qua `exclude`."""
+        it = self.schedule(room_id).next_after(to_seconds(after), STAY, exclude)
+        return it[3] if it else None
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "intervals": sum(len(s) for s in self._schedules.values()),
+            "holds": len(self._holds),
+            "built_at": self.built_at,
+        }
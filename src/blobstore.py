@@ -0,0 +1,119 @@
+"""
+Lưu file nhị phân (ảnh chụp thanh toán...) ngoài Firestore.
+
+Booking chỉ giữ `ref` (chuỗi tham chiếu) + 1 thumbnail nhỏ; ảnh gốc chỉ tải khi cần xem.
+
+- `GcsBlobStore`: Cloud Storage (bucket của Firebase project).   ref = "gs://<bucket>/<key>"
+- `LocalBlobStore`: thư mục trên máy (offline / STORAGE_BACKEND local). ref = "local://<key>"
+"""
+import io
+import os
+
+
+class BlobNotFound(KeyError):
+    """Không tìm thấy blob theo ref."""
+
+
+class BlobStore:
+    """Interface: put(key, data, content_type) -> ref, get(ref) -> bytes, delete(ref)."""
+
+    scheme = ""
+
+    def put(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> str:
+        raise NotImplementedError
+
+    def get(self, ref: str) -> bytes:
+        raise NotImplementedError
+
+    def delete(self, ref: str):
+        raise NotImplementedError
+
+    def _key_of(self, ref: str) -> str:
+        prefix = f"{self.scheme}://"
+        if not ref or not ref.startswith(prefix):
+            raise BlobNotFound(ref)
+        return ref[len(prefix):]
+
+
+class LocalBlobStore(BlobStore):
+    scheme = "local"
+
+    def __init__(self, root_dir: str):
+        self._root = os.path.abspath(root_dir)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self._root, key))
+        # Không cho key thoát ra ngoài thư mục gốc (../)
+        if not path.startswith(self._root + os.sep):
+            raise ValueError(f"Invalid blob key: {key}")
+        return path
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return f"{self.scheme}://{key}"
+
+    def get(self, ref):
+        path = self._path(self._key_of(ref))
+        if not os.path.exists(path):
+            raise BlobNotFound(ref)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def delete(self, ref):
+        path = self._path(self._key_of(ref))
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class GcsBlobStore(BlobStore):
+    scheme = "gs"
+
+    def __init__(self, bucket):
+        # bucket: google.cloud.storage.Bucket (VD: firebase_admin.storage.bucket())
+        self._bucket = bucket
+
+    def _key_of(self, ref):
+        key = super()._key_of(ref)
+        bucket_name, _, key = key.partition("/")
+        if bucket_name != self._bucket.name:
+            raise BlobNotFound(ref)
+        return key
+
+    def put(self, key, data, content_type="application/octet-stream"):
+        self._bucket.blob(key).upload_from_string(data, content_type=content_type)
+        return f"{self.scheme}://{self._bucket.name}/{key}"
+
+    def get(self, ref):
+        blob = self._bucket.blob(self._key_of(ref))
+        try:
+            return blob.download_as_bytes()
+        except Exception as e:
+            if type(e).__name__ == "NotFound":
+                raise BlobNotFound(ref) from e
+            raise
+
+    def delete(self, ref):
+        try:
+            self._bucket.blob(self._key_of(ref)).delete()
+        except Exception as e:
+            if type(e).__name__ != "NotFound":
+                raise
+
+
+def make_thumbnail(data: bytes, max_size: int = 320, quality: int = 70) -> bytes | None:
+    """Thu nhỏ ảnh (cạnh dài <= max_size) và nén JPEG. Trả về None nếu không đọc được ảnh."""
+    try:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as img:
+            img = img.convert("RGB")
+            img.thumbnail((max_size, max_size))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        print(f"⚠️ Failed to create thumbnail: {e}")
+        return None
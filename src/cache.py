@@ -0,0 +1,167 @@
+"""
+Snapshot cache dùng chung toàn process (mọi session Streamlit).
+
+- Mỗi snapshot gắn với "version" của 1 phạm vi dữ liệu (rooms / bookings / room_types / config),
+  lấy từ bộ đếm phân mảnh `ShardedVersionCounter`. Chỉ load lại khi version phạm vi đó thay đổi.
+- Single-flight: nhiều rerun đồng thời cùng thấy version mới -> chỉ 1 lần fetch,
+  các thread còn lại chờ và dùng chung kết quả.
+"""
+import random
+import threading
+import time
+from datetime import datetime
+
+from firebase_admin import firestore
+
+# Các phạm vi dữ liệu có version riêng
+SCOPE_ROOMS = "rooms"
+SCOPE_BOOKINGS = "bookings"
+SCOPE_ROOM_TYPES = "room_types"
+SCOPE_CONFIG = "config"
+VERSION_SCOPES = (SCOPE_ROOMS, SCOPE_BOOKINGS, SCOPE_ROOM_TYPES, SCOPE_CONFIG)
+
+
+class ShardedVersionCounter:
+    """
+    Bộ đếm version theo phạm vi, chia thành `num_shards` document (`<collection>/shard_<i>`).
+
+    - Ghi: Increment vào 1 shard ngẫu nhiên, chỉ các field của phạm vi vừa thay đổi
+      -> các writer không tranh nhau 1 document.
+    - Đọc: cộng các shard theo từng field -> {scope: version} (num_shards read).
+    """
+
+    def __init__(self, db, collection: str = "config_versions", num_shards: int = 8):
+        self._db = db
+        self._collection = collection
+        self.num_shards = max(1, num_shards)
+
+    def _shard_ref(self, index: int):
+        return self._db.collection(self._collection).document(f"shard_{index}")
+
+    def bump(self, scopes, writer=None):
+        """
+        Tăng version của các phạm vi `scopes`.
+        `writer`: batch / transaction đang mở (ghi cùng lúc với dữ liệu), mặc định ghi ngay.
+        """
+        ref = self._shard_ref(random.randrange(self.num_shards))
+        data = {scope: firestore.Increment(1) for scope in scopes}
+        if writer is None:
+            ref.set(data, merge=True)
+        else:
+            writer.set(ref, data, merge=True)
+
+    def read(self) -> dict:
+        """
+        {scope: version} = tổng các shard. Chi phí: `num_shards` document read mỗi lần gọi (không phải 1),
+        nên VersionClock gộp các lần đọc theo TTL; tăng num_shards là đổi thêm read lấy thêm ghi/giây.
+        """
+        versions = dict.fromkeys(VERSION_SCOPES, 0)
+        for doc in self._db.collection(self._collection).stream():
+            for scope, value in (doc.to_dict() or {}).items():
+                versions[scope] = versions.get(scope, 0) + (value or 0)
+        return versions
+
+
+class VersionClock:
+    """
+    Đọc bộ đếm version với TTL ngắn để gộp các lần đọc gần nhau.
+
+    `reader` là hàm trả về version hiện tại (VD: {scope: version} từ `ShardedVersionCounter`).
+    Gọi `invalidate()` sau khi chính process này ghi dữ liệu để lần đọc kế tiếp
+    lấy version mới ngay.
+    """
+
+    def __init__(self, reader, ttl_seconds: float = 1.0):
+        self._reader = reader
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._value = None
+        self._read_at = 0.0
+        self.reads = 0
+
+    def _fresh(self):
+        if self._value is not None and (time.monotonic() - self._read_at) < self._ttl:
+            return self._value
+        return None
+
+    def get(self):
+        value = self._fresh()
+        if value is not None:
+            return value
+        with self._lock:
+            value = self._fresh()
+            if value is not None:
+                return value
+            self._value = self._reader()
+            self._read_at = time.monotonic()
+            self.reads += 1
+            return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+
+class VersionedSnapshot:
+    """
+    Giữ 1 bản dữ liệu kèm version đã load.
+
+    Args:
+        name: Tên snapshot (để log/thống kê)
+        loader: Hàm load dữ liệu đầy đủ (gọi Firestore)
+        expires_fn: (optional) Hàm nhận data, trả về datetime mà sau thời điểm đó
+            snapshot phải load lại dù version chưa đổi (VD: phòng giữ chỗ hết hạn).
+    """
+
+    def __init__(self, name: str, loader, expires_fn=None):
+        self.name = name
+        self._loader = loader
+        self._expires_fn = expires_fn
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+        self._expires_at = None
+        self.hits = 0
+        self.loads = 0
+
+    def _fresh(self, version):
+        if self._data is None or self._version != version:
+            return None
+        if self._expires_at is not None and datetime.now() >= self._expires_at:
+            return None
+        return self._data
+
+    def get(self, version):
+        """Trả về dữ liệu ứng với `version` (load lại nếu cần)."""
+        data = self._fresh(version)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        with self._lock:
+            # Thread khác có thể vừa load xong trong lúc mình chờ lock
+            data = self._fresh(version)
+            if data is not None:
+                self.hits += 1
+                return data
+
+            data = self._loader()
+            self._data = data
+            self._version = version
+            self._expires_at = self._expires_fn(data) if self._expires_fn else None
+            self.loads += 1
+            return data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self._version = None
+            self._expires_at = None
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self._version,
+            "hits": self.hits,
+            "loads": self.loads,
+        }
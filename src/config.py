@@ -12,7 +12,47 @@ class AppConfig:
     # Default to a generic name slightly different from specific "bamboo" to avoid confusion, 
     # but keep backward compatibility if file exists in config/
     FIREBASE_KEY_PATH = os.getenv("FIREBASE_KEY_PATH", "config/firebase_key.json")
-    
+
+    # Realtime mirror (Firestore on_snapshot listeners). Set REALTIME_MIRROR=0 to disable.
+    REALTIME_MIRROR = os.getenv("REALTIME_MIRROR", "1") == "1"
+
+    # Số shard của bộ đếm version (config_versions/shard_<i>): nhiều shard -> chịu được nhiều ghi/giây hơn,
+    # nhưng mỗi lần đọc version (tối đa 1 lần/giây/process) tốn đúng bấy nhiêu read
+    VERSION_COUNTER_SHARDS = int(os.getenv("VERSION_COUNTER_SHARDS", "8"))
+
+    # Thread nền nhả phòng giữ chỗ hết hạn (1 leader/cluster qua lease). HOLD_SWEEPER=0 để tắt.
+    HOLD_SWEEPER = os.getenv("HOLD_SWEEPER", "1") == "1"
+    HOLD_SWEEP_INTERVAL_SECONDS = float(os.getenv("HOLD_SWEEP_INTERVAL_SECONDS", "10"))
+    # Lease giữ phòng theo session: mỗi lần giữ / gia hạn HOLD_LEASE_MINUTES, heartbeat chỉ gia hạn khi
+    # còn <= HOLD_RENEW_MARGIN_SECONDS, không gia hạn quá HOLD_MAX_MINUTES kể từ lúc giữ
+    HOLD_LEASE_MINUTES = int(os.getenv("HOLD_LEASE_MINUTES", "5"))
+    HOLD_RENEW_MARGIN_SECONDS = int(os.getenv("HOLD_RENEW_MARGIN_SECONDS", "60"))
+    HOLD_MAX_MINUTES = int(os.getenv("HOLD_MAX_MINUTES", "30"))
+
+    # Đếm read/write Firestore theo trang (DB_METRICS=0 để tắt). Ngân sách read mỗi lần chạy trang:
+    # DB_READ_BUDGETS="main=200,1_Dashboard=100"; trang không khai báo dùng DB_DEFAULT_READ_BUDGET (0 = không giới hạn).
+    DB_METRICS = os.getenv("DB_METRICS", "1") == "1"
+    DB_READ_BUDGETS = os.getenv("DB_READ_BUDGETS", "")
+    DB_DEFAULT_READ_BUDGET = int(os.getenv("DB_DEFAULT_READ_BUDGET", "500"))
+
+    # Cache báo giá (LRU theo loại phòng / loại hình / giờ vào-ra / version bảng giá)
+    QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", "4096"))
+
+    # Storage backend: "firestore" (production) | "memory" | "sqlite" (benchmark / offline)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore").lower()
+    LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "config/local.db")
+
+    # Blob store (ảnh chụp thanh toán): "gcs" | "local". Mặc định: local nếu STORAGE_BACKEND cục bộ.
+    BLOB_BACKEND = os.getenv("BLOB_BACKEND", "").lower()
+    # Bỏ trống -> storageBucket của Firebase App, hoặc <project_id>.firebasestorage.app / .appspot.com (bucket nào tồn tại)
+    BLOB_BUCKET = os.getenv("BLOB_BUCKET", "")
+    BLOB_LOCAL_DIR = os.getenv("BLOB_LOCAL_DIR", "config/blobs")
+
+    # Session token (HMAC). Ưu tiên st.secrets["auth"]["session_secret"], sau đó biến môi trường,
+    # cuối cùng tự sinh và lưu ở config/auth trong DB.
+    SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+    SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "7"))
+
     # Paths
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     ROOT_DIR = os.path.dirname(BASE_DIR)
@@ -2,10 +2,66 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import streamlit as st
 import os
-from datetime import datetime, timedelta
-from src.models import Booking, BookingStatus, RoomStatus
+from datetime import datetime, timedelta, date
+from src.models import Booking, BookingStatus, BookingType, RoomStatus
 import uuid
+import base64
 from src.config import AppConfig
+from src.cache import (
+    VersionClock,
+    VersionedSnapshot,
+    ShardedVersionCounter,
+    VERSION_SCOPES,
+    SCOPE_ROOMS,
+    SCOPE_BOOKINGS,
+    SCOPE_ROOM_TYPES,
+    SCOPE_CONFIG,
+)
+from src.realtime import LiveMirror, FirestoreChangeSource, ROOMS, BOOKINGS, ROOM_TYPES
+from src import storage
+from src.auth import SessionSigner, TTLCache, RevocationList, generate_secret
+from src.permissions import PermissionResolver
+from src.blobstore import LocalBlobStore, GcsBlobStore, make_thumbnail
+from src.hold_sweeper import HoldSweeper
+from src.holds import HoldLeaseManager
+from src.metrics import InstrumentedClient, OpRecorder, parse_budgets, current_session_and_page
+from src.pricing import PriceTable, QuoteCache, quote_rate_plan
+from src.availability import AvailabilityIndex, BookingConflictError
+from src import inventory
+from src.inventory import InventoryChange, InventoryGrid
+from google.api_core.exceptions import AlreadyExists
+
+# Statuses that imply "active" booking (Booking status is CONFIRMED / CHECKED_IN; legacy data may use English)
+ACTIVE_BOOKING_STATUSES = [
+    BookingStatus.CONFIRMED.value,
+    BookingStatus.CHECKED_IN.value,
+    "Confirmed",
+    "CheckedIn",
+]
+# Booking đặt trước chưa nhận phòng (kể cả booking online chờ thanh toán)
+RESERVED_BOOKING_STATUSES = [BookingStatus.CONFIRMED.value, "Confirmed"]
+# process_checkout ghi "Completed" (legacy), Enum là "Hoàn tất"
+COMPLETED_BOOKING_STATUSES = ["Completed", BookingStatus.COMPLETED.value]
+
+# Rollup doanh thu (cập nhật trong transaction checkout)
+REVENUE_DAILY = "revenue_daily"      # doc id: YYYY-MM-DD
+REVENUE_MONTHLY = "revenue_monthly"  # doc id: YYYY-MM
+
+# Projection (select) cho các danh sách: chỉ lấy field cần hiển thị, không kéo ảnh / dữ liệu nặng
+BOOKING_LIST_FIELDS = [
+    "id", "room_id", "room_type_code", "customer_name", "customer_phone", "booking_type",
+    "status", "check_in", "check_out_expected", "check_out_actual",
+]
+ONLINE_BOOKING_LIST_FIELDS = BOOKING_LIST_FIELDS + [
+    "online_payment_type", "online_payment_status", "payment_screenshot_ref",
+    "payment_screenshot_thumb_b64", "payment_screenshot_name", "payment_screenshot_mime",
+]
+FINANCE_BOOKING_FIELDS = BOOKING_LIST_FIELDS + [
+    "total_amount", "price_original", "service_fee", "payment_method", "note",
+]
+DB_BUDGETS_DOC = "db_budgets"  # config_system/db_budgets: {pages: {page: reads}, default_budget}
+
+REVENUE_BOOKING_FIELDS = ["check_out_actual", "total_amount", "price_original", "service_fee", "payment_method"]
 
 
 # --- 1. KẾT NỐI FIRESTORE (Singleton) ---
@@ -64,35 +120,242 @@ def init_firebase():
 
 @st.cache_resource
 def get_firebase_client():
-    """Cache connection to Firestore to prevent re-initializing on every run"""
-    init_firebase()
-    return firestore.client()
+    """
+    Cache connection to Firestore to prevent re-initializing on every run.
+    STORAGE_BACKEND=memory|sqlite -> dùng client cục bộ cùng API (benchmark / offline).
+    DB_METRICS=1 -> bọc client để đếm read/write theo trang.
+    """
+    backend = AppConfig.STORAGE_BACKEND
+    if backend in ("memory", "sqlite"):
+        path = AppConfig.LOCAL_DB_PATH
+        if not os.path.isabs(path):
+            path = os.path.join(AppConfig.ROOT_DIR, path)
+        print(f"✅ Using local storage backend: {backend}")
+        client = storage.create_local_client(backend, path)
+    else:
+        init_firebase()
+        client = firestore.client()
+    if not AppConfig.DB_METRICS:
+        return client
+    recorder = _get_op_recorder()
+    try:
+        doc = client.collection("config_system").document(DB_BUDGETS_DOC).get()
+        if doc.exists:
+            saved = doc.to_dict() or {}
+            recorder.set_budgets(
+                {**recorder.budgets, **saved.get("pages", {})},
+                saved.get("default_budget"),
+            )
+    except Exception as e:
+        print(f"⚠️ Failed to load DB read budgets: {e}")
+    return InstrumentedClient(client, recorder)
 
 def get_db():
     """Lấy object kết nối tới DB (Cached)"""
     return get_firebase_client()
 
-# --- SMART POLLING HELPERS (Counter-based) ---
-def trigger_system_update():
-    """Tăng bộ đếm thay đổi hệ thống để các client khác biết mà reload."""
+# --- DB OPERATION ACCOUNTING (reads / writes per page) ---
+
+@st.cache_resource
+def _get_op_recorder():
+    return OpRecorder(parse_budgets(AppConfig.DB_READ_BUDGETS), AppConfig.DB_DEFAULT_READ_BUDGET)
+
+def begin_db_run():
+    """
+    Đánh dấu bắt đầu 1 lần chạy trang (gọi ở đầu mỗi trang, qua require_login).
+    Đồng thời nhả phòng session đang giữ nếu đã rời trang giữ phòng.
+    """
+    session_id, page = current_session_and_page()
+    if session_id is None:
+        return
+    if AppConfig.DB_METRICS:
+        _get_op_recorder().begin_run(session_id, page)
+    _release_holds_of_other_pages(page)
+
+def get_last_db_run():
+    """Số liệu lần chạy trước của session hiện tại (reads, writes, bytes, latency, over_budget...)."""
+    if not AppConfig.DB_METRICS:
+        return None
+    session_id, _ = current_session_and_page()
+    return _get_op_recorder().last_run(session_id)
+
+def get_db_op_stats(recent: int = 50):
+    """Tổng theo trang + nhật ký các lần chạy gần nhất + ngân sách đang áp dụng."""
+    recorder = _get_op_recorder()
+    return {
+        "enabled": AppConfig.DB_METRICS,
+        "pages": recorder.page_stats(),
+        "recent": recorder.recent_runs(recent),
+        "budgets": dict(recorder.budgets),
+        "default_budget": recorder.default_budget,
+    }
+
+def save_db_budgets(budgets: dict, default_budget: int):
+    """Lưu ngân sách read theo trang vào config_system/db_budgets và áp dụng ngay cho process này."""
+    budgets = {str(k): int(v) for k, v in budgets.items() if str(k).strip() and int(v) > 0}
+    get_db().collection("config_system").document(DB_BUDGETS_DOC).set(
+        {"pages": budgets, "default_budget": int(default_budget)}
+    )
+    _get_op_recorder().set_budgets(budgets, int(default_budget))
+
+def reset_db_op_stats():
+    _get_op_recorder().reset()
+
+# --- SMART POLLING HELPERS (Sharded version counters) ---
+
+@st.cache_resource
+def _get_version_counter():
+    return ShardedVersionCounter(get_db(), num_shards=AppConfig.VERSION_COUNTER_SHARDS)
+
+def trigger_system_update(*scopes, writer=None):
+    """
+    Tăng version của các phạm vi dữ liệu vừa thay đổi (rooms / bookings / room_types / config)
+    để các process khác chỉ reload phần đó. Không truyền scope -> tăng tất cả.
+    `writer`: batch / transaction đang ghi dữ liệu -> version được commit cùng dữ liệu (không có lúc
+    dữ liệu đã đổi mà version chưa tăng). Khi đó gọi `_versions_committed()` sau khi commit.
+    Không có writer -> ghi ngay (lỗi chỉ cảnh báo).
+    """
+    scopes = scopes or VERSION_SCOPES
+    if writer is not None:
+        _get_version_counter().bump(scopes, writer=writer)
+        return
     try:
-        db = get_db()
-        db.collection("config").document("system_status").set({
-            "update_counter": firestore.Increment(1)
-        }, merge=True)
+        _get_version_counter().bump(scopes)
     except Exception as e:
         print(f"⚠️ Failed to trigger system update: {e}")
+    _versions_committed()
+
+def _versions_committed():
+    """Process này vừa ghi -> lần đọc kế tiếp phải lấy version mới ngay."""
+    _get_snapshot_store().clock.invalidate()
+
+def _read_collection_versions():
+    """Đọc version các phạm vi từ các shard (num_shards read)."""
+    try:
+        return _get_version_counter().read()
+    except Exception as e:
+        print(f"⚠️ Failed to read version counters: {e}")
+        return dict.fromkeys(VERSION_SCOPES, 0)
+
+def get_collection_versions() -> dict:
+    """{scope: version} (dùng chung toàn process, đọc lại tối đa 1 lần/giây)."""
+    return _get_snapshot_store().clock.get()
 
 def get_system_update_counter():
-    """Lấy giá trị bộ đếm cập nhật hệ thống (số nguyên đơn giản)."""
+    """Tổng version mọi phạm vi (số nguyên đơn giản, tăng mỗi khi có thay đổi)."""
+    return sum(get_collection_versions().values())
+
+# --- SHARED SNAPSHOT CACHE (Process-wide, counter-based) ---
+
+def _to_local_naive(ts: datetime) -> datetime:
+    """
+    Thời điểm tuyệt đối ghi có tzinfo (locked_until) -> giờ local, bỏ tzinfo để so sánh.
+    Không dùng cho giờ booking (xem `_wall_time`).
+    """
+    if ts is not None and ts.tzinfo:
+        return ts.astimezone().replace(tzinfo=None)
+    return ts
+
+def _wall_time(ts: datetime) -> datetime:
+    """
+    Giờ booking (check_in / check_out_expected) được ghi dạng naive giờ local; Firestore trả về gắn UTC
+    nhưng giữ nguyên giá trị -> chỉ bỏ tzinfo (như logic.py), không đổi múi giờ.
+    """
+    if ts is not None and ts.tzinfo:
+        return ts.replace(tzinfo=None)
+    return ts
+
+def _hold_expiry(room: dict):
+    """locked_until (giờ local, naive) của phòng đang TEMP_LOCKED, ngược lại None."""
+    if room.get("status") == RoomStatus.TEMP_LOCKED and room.get("locked_until"):
+        return _to_local_naive(room.get("locked_until"))
+    return None
+
+class _SnapshotStore:
+    """Các snapshot dùng chung giữa mọi session trong process."""
+
+    def __init__(self):
+        self.clock = VersionClock(_read_collection_versions, ttl_seconds=1.0)
+        # Hold hết hạn được hiển thị là Trống ngay lúc đọc -> không cần load lại theo expiry
+        self.rooms = VersionedSnapshot("rooms", _fetch_all_rooms)
+        self.active_bookings = VersionedSnapshot("active_bookings", _fetch_active_bookings_dict)
+        self.room_types = VersionedSnapshot("room_types", _fetch_all_room_types)
+        # Lịch trống theo khoảng thời gian: dựng lại khi version rooms / bookings đổi, hoặc sau vài phút
+        # (khách ở quá giờ trả)
+        self.availability = VersionedSnapshot(
+            "availability", _build_availability_index, expires_fn=lambda index: index.expires_at
+        )
+
+@st.cache_resource
+def _get_snapshot_store():
+    return _SnapshotStore()
+
+@st.cache_resource
+def _get_live_mirror():
+    """
+    Khởi động listener nền (on_snapshot) cho rooms / bookings đang hoạt động / loại phòng.
+    Trả về None nếu tắt (REALTIME_MIRROR=0) hoặc không khởi động được -> dùng snapshot cache.
+    """
+    if not AppConfig.REALTIME_MIRROR:
+        return None
     try:
-        db = get_db()
-        doc = db.collection("config").document("system_status").get()
-        if doc.exists:
-            return doc.to_dict().get("update_counter", 0)
-    except Exception:
-        pass
-    return 0
+        source = FirestoreChangeSource(get_db(), ACTIVE_BOOKING_STATUSES)
+        return LiveMirror(source).start()
+    except Exception as e:
+        print(f"⚠️ Failed to start realtime mirror: {e}")
+        return None
+
+def _mirror_for(collection: str):
+    """
+    Mirror nếu đã sẵn sàng phục vụ collection này, ngược lại None.
+    Listener đã chết -> None (dùng snapshot cache) cho tới khi đăng ký lại xong.
+    """
+    mirror = _get_live_mirror()
+    if mirror is None:
+        return None
+    mirror.check_health()
+    if mirror.is_ready(collection):
+        return mirror
+    return None
+
+@st.cache_resource
+def _get_hold_sweeper():
+    """
+    Khởi động thread nền nhả phòng giữ chỗ hết hạn (mỗi process 1 sweeper, chỉ leader ghi).
+    Trả về None nếu tắt (HOLD_SWEEPER=0) hoặc không khởi động được.
+    """
+    if not AppConfig.HOLD_SWEEPER:
+        return None
+    try:
+        owner_id = f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        return HoldSweeper(
+            get_db(),
+            owner_id,
+            expiry_of=_hold_expiry,
+            stage_version=lambda writer: trigger_system_update(SCOPE_ROOMS, writer=writer),
+            on_released=lambda n: _versions_committed(),
+            interval_seconds=AppConfig.HOLD_SWEEP_INTERVAL_SECONDS,
+        ).start()
+    except Exception as e:
+        print(f"⚠️ Failed to start hold sweeper: {e}")
+        return None
+
+def get_hold_sweeper_stats():
+    """Thống kê sweeper của process hiện tại (leader?, số lượt quét, số phòng đã nhả, latency)."""
+    sweeper = _get_hold_sweeper()
+    return sweeper.stats() if sweeper else None
+
+def get_snapshot_cache_stats():
+    """Thống kê cache (hits / loads / số lần đọc counter)."""
+    store = _get_snapshot_store()
+    return {
+        "counter_reads": store.clock.reads,
+        "rooms": store.rooms.stats(),
+        "active_bookings": store.active_bookings.stats(),
+        "room_types": store.room_types.stats(),
+        "mirror": _get_live_mirror().stats() if _get_live_mirror() else None,
+        "hold_sweeper": get_hold_sweeper_stats(),
+    }
 
 # --- 2. LOGIC XỬ LÝ DỮ LIỆU (CRUD) ---
 
@@ -102,13 +365,22 @@ def save_room_type_to_db(room_type_data: dict):
     # Dùng type_code làm ID của document
     doc_id = room_type_data.get("type_code")
     if doc_id:
-        db.collection("config_room_types").document(doc_id).set(room_type_data)
-        # Clear cache when data changes
-        get_all_room_types.clear()
+        batch = db.batch()
+        batch.set(db.collection("config_room_types").document(doc_id), room_type_data)
+        trigger_system_update(SCOPE_ROOM_TYPES, writer=batch)
+        batch.commit()
+        _versions_committed()
+        _get_quote_cache().invalidate()
 
-@st.cache_data(ttl=3600)
 def get_all_room_types():
-    """Lấy danh sách tất cả loại phòng (Cached 1h)"""
+    """Lấy danh sách tất cả loại phòng (Realtime mirror, hoặc snapshot theo version room_types)"""
+    mirror = _mirror_for(ROOM_TYPES)
+    if mirror is not None:
+        return mirror.room_types()
+    store = _get_snapshot_store()
+    return [dict(t) for t in store.room_types.get(store.clock.get()[SCOPE_ROOM_TYPES])]
+
+def _fetch_all_room_types():
     db = get_db()
     docs = db.collection("config_room_types").stream()
     return [doc.to_dict() for doc in docs]
@@ -117,8 +389,53 @@ def delete_room_type(type_code: str):
     """Xóa loại phòng"""
     db = get_db()
     if type_code:
-        db.collection("config_room_types").document(type_code).delete()
-        get_all_room_types.clear()
+        batch = db.batch()
+        batch.delete(db.collection("config_room_types").document(type_code))
+        trigger_system_update(SCOPE_ROOM_TYPES, writer=batch)
+        batch.commit()
+        _versions_committed()
+        _get_quote_cache().invalidate()
+
+def get_price_table() -> PriceTable:
+    """
+    Bảng giá biên dịch sẵn (loại phòng + special_days) để báo giá hàng loạt.
+    Dùng chung toàn process, chỉ biên dịch lại khi version room_types / config thay đổi.
+    """
+    versions = get_collection_versions()
+    return _get_price_table_cached(versions[SCOPE_ROOM_TYPES], versions[SCOPE_CONFIG])
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _get_price_table_cached(room_types_version: int, config_version: int) -> PriceTable:
+    return PriceTable(get_all_room_types(), get_system_config("special_days"))
+
+@st.cache_resource
+def _get_quote_cache() -> QuoteCache:
+    return QuoteCache(maxsize=AppConfig.QUOTE_CACHE_SIZE)
+
+def get_quotes(type_codes: list, booking_type, check_in: datetime, check_out: datetime) -> list:
+    """
+    Báo giá cho danh sách loại phòng (cùng loại hình / giờ vào / giờ ra), qua cache LRU.
+    Giờ vào / ra được làm tròn xuống phút.
+    """
+    return _get_quote_cache().quote(get_price_table(), type_codes, booking_type, check_in, check_out)
+
+def get_quote(type_code: str, booking_type, check_in: datetime, check_out: datetime) -> float:
+    return get_quotes([type_code], booking_type, check_in, check_out)[0]
+
+def quote_booking(booking: dict, check_out: datetime, room_type_code: str | None = None) -> float:
+    """
+    Tiền phòng của booking đến `check_out` (trả phòng / báo giá lại).
+    Booking có `rate_plan`: tính từ snapshot, không đọc loại phòng. Booking cũ: theo bảng giá hiện hành
+    của `room_type_code`.
+    """
+    rate_plan = booking.get("rate_plan")
+    if rate_plan:
+        return quote_rate_plan(rate_plan, booking["check_in"], check_out, booking.get("booking_type"))
+    return get_price_table().quote_one(room_type_code, booking.get("booking_type"), booking["check_in"], check_out)
+
+def get_quote_cache_stats():
+    """Thống kê cache báo giá (hits / misses / hit rate / số lần invalidate)."""
+    return _get_quote_cache().stats()
 
 # --- LOGIC PHÒNG (ROOMS) & HOLDING MECHANISM ---
 
@@ -128,196 +445,526 @@ def save_room_to_db(room_data: dict):
     # Dùng số phòng làm ID (VD: '101')
     doc_id = room_data.get("id")
     if doc_id:
-        db.collection("rooms").document(doc_id).set(room_data)
+        batch = db.batch()
+        batch.set(db.collection("rooms").document(doc_id), room_data)
+        trigger_system_update(SCOPE_ROOMS, writer=batch)
+        batch.commit()
+        _versions_committed()
 
 def get_all_rooms():
     """
-    Lấy danh sách tất cả phòng.
-    - Tự động kiểm tra và nhả phòng bị giữ quá hạn (Lazy Release).
+    Lấy danh sách tất cả phòng (chỉ đọc, không ghi).
+    - Dùng snapshot chung của process, chỉ fetch lại khi version phạm vi rooms thay đổi.
+    - Nếu realtime mirror đã sẵn sàng: đọc thẳng từ bộ nhớ (0 read).
+    - Phòng giữ chỗ đã hết hạn được trả về như Trống; việc ghi nhả phòng do sweeper nền làm.
+    - Trả về bản copy để trang gọi có thể sửa thoải mái.
     """
+    _get_hold_sweeper()  # Đảm bảo sweeper nền đã chạy
+    mirror = _mirror_for(ROOMS)
+    if mirror is not None:
+        rooms = mirror.rooms()
+    else:
+        store = _get_snapshot_store()
+        rooms = [dict(r) for r in store.rooms.get(store.clock.get()[SCOPE_ROOMS])]
+    return _present_expired_holds(rooms)
+
+def _fetch_all_rooms():
+    """Fetch toàn bộ phòng từ Firestore."""
     db = get_db()
     docs = db.collection("rooms").stream()
-    rooms = []
-    
+    return [doc.to_dict() for doc in docs]
+
+def _present_expired_holds(rooms: list) -> list:
+    """Phòng TEMP_LOCKED đã quá hạn giữ -> hiển thị là Trống (sửa trên list, không ghi DB)."""
     now = datetime.now()
-    batch = db.batch()
-    needs_commit = False
+    for r in rooms:
+        expiry = _hold_expiry(r)
+        if expiry is not None and expiry < now:
+            r["status"] = RoomStatus.AVAILABLE.value
+            r.pop("locked_until", None)
+            r.pop("locked_by", None)
+    return rooms
 
-    for doc in docs:
-        r = doc.to_dict()
-        # Kiểm tra Lazy Release cho TEMP_LOCKED
-        if r.get("status") == RoomStatus.TEMP_LOCKED:
-            locked_until = r.get("locked_until")
-            if locked_until:
-                # Fix Timezone Issue: Firestore returns UTC, 'now' is Local.
-                if locked_until.tzinfo:
-                    locked_until = locked_until.astimezone()
-                    locked_until = locked_until.replace(tzinfo=None)
-
-                if locked_until < now:
-                    # Đã hết hạn giữ -> Release về AVAILABLE
-                    ref = db.collection("rooms").document(r["id"])
-                    batch.update(ref, {
-                        "status": RoomStatus.AVAILABLE,
-                        "locked_until": firestore.DELETE_FIELD,
-                        "locked_by": firestore.DELETE_FIELD
-                    })
-                    needs_commit = True
-                    # Update local data for return
-                    r["status"] = RoomStatus.AVAILABLE.value
-                    r.pop("locked_until", None)
-                    r.pop("locked_by", None)
-
-        rooms.append(r)
-    
-    if needs_commit:
-        try:
-            batch.commit()
-            print("✅ Auto-released expired rooms.")
-        except Exception as e:
-            print(f"⚠️ Failed to auto-release rooms: {e}")
+def _hold_refusal(data: dict, uid: str, now: datetime) -> str | None:
+    """Lý do không giữ được phòng (None = giữ được / gia hạn được)."""
+    status = data.get("status")
+    # Case 1: Phòng đang AVAILABLE -> Lock được
+    if status == RoomStatus.AVAILABLE or status == "Trống":
+        return None
+    # Case 2: Phòng đang TEMP_LOCKED: chính mình giữ -> gia hạn; người khác giữ mà đã hết hạn -> cướp lock
+    if status == RoomStatus.TEMP_LOCKED or status == "Đang thao tác":
+        if data.get("locked_by") == uid:
+            return None
+        locked_until = _to_local_naive(data.get("locked_until"))
+        if locked_until and locked_until > now:
+            return "Phòng đang được người khác giữ"
+        return None
+    # Case 3: Phòng đang Bận (Occupied, Reserved, Dirty...)
+    return f"Phòng đang bận ({status})"
 
-    return rooms
+def hold_rooms(room_ids: list, user_session_id: str, duration_minutes: int = 5):
+    """
+    Giữ nhiều phòng (khách đoàn) trong 1 transaction: giữ được tất cả hoặc không giữ phòng nào.
+    - Chỉ tăng version rooms 1 lần.
+    - Trả về (True, [room_id, ...]) hoặc (False, {room_id: "lý do"}) cho các phòng không giữ được.
+    """
+    room_ids = list(dict.fromkeys(rid for rid in room_ids if rid))
+    if not user_session_id:
+        return False, dict.fromkeys(room_ids, "Missing session_id")
+    if not room_ids:
+        return True, []
+
+    db = get_db()
+    room_refs = [db.collection("rooms").document(rid) for rid in room_ids]
+
+    @storage.transactional
+    def _hold_in_transaction(transaction):
+        now = datetime.now()
+        snapshots = {snap.id: snap for snap in transaction.get_all(room_refs)}
+        conflicts = {}
+        for rid in room_ids:
+            snap = snapshots.get(rid)
+            if snap is None or not snap.exists:
+                conflicts[rid] = "Phòng không tồn tại"
+                continue
+            reason = _hold_refusal(snap.to_dict(), user_session_id, now)
+            if reason:
+                conflicts[rid] = reason
+        if conflicts:
+            return False, conflicts
+
+        # Ghi datetime có tzinfo để Firestore lưu đúng UTC (_to_local_naive đổi lại khi đọc)
+        expire_time = (now + timedelta(minutes=duration_minutes)).astimezone()
+        for ref in room_refs:
+            transaction.update(ref, {
+                "status": RoomStatus.TEMP_LOCKED.value,
+                "locked_until": expire_time,
+                "locked_by": user_session_id
+            })
+        trigger_system_update(SCOPE_ROOMS, writer=transaction)
+        return True, room_ids
+
+    try:
+        success, result = _hold_in_transaction(db.transaction())
+    except Exception as e:
+        return False, dict.fromkeys(room_ids, str(e))
+    if success:
+        _versions_committed()
+        sweeper = _get_hold_sweeper()
+        if sweeper is not None:
+            expires = datetime.now() + timedelta(minutes=duration_minutes)
+            for rid in room_ids:
+                sweeper.schedule(rid, expires)
+    return success, result
 
 def hold_room(room_id: str, user_session_id: str, duration_minutes: int = 5) -> tuple[bool, str]:
     """
-    Cố gắng giữ phòng trong `duration_minutes`.
-    - Sử dụng Transaction để đảm bảo tính toàn vẹn.
+    Cố gắng giữ phòng trong `duration_minutes` (xem `hold_rooms`).
     - Trả về (True, "Success") hoặc (False, "Lỗi...").
     """
     if not room_id: return False, "Missing room_id"
     if not user_session_id: return False, "Missing session_id"
 
+    success, result = hold_rooms([room_id], user_session_id, duration_minutes)
+    if success:
+        return True, "Giữ phòng thành công"
+    return False, result[room_id]
+
+def _held_by(snap, user_session_id: str) -> bool:
+    """Phòng (snapshot đọc trong transaction) đang TEMP_LOCKED bởi đúng session này."""
+    if snap is None or not snap.exists:
+        return False
+    data = snap.to_dict()
+    return data.get("status") == RoomStatus.TEMP_LOCKED and data.get("locked_by") == user_session_id
+
+def renew_room_holds(room_ids: list, user_session_id: str, duration_minutes: int = 5) -> list:
+    """
+    Gia hạn (heartbeat) các phòng vẫn đang được session này giữ: chỉ đổi locked_until, 1 transaction.
+    Không tăng version rooms (trạng thái phòng không đổi; transaction đặt / giữ phòng luôn đọc lại hạn giữ).
+    Trả về danh sách phòng đã gia hạn (phòng đã bị nhả / người khác giữ thì bỏ qua).
+    """
+    room_ids = list(dict.fromkeys(rid for rid in room_ids if rid))
+    if not room_ids or not user_session_id:
+        return []
+
     db = get_db()
-    room_ref = db.collection("rooms").document(room_id)
+    room_refs = [db.collection("rooms").document(rid) for rid in room_ids]
 
-    @firestore.transactional
-    def _hold_in_transaction(transaction, ref, uid, duration):
-        snapshot = ref.get(transaction=transaction)
-        if not snapshot.exists:
-            return False, "Phòng không tồn tại"
-        
-        data = snapshot.to_dict()
-        status = data.get("status")
-        current_lock_owner = data.get("locked_by")
-        
-        now = datetime.now()
-        
-        # Case 1: Phòng đang AVAILABLE -> Lock được
-        if status == RoomStatus.AVAILABLE or status == "Trống":
-            pass # OK to lock
-            
-        # Case 2: Phòng đang TEMP_LOCKED
-        elif status == RoomStatus.TEMP_LOCKED or status == "Đang thao tác":
-            # Nếu là chính mình đang lock -> Gia hạn
-            if current_lock_owner == uid:
-                pass # OK to extend
-            else:
-                # Nếu người khác lock, kiểm tra hết hạn chưa
-                locked_until = data.get("locked_until")
-                if locked_until:
-                    if locked_until.tzinfo: locked_until = locked_until.replace(tzinfo=None)
-                    
-                    if locked_until > now:
-                        return False, "Phòng đang được người khác giữ"
-                # Nếu hết hạn -> Cướp lock (OK)
-                
-        # Case 3: Phòng đang Bận (Occupied, Reserved, Dirty...)
-        else:
-            return False, f"Phòng đang bận ({status})"
-
-        # Thực hiện Lock
-        expire_time = now + timedelta(minutes=duration)
-        transaction.update(ref, {
-            "status": RoomStatus.TEMP_LOCKED.value,
-            "locked_until": expire_time,
-            "locked_by": uid
-        })
-        return True, "Giữ phòng thành công"
+    @storage.transactional
+    def _renew_in_transaction(transaction):
+        snapshots = {snap.id: snap for snap in transaction.get_all(room_refs)}
+        owned = [rid for rid in room_ids if _held_by(snapshots.get(rid), user_session_id)]
+        expire_time = (datetime.now() + timedelta(minutes=duration_minutes)).astimezone()
+        for rid in owned:
+            transaction.update(snapshots[rid].reference, {"locked_until": expire_time})
+        return owned
 
     try:
-        transaction = db.transaction()
-        success, msg = _hold_in_transaction(transaction, room_ref, user_session_id, duration_minutes)
-        if success:
-            trigger_system_update()
-        return success, msg
+        renewed = _renew_in_transaction(db.transaction())
     except Exception as e:
-        return False, str(e)
+        print(f"⚠️ Failed to renew room holds: {e}")
+        return []
+    sweeper = _get_hold_sweeper()
+    if sweeper is not None:
+        expires = datetime.now() + timedelta(minutes=duration_minutes)
+        for rid in renewed:
+            sweeper.schedule(rid, expires)
+    return renewed
+
+def release_room_holds(room_ids: list, user_session_id: str) -> list:
+    """
+    Nhả (Huỷ giữ) các phòng đang được giữ bởi user này, 1 transaction + 1 lần tăng version.
+    Phòng không còn do user này giữ thì bỏ qua. Trả về danh sách phòng đã nhả.
+    """
+    room_ids = list(dict.fromkeys(rid for rid in room_ids if rid))
+    if not room_ids or not user_session_id:
+        return []
+
+    db = get_db()
+    room_refs = [db.collection("rooms").document(rid) for rid in room_ids]
+
+    @storage.transactional
+    def _release_in_transaction(transaction):
+        snapshots = {snap.id: snap for snap in transaction.get_all(room_refs)}
+        # Chỉ nhả nếu đang LOCKED và đúng chủ
+        released = [rid for rid in room_ids if _held_by(snapshots.get(rid), user_session_id)]
+        for rid in released:
+            transaction.update(snapshots[rid].reference, {
+                "status": RoomStatus.AVAILABLE.value,
+                "locked_until": firestore.DELETE_FIELD,
+                "locked_by": firestore.DELETE_FIELD
+            })
+        if released:
+            trigger_system_update(SCOPE_ROOMS, writer=transaction)
+        return released
+
+    try:
+        released = _release_in_transaction(db.transaction())
+    except Exception as e:
+        print(f"Error releasing rooms: {e}")
+        return []
+    if released:
+        _versions_committed()
+    return released
 
 def release_room_hold(room_id: str, user_session_id: str):
     """
     Nhả phòng (Huỷ giữ) nếu đang được giữ bởi user này.
     """
     if not room_id or not user_session_id: return
-    
-    db = get_db()
-    room_ref = db.collection("rooms").document(room_id)
-    
+    return bool(release_room_holds([room_id], user_session_id))
+
+HOLD_LEASES_KEY = "_hold_leases"
+
+def get_hold_leases(user_session_id: str) -> HoldLeaseManager:
+    """
+    Lease giữ phòng của session Streamlit hiện tại (lưu trong st.session_state).
+    Session kết thúc -> manager bị thu hồi -> nhả các phòng còn giữ.
+    """
+    leases = st.session_state.get(HOLD_LEASES_KEY)
+    if leases is None or leases.session_id != user_session_id:
+        if leases is not None:
+            leases.release_all()
+        leases = HoldLeaseManager(
+            user_session_id,
+            acquire=hold_rooms,
+            renew=renew_room_holds,
+            release=release_room_holds,
+            lease_minutes=AppConfig.HOLD_LEASE_MINUTES,
+            renew_margin_seconds=AppConfig.HOLD_RENEW_MARGIN_SECONDS,
+            max_minutes=AppConfig.HOLD_MAX_MINUTES,
+        )
+        st.session_state[HOLD_LEASES_KEY] = leases
+    return leases
+
+def _release_holds_of_other_pages(page: str):
+    """Rời trang đã giữ phòng (chuyển sang trang khác) -> nhả các phòng session đang giữ."""
     try:
-        doc = room_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
-            # Chỉ nhả nếu đang LOCKED và đúng chủ
-            if (data.get("status") == RoomStatus.TEMP_LOCKED and 
-                data.get("locked_by") == user_session_id):
-                
-                room_ref.update({
-                    "status": RoomStatus.AVAILABLE.value,
-                    "locked_until": firestore.DELETE_FIELD,
-                    "locked_by": firestore.DELETE_FIELD
-                })
-                trigger_system_update()
-                return True
-    except Exception as e:
-        print(f"Error releasing room: {e}")
-    return False
+        leases = st.session_state.get(HOLD_LEASES_KEY)
+    except Exception:
+        return
+    if leases is not None and leases.page not in (None, page) and leases.held():
+        leases.release_all()
 
 def delete_room(room_id: str):
     """Xóa phòng"""
     db = get_db()
     if room_id:
-        db.collection("rooms").document(room_id).delete()
+        batch = db.batch()
+        batch.delete(db.collection("rooms").document(room_id))
+        trigger_system_update(SCOPE_ROOMS, writer=batch)
+        batch.commit()
+        _versions_committed()
+# --- LỊCH TRỐNG (AVAILABILITY) ---
+
+def _build_availability_index():
+    return AvailabilityIndex(get_all_rooms(), get_active_bookings_dict())
+
+def get_availability_index() -> AvailabilityIndex:
+    """Index lịch trống (booking Đã đặt / Đang ở, bảo trì, giữ chỗ) dùng chung toàn process."""
+    store = _get_snapshot_store()
+    versions = store.clock.get()
+    return store.availability.get((versions[SCOPE_ROOMS], versions[SCOPE_BOOKINGS]))
+
+def check_room_availability(
+    room_ids: list,
+    check_in: datetime,
+    check_out: datetime,
+    session_id: str | None = None,
+    starts_now: bool | None = None,
+) -> dict:
+    """
+    Kiểm tra các phòng có trống cho [check_in, check_out) không.
+    Trả về {room_id: lý do} cho các phòng KHÔNG đặt được (dict rỗng = tất cả đều trống).
+    """
+    index = get_availability_index()
+    now = datetime.now()
+    conflicts = {}
+    for room_id in room_ids:
+        reason = index.conflict(room_id, check_in, check_out, session_id, starts_now, now)
+        if reason:
+            conflicts[room_id] = reason
+    return conflicts
+
+def _mode_enabled(room_type: dict, booking_mode) -> bool:
+    """Loại phòng có cho phép loại hình thuê này không (pricing.enable_hourly / overnight / daily)."""
+    value = booking_mode.value if hasattr(booking_mode, "value") else booking_mode
+    flag = {
+        BookingType.HOURLY.value: "enable_hourly",
+        BookingType.OVERNIGHT.value: "enable_overnight",
+        BookingType.DAILY.value: "enable_daily",
+    }.get(value)
+    return flag is None or (room_type.get("pricing") or {}).get(flag, True)
+
+def search_available_rooms(
+    check_in: datetime,
+    check_out: datetime,
+    booking_mode=None,
+    type_code: str | None = None,
+    area: str | None = None,
+    session_id: str | None = None,
+    starts_now: bool | None = None,
+) -> dict:
+    """
+    Tìm phòng trống cho [check_in, check_out) từ index lịch trống (không query Firestore khi index còn mới).
+    - booking_mode: chỉ lấy loại phòng cho phép loại hình thuê này.
+    - type_code / area: lọc theo loại phòng / khu vực (field `floor`).
+    - Phòng đang được `session_id` giữ vẫn được tính là trống.
+    Trả về {"rooms": [room, ...], "counts": {type_code: số phòng trống}}.
+    """
+    index = get_availability_index()
+    type_codes = [type_code] if type_code else None
+    if booking_mode is not None:
+        enabled = {t.get("type_code") for t in get_all_room_types() if _mode_enabled(t, booking_mode)}
+        type_codes = [c for c in (type_codes or enabled) if c in enabled]
+    room_ids = index.free_rooms(
+        check_in, check_out, type_codes=type_codes, area=area, session_id=session_id, starts_now=starts_now
+    )
+    rooms = [dict(index.rooms[rid]) for rid in room_ids]
+    counts = {}
+    for room in rooms:
+        counts[room.get("room_type_code")] = counts.get(room.get("room_type_code"), 0) + 1
+    return {"rooms": rooms, "counts": counts}
+
 # --- LOGIC BOOKING (CHECK-IN) ---
 
-def create_booking(booking: Booking, is_checkin_now: bool):
+def _is_room_bookable(data: dict, session_id: str | None, now: datetime, starts_now: bool = True) -> tuple[bool, str]:
+    """
+    Phòng nhận booking được nếu: không bị người khác giữ, không bảo trì, và nếu khách nhận phòng ngay
+    thì phòng phải Trống / Đặt trước (cho lịch sau) / đang được giữ bởi chính session này.
+    Trùng lịch theo thời gian do index lịch trống kiểm tra (check_room_availability).
     """
-    Tạo booking mới.
+    status = data.get("status")
+    if status == RoomStatus.TEMP_LOCKED:
+        if session_id and data.get("locked_by") == session_id:
+            return True, ""
+        locked_until = _to_local_naive(data.get("locked_until"))
+        if locked_until is None or locked_until < now:
+            return True, ""
+        return False, "đang được người khác giữ"
+    if status == RoomStatus.AVAILABLE or status in ("AVAILABLE", "available"):
+        return True, ""
+    if status == RoomStatus.MAINTENANCE:
+        return False, "đang bảo trì"
+    if starts_now and status not in (RoomStatus.RESERVED, RoomStatus.PENDING_PAYMENT):
+        return False, f"đang bận ({status})"
+    return True, ""
+
+def create_bookings(bookings: list[Booking], is_checkin_now: bool, session_id: str | None = None):
+    """
+    Tạo nhiều booking (khách đoàn) trong 1 transaction: tất cả cùng thành công hoặc không cái nào.
+    - Kiểm tra lịch trống theo [check_in, check_out_expected) (index lịch trống) và trạng thái từng phòng
+      (không bị người khác giữ / bảo trì) trước khi ghi.
+    - Trong transaction đọc lại phòng + các booking đang hoạt động của phòng (optimistic concurrency):
+      2 lễ tân / khách online đặt cùng lúc thì chỉ 1 người thành công, người sau nhận BookingConflictError
+      (trả về dạng (False, "Phòng ... đã có lịch ...")) thay vì ghi đè current_booking_id.
     - Nếu is_checkin_now = True: Phòng -> OCCUPIED (Đang ở)
-    - Nếu is_checkin_now = False: Phòng -> RESERVED (Đặt trước)
+    - Nếu is_checkin_now = False: Phòng -> RESERVED (Đặt trước) / PENDING_PAYMENT (online) khi phòng đang
+      trống hoặc booking mới đến sớm hơn booking phòng đang trỏ tới; ngược lại booking được xếp lịch sau
+      (phòng giữ nguyên trạng thái, được chuyển sang booking này khi trả phòng).
+    - Đánh dấu các ngày ở lên lịch tồn phòng (inventory_calendar) trong cùng transaction.
+    - Chỉ tăng version (rooms, bookings) 1 lần cho cả đoàn.
+    Trả về (True, [booking_id, ...]) hoặc (False, "Lỗi...").
     """
+    if not bookings:
+        return False, "Chưa chọn phòng"
+    room_ids = [b.room_id for b in bookings]
+    if len(set(room_ids)) != len(room_ids):
+        return False, "Trùng phòng trong danh sách đặt"
+
     db = get_db()
-    
-    if not booking.id:
-        booking.id = str(uuid.uuid4())[:8]
-    
-    # Xác định trạng thái
-    if is_checkin_now:
-        booking.status = BookingStatus.CHECKED_IN
-        room_status = RoomStatus.OCCUPIED.value
-    else:
-        booking.status = BookingStatus.CONFIRMED
-        # Nếu là booking online, phòng trước tiên ở trạng thái CHỜ THANH TOÁN
-        if getattr(booking, "is_online", False):
-            room_status = RoomStatus.PENDING_PAYMENT.value
+    booking_docs = []
+    for booking in bookings:
+        if not booking.id:
+            booking.id = str(uuid.uuid4())[:8]
+
+        # Xác định trạng thái
+        if is_checkin_now:
+            booking.status = BookingStatus.CHECKED_IN
+            room_status = RoomStatus.OCCUPIED.value
         else:
-            room_status = RoomStatus.RESERVED.value
+            booking.status = BookingStatus.CONFIRMED
+            # Nếu là booking online, phòng trước tiên ở trạng thái CHỜ THANH TOÁN
+            if getattr(booking, "is_online", False):
+                room_status = RoomStatus.PENDING_PAYMENT.value
+            else:
+                room_status = RoomStatus.RESERVED.value
+        booking_docs.append((booking, room_status))
+
+    index = get_availability_index()
+    now = datetime.now()
+    for booking in bookings:
+        reason = index.conflict(
+            booking.room_id, booking.check_in, booking.check_out_expected, session_id,
+            starts_now=is_checkin_now or None, now=now,
+        )
+        if reason:
+            return False, f"Phòng {booking.room_id} {reason}"
+
+    room_refs = [db.collection("rooms").document(rid) for rid in room_ids]
+
+    @storage.transactional
+    def _create_in_transaction(transaction):
+        now = datetime.now()
+        snapshots = {snap.id: snap for snap in transaction.get_all(room_refs)}
+        room_updates, calendar_changes = [], []
+        for (booking, room_status), ref in zip(booking_docs, room_refs):
+            rid = booking.room_id
+            snap = snapshots.get(rid)
+            if snap is None or not snap.exists:
+                return False, f"Phòng {rid} không tồn tại"
+            data = snap.to_dict()
+            starts_now = is_checkin_now or _wall_time(booking.check_in) <= now
+            ok, reason = _is_room_bookable(data, session_id, now, starts_now)
+            if not ok:
+                raise BookingConflictError(rid, reason)
+            _check_overlap_in_transaction(
+                transaction, rid, data, booking.id, booking.check_in, booking.check_out_expected,
+                session_id, starts_now, now,
+            )
+            room_updates.append((ref, _room_update_for_booking(transaction, data, booking, room_status, starts_now)))
+            calendar_changes.append(InventoryChange(
+                data.get("floor"), rid, booking.id, (),
+                inventory.stay_days(booking.check_in, booking.check_out_expected), _inventory_code(room_status),
+            ))
+        calendar_docs = _read_inventory(transaction, calendar_changes)
+
+        for (booking, _), (ref, update) in zip(booking_docs, room_updates):
+            transaction.set(db.collection("bookings").document(booking.id), booking.to_dict())
+            if update:
+                transaction.update(ref, update)
+        _write_inventory(transaction, calendar_docs, calendar_changes)
+        # Danh bạ khách: 1 lượt ghé cho mỗi lần đặt (khách đoàn nhiều phòng vẫn tính 1 lượt)
+        seen_phones = set()
+        for booking, _ in booking_docs:
+            phone = normalize_phone(booking.customer_phone)
+            if phone and phone not in seen_phones:
+                seen_phones.add(phone)
+                _upsert_customer(transaction, booking, now, visits=1)
+        trigger_system_update(SCOPE_ROOMS, SCOPE_BOOKINGS, writer=transaction)
+        return True, [b.id for b in bookings]
 
-    booking_data = booking.to_dict()
-    
     try:
-        # 1. Lưu Booking
-        db.collection("bookings").document(booking.id).set(booking_data)
-        
-        # 2. Update trạng thái phòng
-        db.collection("rooms").document(booking.room_id).update({
-            "status": room_status,
-            "current_booking_id": booking.id
-        })
-        trigger_system_update()
-        return True, booking.id
+        success, result = _create_in_transaction(db.transaction())
+        if success:
+            _versions_committed()
+        return success, result
+    except BookingConflictError as e:
+        return False, str(e)
     except Exception as e:
         return False, str(e)
 
+def _check_overlap_in_transaction(
+    transaction, room_id: str, room: dict, booking_id: str, check_in: datetime, check_out: datetime,
+    session_id, starts_now: bool, now: datetime,
+):
+    """
+    Đọc lại (trong transaction) các booking đang hoạt động của phòng và kiểm tra trùng lịch với
+    [check_in, check_out) của booking `booking_id` (booking mới / đang gia hạn).
+    Query được ghi vào read-set: transaction khác thêm booking cho phòng này trước khi commit
+    -> transaction bị hủy và chạy lại, lần chạy lại thấy lịch trùng -> BookingConflictError.
+    """
+    query = get_db().collection("bookings")\
+        .where("room_id", "==", room_id)\
+        .where("status", "in", ACTIVE_BOOKING_STATUSES)
+    existing = [dict(doc.to_dict(), id=doc.id) for doc in transaction.get(query) if doc.id != booking_id]
+    index = AvailabilityIndex([dict(room, id=room_id)], existing, now=now)
+    reason = index.conflict(room_id, check_in, check_out, session_id, starts_now, now)
+    if reason:
+        raise BookingConflictError(room_id, reason)
+
+def _next_reservation_in_transaction(transaction, room_id: str, exclude: str, now: datetime):
+    """
+    booking_id của lịch đặt trước kế tiếp của phòng (đọc trong transaction, không dùng index lịch trống
+    của process vì có thể cũ / thiếu booking của process khác). Chỉ tính booking có check_in >= `now`:
+    booking đặt trước đã quá giờ nhận (khách đến trễ / không đến) không được gắn lại vào phòng.
+    Query nằm trong read-set: có booking mới / bị hủy cho phòng trước khi commit -> transaction chạy lại.
+    """
+    query = get_db().collection("bookings")\
+        .where("room_id", "==", room_id)\
+        .where("status", "in", RESERVED_BOOKING_STATUSES)\
+        .where("check_in", ">=", now)\
+        .order_by("check_in")\
+        .limit(2)
+    for doc in transaction.get(query):
+        if doc.id != exclude:
+            return doc.id
+    return None
+
+def _room_update_for_booking(transaction, room: dict, booking: Booking, room_status: str, starts_now: bool) -> dict:
+    """
+    Cập nhật document phòng khi thêm booking:
+    - Nhận phòng ngay / phòng đang trống (hoặc đang giữ): phòng trỏ sang booking mới.
+    - Phòng đang Đặt trước cho booking đến muộn hơn: booking mới (sớm hơn) thành booking hiện hành.
+    - Còn lại (phòng đang có khách / chưa dọn, booking mới ở sau): giữ nguyên phòng, chỉ nhả giữ chỗ.
+    """
+    claim = {
+        "status": room_status,
+        "current_booking_id": booking.id,
+        "locked_until": firestore.DELETE_FIELD,
+        "locked_by": firestore.DELETE_FIELD,
+    }
+    status = room.get("status")
+    if starts_now or status in (RoomStatus.AVAILABLE, RoomStatus.TEMP_LOCKED, "AVAILABLE", "available"):
+        return claim
+    current_id = room.get("current_booking_id")
+    if status in (RoomStatus.RESERVED, RoomStatus.PENDING_PAYMENT) and current_id:
+        current = get_db().collection("bookings").document(current_id).get(transaction=transaction)
+        current_check_in = _wall_time(current.to_dict().get("check_in")) if current.exists else None
+        if current_check_in is None or _wall_time(booking.check_in) < current_check_in:
+            return claim
+    return {}
+
+def create_booking(booking: Booking, is_checkin_now: bool, session_id: str | None = None):
+    """
+    Tạo booking mới (1 phòng). Xem `create_bookings`.
+    Trả về (True, booking_id) hoặc (False, "Lỗi...").
+    """
+    success, result = create_bookings([booking], is_checkin_now, session_id=session_id)
+    if success:
+        return True, result[0]
+    return False, result
+
 def get_active_booking(room_id: str):
     """Lấy booking đang active của phòng này (nếu có)"""
     db = get_db()
@@ -332,23 +979,111 @@ def get_active_booking(room_id: str):
     return None
 
 def cancel_booking(booking_id: str):
-    """Hủy booking"""
+    """
+    Hủy booking (1 transaction): booking -> "cancelled", nhả các ngày trên lịch tồn phòng.
+    Phòng đang Đặt trước / Chờ thanh toán cho booking này -> trỏ sang lịch đặt trước kế tiếp (nếu có)
+    hoặc Trống.
+    """
     db = get_db()
-    if booking_id:
-        db.collection("bookings").document(booking_id).update({
-            "status": "cancelled"
-        })
+    if not booking_id:
+        return False
+    booking_ref = db.collection("bookings").document(booking_id)
+
+    @storage.transactional
+    def _cancel_in_transaction(transaction):
+        snapshot = booking_ref.get(transaction=transaction)
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data or data.get("status") not in ACTIVE_BOOKING_STATUSES or not data.get("room_id"):
+            return False
+        room_ref = db.collection("rooms").document(data["room_id"])
+        room_snap = room_ref.get(transaction=transaction)
+        room = (room_snap.to_dict() or {}) if room_snap.exists else {}
+        calendar_changes = [InventoryChange(
+            room.get("floor"), data.get("room_id"), booking_id,
+            inventory.stay_days(data.get("check_in"), data.get("check_out_expected")),
+        )] if room_snap.exists else []
+        calendar_docs = _read_inventory(transaction, calendar_changes)
+
+        relink = room.get("current_booking_id") == booking_id and room.get("status") in (RoomStatus.RESERVED, RoomStatus.PENDING_PAYMENT)
+        next_booking_id = _next_reservation_in_transaction(transaction, data["room_id"], booking_id, datetime.now()) if relink else None
+
+        transaction.update(booking_ref, {"status": "cancelled"})
+        if relink:
+            transaction.update(room_ref, {
+                "status": RoomStatus.RESERVED.value if next_booking_id else RoomStatus.AVAILABLE.value,
+                "current_booking_id": next_booking_id or firestore.DELETE_FIELD,
+            })
+        _write_inventory(transaction, calendar_docs, calendar_changes)
+        trigger_system_update(SCOPE_ROOMS, SCOPE_BOOKINGS, writer=transaction)
         return True
-    return False
+
+    try:
+        ok = _cancel_in_transaction(db.transaction())
+    except Exception as e:
+        print(f"⚠️ Failed to cancel booking {booking_id}: {e}")
+        return False
+    if ok:
+        _versions_committed()
+    return ok
+
+def extend_booking(booking_id: str, new_check_out: datetime, session_id: str | None = None):
+    """
+    Gia hạn / rút ngắn giờ trả dự kiến của booking đang hoạt động (1 transaction):
+    kiểm tra trùng lịch với các booking khác của phòng (BookingConflictError), cập nhật
+    check_out_expected và lịch tồn phòng. Tiền phòng tính lại lúc trả phòng từ rate plan đã lưu.
+    Trả về (True, "...") hoặc (False, "Lỗi...").
+    """
+    db = get_db()
+    booking_ref = db.collection("bookings").document(booking_id)
+
+    @storage.transactional
+    def _extend_in_transaction(transaction):
+        snapshot = booking_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return False, "Không tìm thấy booking"
+        data = snapshot.to_dict()
+        if data.get("status") not in ACTIVE_BOOKING_STATUSES:
+            return False, "Booking không còn hoạt động"
+        check_in = _wall_time(data.get("check_in"))
+        if new_check_out <= check_in:
+            return False, "Giờ trả phải sau giờ nhận"
+        room_id = data.get("room_id")
+        room_snap = db.collection("rooms").document(room_id).get(transaction=transaction)
+        room = (room_snap.to_dict() or {}) if room_snap.exists else {}
+        now = datetime.now()
+        # Khách đã ở / sắp ở: không đòi phòng "sẵn sàng", chỉ kiểm tra trùng lịch + giữ chỗ
+        _check_overlap_in_transaction(
+            transaction, room_id, room, booking_id, check_in, new_check_out, session_id, False, now,
+        )
+        calendar_changes = [InventoryChange(
+            room.get("floor"), room_id, booking_id,
+            inventory.stay_days(data.get("check_in"), data.get("check_out_expected")),
+            inventory.stay_days(data.get("check_in"), new_check_out), inventory.booking_code(data),
+        )]
+        calendar_docs = _read_inventory(transaction, calendar_changes)
+
+        transaction.update(booking_ref, {"check_out_expected": new_check_out})
+        _write_inventory(transaction, calendar_docs, calendar_changes)
+        trigger_system_update(SCOPE_BOOKINGS, writer=transaction)
+        return True, f"Đã đổi giờ trả sang {new_check_out.strftime('%H:%M %d/%m/%Y')}"
+
+    try:
+        success, msg = _extend_in_transaction(db.transaction())
+    except BookingConflictError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, str(e)
+    if success:
+        _versions_committed()
+    return success, msg
 # ... (Giữ nguyên code cũ) ...
 
 # --- LOGIC CHECK-OUT ---
 
 def get_occupied_rooms():
     """Lấy danh sách các phòng đang có khách (Occupied)"""
-    db = get_db()
-    docs = db.collection("rooms").where("status", "==", "Đang ở").stream()
-    return [doc.to_dict() for doc in docs]
+    # Lọc từ snapshot chung thay vì query riêng
+    return [r for r in get_all_rooms() if r.get("status") == RoomStatus.OCCUPIED]
 
 def get_booking_by_id(booking_id: str):
     """Lấy thông tin chi tiết booking"""
@@ -360,47 +1095,359 @@ def get_booking_by_id(booking_id: str):
 
 def process_checkout(booking_id: str, room_id: str, final_amount: float, payment_method: str, note: str, service_fee: float = 0.0):
     """
-    Xử lý trả phòng:
+    Xử lý trả phòng (1 transaction):
     1. Update Booking: status='Completed', set actual_check_out, final_amount, service_fee
-    2. Update Room: status='Chưa dọn' (DIRTY) - cần dọn mới bán được tiếp
+    2. Update Room: status='Chưa dọn' (DIRTY) - cần dọn mới bán được tiếp; current_booking_id -> lịch đặt
+       trước kế tiếp của phòng (nếu có)
+    3. Cộng dồn doanh thu vào rollup ngày / tháng (revenue_daily, revenue_monthly)
+    4. Lịch tồn phòng: nhả các ngày từ hôm nay trở đi
     """
     db = get_db()
+    booking_ref = db.collection("bookings").document(booking_id)
+    room_ref = db.collection("rooms").document(room_id)
     try:
-        # Tự động tính lại tổng tiền dịch vụ (Service Orders) nếu có
-        # Lưu ý: final_amount truyền vào có thể đã bao gồm service_fee nếu UI tính rồi.
-        # Nhưng để chắc chắn, ta có thể lưu riêng field 'order_service_total' vào booking.
-        
         # Ở đây ta giả định final_amount là TỔNG CỘNG (nguyên tiền phòng + dịch vụ).
-        # Nhưng ta nên lưu thêm thông tin service_fee (phụ thu) và order_service_total (tiền gọi món).
-        
-        total_service_orders = calculate_service_total(booking_id)
-        
-        # Update Booking
-        db.collection("bookings").document(booking_id).update({
-            "status": "Completed",
-            "check_out_actual": datetime.now(),
-            "total_amount": final_amount, 
-            "service_fee": service_fee, # Phụ thu khác
-            "order_service_total": total_service_orders, # Tiền gọi món
-            "payment_method": payment_method,
-            "note": note
-        })
-        
-        # Update Room
-        db.collection("rooms").document(room_id).update({
-            "status": RoomStatus.DIRTY, # Chuyển sang dơ để dọn dẹp
-            "current_booking_id": firestore.DELETE_FIELD # Xóa link booking
-        })
-        trigger_system_update()
-        return True, "Thanh toán thành công"
+        # Lưu thêm service_fee (phụ thu) và order_service_total (tiền gọi món).
+        @storage.transactional
+        def _checkout_in_transaction(transaction):
+            snapshot = booking_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False, "Booking không tồn tại"
+            # Chống trả phòng 2 lần (double click) -> không cộng doanh thu 2 lần
+            booking_data = snapshot.to_dict()
+            if booking_data.get("status") in COMPLETED_BOOKING_STATUSES:
+                return False, "Booking đã được thanh toán"
+            # Tổng tiền gọi món đã cộng dồn sẵn trên booking (add_service_order)
+            total_service_orders = get_booking_service_total(booking_data)
+
+            now = datetime.now()
+            # Lịch tồn phòng: giữ các đêm đã ở (lịch sử), nhả từ hôm nay trở đi
+            room_snap = room_ref.get(transaction=transaction)
+            room_data = (room_snap.to_dict() or {}) if room_snap.exists else {}
+            stayed = [d for d in inventory.stay_days(booking_data.get("check_in"), now) if d < now.date()]
+            calendar_changes = [InventoryChange(
+                room_data.get("floor"), room_id, booking_id,
+                inventory.stay_days(booking_data.get("check_in"), booking_data.get("check_out_expected")),
+                stayed, inventory.OCCUPIED,
+            )]
+            calendar_docs = _read_inventory(transaction, calendar_changes)
+            # Lịch đặt trước kế tiếp của phòng (nếu có) thành booking hiện hành của phòng sau khi trả
+            next_booking_id = _next_reservation_in_transaction(transaction, room_id, booking_id, now)
+
+            transaction.update(booking_ref, {
+                "status": "Completed",
+                "check_out_actual": now,
+                "total_amount": final_amount, 
+                "service_fee": service_fee, # Phụ thu khác
+                "order_service_total": total_service_orders, # Tiền gọi món
+                "payment_method": payment_method,
+                "note": note
+            })
+            transaction.update(room_ref, {
+                "status": RoomStatus.DIRTY, # Chuyển sang dơ để dọn dẹp
+                # Trỏ sang lịch đặt trước kế tiếp (dọn xong -> Đặt trước), không có thì xóa link booking
+                "current_booking_id": next_booking_id or firestore.DELETE_FIELD
+            })
+            _add_revenue_rollup(transaction, now, final_amount, service_fee, payment_method)
+            _write_inventory(transaction, calendar_docs, calendar_changes)
+            if normalize_phone(booking_data.get("customer_phone")):
+                _upsert_customer(transaction, booking_data, now, spend=final_amount)
+            trigger_system_update(SCOPE_ROOMS, SCOPE_BOOKINGS, writer=transaction)
+            return True, "Thanh toán thành công"
+
+        success, msg = _checkout_in_transaction(db.transaction())
+        if success:
+            _versions_committed()
+        return success, msg
+    except Exception as e:
+        return False, str(e)
+
+# --- ROLLUP DOANH THU (NGÀY / THÁNG) ---
+
+def _add_revenue_rollup(writer, checkout_dt: datetime, total_amount: float, service_fee: float, payment_method: str):
+    """Cộng 1 bill vào doc ngày + doc tháng (writer = transaction hoặc batch)."""
+    db = get_db()
+    total = float(total_amount or 0.0)
+    service = float(service_fee or 0.0)
+    day_key = checkout_dt.strftime("%Y-%m-%d")
+    month_key = checkout_dt.strftime("%Y-%m")
+    increments = {
+        "total_revenue": firestore.Increment(total),
+        "room_revenue": firestore.Increment(total - service),
+        "service_revenue": firestore.Increment(service),
+        "bill_count": firestore.Increment(1),
+        "by_payment_method": {payment_method or "Chưa rõ": firestore.Increment(total)},
+    }
+    writer.set(db.collection(REVENUE_DAILY).document(day_key),
+               {"date": day_key, "month": month_key, **increments}, merge=True)
+    writer.set(db.collection(REVENUE_MONTHLY).document(month_key),
+               {"month": month_key, **increments}, merge=True)
+
+def _empty_revenue() -> dict:
+    return {
+        "total_revenue": 0.0,
+        "room_revenue": 0.0,
+        "service_revenue": 0.0,
+        "bill_count": 0,
+        "by_payment_method": {},
+    }
+
+def _accumulate_revenue(target: dict, source: dict):
+    for k in ("total_revenue", "room_revenue", "service_revenue", "bill_count"):
+        target[k] += source.get(k) or 0
+    for method, amount in (source.get("by_payment_method") or {}).items():
+        target["by_payment_method"][method] = target["by_payment_method"].get(method, 0.0) + (amount or 0.0)
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def get_revenue_summary(start_date: date, end_date: date, group_by: str = "day") -> dict:
+    """
+    Tổng hợp doanh thu trong khoảng [start_date, end_date] từ rollup, không quét bookings.
+    - group_by="day": đọc doc ngày trong khoảng (1 tháng = tối đa 31 read).
+    - group_by="month": tháng trọn vẹn đọc doc tháng, phần lẻ đầu/cuối khoảng đọc doc ngày.
+    Trả về tổng (total_revenue, room_revenue, service_revenue, bill_count, by_payment_method)
+    và "series" = [{"period": "YYYY-MM-DD" | "YYYY-MM", ...}] theo thứ tự thời gian.
+    """
+    db = get_db()
+    summary = _empty_revenue()
+    series = {}
+
+    def _add(period: str, data: dict):
+        _accumulate_revenue(summary, data)
+        _accumulate_revenue(series.setdefault(period, _empty_revenue()), data)
+
+    def _days(d_from: date, d_to: date):
+        return db.collection(REVENUE_DAILY)\
+            .where("date", ">=", d_from.isoformat())\
+            .where("date", "<=", d_to.isoformat()).stream()
+
+    if start_date > end_date:
+        return {**summary, "series": []}
+
+    if group_by == "month":
+        # Tách khoảng: [lẻ đầu] + [các tháng trọn vẹn] + [lẻ cuối]
+        full_from = start_date if start_date.day == 1 else _next_month(start_date)
+        full_to = _month_start(end_date + timedelta(days=1))  # tháng đầu tiên KHÔNG trọn vẹn ở cuối
+        if full_from < full_to:
+            months = db.collection(REVENUE_MONTHLY)\
+                .where("month", ">=", full_from.strftime("%Y-%m"))\
+                .where("month", "<", full_to.strftime("%Y-%m")).stream()
+            for doc in months:
+                data = doc.to_dict()
+                _add(data.get("month", doc.id), data)
+            partial_ranges = [(start_date, full_from - timedelta(days=1)), (full_to, end_date)]
+        else:
+            partial_ranges = [(start_date, end_date)]
+        for d_from, d_to in partial_ranges:
+            if d_from <= d_to:
+                for doc in _days(d_from, d_to):
+                    data = doc.to_dict()
+                    _add(data.get("month") or doc.id[:7], data)
+    else:
+        for doc in _days(start_date, end_date):
+            data = doc.to_dict()
+            _add(data.get("date", doc.id), data)
+
+    summary["series"] = [{"period": k, **series[k]} for k in sorted(series)]
+    return summary
+
+def _revenue_of_booking(b: dict) -> dict | None:
+    """Số liệu rollup của 1 booking đã trả phòng (None nếu thiếu check_out_actual)."""
+    if not isinstance(b.get("check_out_actual"), datetime):
+        return None
+    total = float(b.get("total_amount") or b.get("price_original") or 0.0)
+    service = float(b.get("service_fee") or 0.0)
+    return {
+        "total_revenue": total,
+        "room_revenue": total - service,
+        "service_revenue": service,
+        "bill_count": 1,
+        "by_payment_method": {b.get("payment_method") or "Chưa rõ": total},
+    }
+
+def _rebuild_revenue_doc(ref, base: dict, start_dt: datetime, end_dt: datetime) -> int:
+    """
+    Tính lại 1 doc rollup (ngày / tháng) từ các booking trả phòng trong [start_dt, end_dt], trong 1 transaction:
+    query bookings nằm trong read-set -> checkout commit xen giữa làm transaction chạy lại, không bị ghi đè mất
+    Increment. Không còn bill -> xóa doc. Trả về số bill.
+    """
+    query = get_db().collection("bookings")\
+        .where("check_out_actual", ">=", start_dt)\
+        .where("check_out_actual", "<=", end_dt)\
+        .select(REVENUE_BOOKING_FIELDS)
+
+    @storage.transactional
+    def _rebuild_in_transaction(transaction):
+        doc = {**base, **_empty_revenue()}
+        for snap in transaction.get(query):
+            bill = _revenue_of_booking(snap.to_dict())
+            if bill:
+                _accumulate_revenue(doc, bill)
+        existing = ref.get(transaction=transaction)
+        if doc["bill_count"]:
+            transaction.set(ref, doc)
+        elif existing.exists:
+            transaction.delete(ref)
+        return doc["bill_count"]
+
+    return _rebuild_in_transaction(get_db().transaction())
+
+def rebuild_revenue_rollups(start_date: date | None = None, end_date: date | None = None):
+    """
+    Tính lại rollup doanh thu từ bookings (backfill dữ liệu cũ / sửa sai lệch).
+    Khoảng thời gian được mở rộng ra trọn tháng để doc tháng luôn đầy đủ.
+    Mỗi doc ngày / tháng được tính lại trong transaction riêng (`_rebuild_revenue_doc`) nên có thể chạy
+    trong giờ làm việc: checkout xảy ra cùng lúc không bị mất.
+    Trả về (True, "...") hoặc (False, "Lỗi...").
+    """
+    db = get_db()
+    start_dt = end_dt = None
+    if start_date:
+        start_date = _month_start(start_date)
+        start_dt = datetime.combine(start_date, datetime.min.time())
+    if end_date:
+        end_date = _next_month(end_date) - timedelta(days=1)
+        end_dt = datetime.combine(end_date, datetime.max.time())
+
+    try:
+        # Các ngày / tháng cần tính lại: có bill trong khoảng, hoặc đang có rollup (có thể đã lệch)
+        days, months = set(), set()
+        for b in get_completed_bookings(start_dt=start_dt, end_dt=end_dt, fields=["check_out_actual"]):
+            ts = b.get("check_out_actual")
+            if isinstance(ts, datetime):
+                ts = ts.replace(tzinfo=None)  # Giữ giờ "tường" như lúc ghi (giống trang Finance)
+                days.add(ts.date())
+                months.add(_month_start(ts.date()))
+        for coll, field, lo, hi in (
+            (REVENUE_DAILY, "date", start_date.isoformat() if start_date else None, end_date.isoformat() if end_date else None),
+            (REVENUE_MONTHLY, "month", start_date.strftime("%Y-%m") if start_date else None, end_date.strftime("%Y-%m") if end_date else None),
+        ):
+            query = db.collection(coll)
+            if lo: query = query.where(field, ">=", lo)
+            if hi: query = query.where(field, "<=", hi)
+            for doc in query.stream():
+                if coll == REVENUE_DAILY:
+                    days.add(date.fromisoformat(doc.id))
+                else:
+                    months.add(datetime.strptime(doc.id, "%Y-%m").date())
+
+        bills = 0
+        for d in sorted(days):
+            day_key = d.isoformat()
+            bills += _rebuild_revenue_doc(
+                db.collection(REVENUE_DAILY).document(day_key), {"date": day_key, "month": d.strftime("%Y-%m")},
+                datetime.combine(d, datetime.min.time()), datetime.combine(d, datetime.max.time()),
+            )
+        for m in sorted(months):
+            month_key = m.strftime("%Y-%m")
+            _rebuild_revenue_doc(
+                db.collection(REVENUE_MONTHLY).document(month_key), {"month": month_key},
+                datetime.combine(m, datetime.min.time()),
+                datetime.combine(_next_month(m) - timedelta(days=1), datetime.max.time()),
+            )
+        return True, f"Đã tính lại {len(days)} ngày / {len(months)} tháng ({bills} bill)"
+    except Exception as e:
+        return False, str(e)
+
+# --- LỊCH TỒN PHÒNG (INVENTORY CALENDAR: phòng x ngày, 1 doc / khu vực / tháng) ---
+
+def _inventory_code(room_status: str) -> str:
+    """Mã ô lịch tương ứng trạng thái phòng khi tạo booking."""
+    if room_status == RoomStatus.OCCUPIED:
+        return inventory.OCCUPIED
+    if room_status == RoomStatus.PENDING_PAYMENT:
+        return inventory.PENDING
+    return inventory.RESERVED
+
+def _read_inventory(transaction, changes: list) -> dict:
+    """Đọc (trong transaction) các doc tháng mà `changes` chạm tới -> {doc_id: doc}."""
+    ids = sorted({key for change in changes for key in change.doc_ids()})
+    if not ids:
+        return {}
+    coll = get_db().collection(inventory.COLLECTION)
+    snapshots = transaction.get_all([coll.document(key) for key in ids])
+    return {snap.id: snap.to_dict() for snap in snapshots if snap.exists}
+
+def _write_inventory(writer, docs: dict, changes: list):
+    """Áp dụng `changes` lên `docs` (đã đọc bằng _read_inventory) và ghi lại các doc tháng bị đổi."""
+    changed = set()
+    for change in changes:
+        changed |= inventory.apply_change(docs, change)
+    coll = get_db().collection(inventory.COLLECTION)
+    for key in sorted(changed):
+        writer.set(coll.document(key), docs[key])
+
+def get_inventory_grid(start: date | None = None, days: int = 90, area: str | None = None) -> InventoryGrid:
+    """
+    Lưới phòng x ngày [start, start + days) từ lịch tồn phòng: đọc (số khu vực x số tháng) doc,
+    không quét bookings. Cache theo version bookings.
+    """
+    start = start or date.today()
+    areas = sorted({r.get("floor") or inventory.NO_AREA for r in get_all_rooms()})
+    if area is not None:
+        areas = [a for a in areas if a == area]
+    ids = tuple(inventory.doc_id(a, m) for a in areas for m in inventory.month_range(start, days))
+    docs = _get_inventory_docs_cached(ids, get_collection_versions()[SCOPE_BOOKINGS])
+    return InventoryGrid(docs, start, days)
+
+@st.cache_data(ttl=300, max_entries=20, show_spinner=False)
+def _get_inventory_docs_cached(doc_ids: tuple, version: int) -> list:
+    db = get_db()
+    coll = db.collection(inventory.COLLECTION)
+    snapshots = db.get_all([coll.document(key) for key in doc_ids])
+    return [snap.to_dict() for snap in snapshots if snap.exists]
+
+def rebuild_inventory_calendar(start: date | None = None, months: int = 4):
+    """
+    Dựng lại lịch tồn phòng `months` tháng kể từ tháng của `start` (mặc định hôm nay) từ các booking
+    đang hoạt động (backfill lần đầu / sửa sai lệch). Trả về (True, "...") hoặc (False, "Lỗi...").
+    """
+    db = get_db()
+    start = _month_start(start or date.today())
+    month_keys = []
+    d = start
+    for _ in range(max(months, 1)):
+        month_keys.append(inventory.month_key(d))
+        d = _next_month(d)
+    try:
+        docs = inventory.build_month_docs(get_all_rooms(), _fetch_active_bookings_dict(), month_keys)
+        coll = db.collection(inventory.COLLECTION)
+        items = sorted(docs.items())
+        for i in range(0, len(items), 400):
+            batch = db.batch()
+            for key, doc in items[i:i + 400]:
+                batch.set(coll.document(key), doc)
+            if i + 400 >= len(items):
+                trigger_system_update(SCOPE_BOOKINGS, writer=batch)
+            batch.commit()
+        _versions_committed()
+        return True, f"Đã dựng lại {len(docs)} lịch tháng ({month_keys[0]} → {month_keys[-1]})"
     except Exception as e:
         return False, str(e)
 
 def update_room_status(room_id: str, new_status: str):
-    """Hàm phụ trợ: Dùng để cập nhật trạng thái phòng (VD: Dọn xong -> Trống)"""
+    """
+    Hàm phụ trợ: Dùng để cập nhật trạng thái phòng (VD: Dọn xong -> Trống).
+    Dọn xong mà phòng còn lịch đặt trước (current_booking_id) -> Đặt trước / Chờ thanh toán.
+    """
     db = get_db()
-    db.collection("rooms").document(room_id).update({"status": new_status})
-    trigger_system_update()
+    room_ref = db.collection("rooms").document(room_id)
+    if new_status == RoomStatus.AVAILABLE:
+        room = room_ref.get()
+        booking_id = (room.to_dict() or {}).get("current_booking_id") if room.exists else None
+        booking = get_booking_by_id(booking_id) if booking_id else None
+        if booking and booking.get("status") in ACTIVE_BOOKING_STATUSES:
+            pending = booking.get("is_online") and booking.get("online_payment_status") != "confirmed"
+            new_status = RoomStatus.PENDING_PAYMENT.value if pending else RoomStatus.RESERVED.value
+    batch = db.batch()
+    batch.update(room_ref, {"status": new_status})
+    trigger_system_update(SCOPE_ROOMS, writer=batch)
+    batch.commit()
+    _versions_committed()
 
 def check_in_reserved_room(room_id: str):
     """
@@ -409,10 +1456,15 @@ def check_in_reserved_room(room_id: str):
     - Update booking.status -> "Đang ở"
     - Lưu lại check_in cũ vào `check_in_reserved` (nếu có) và set check_in = now
     - Update room.status -> "Đang ở"
+    - Lịch tồn phòng: các ngày từ check_in mới -> "Đang ở"
+    Tất cả trong 1 transaction (cùng version rooms / bookings).
     """
     db = get_db()
-    try:
-        room_doc = db.collection("rooms").document(room_id).get()
+    room_ref = db.collection("rooms").document(room_id)
+
+    @storage.transactional
+    def _check_in_transaction(transaction):
+        room_doc = room_ref.get(transaction=transaction)
         if not room_doc.exists:
             return False, "Không tìm thấy phòng"
 
@@ -422,12 +1474,18 @@ def check_in_reserved_room(room_id: str):
             return False, "Phòng đặt trước nhưng thiếu current_booking_id"
 
         bk_ref = db.collection("bookings").document(booking_id)
-        bk_doc = bk_ref.get()
+        bk_doc = bk_ref.get(transaction=transaction)
         if not bk_doc.exists:
             return False, "Không tìm thấy booking của phòng"
 
         bk = bk_doc.to_dict() or {}
         now = datetime.now()
+        calendar_changes = [InventoryChange(
+            room.get("floor"), room_id, booking_id,
+            inventory.stay_days(bk.get("check_in"), bk.get("check_out_expected")),
+            inventory.stay_days(now, bk.get("check_out_expected")), inventory.OCCUPIED,
+        )]
+        calendar_docs = _read_inventory(transaction, calendar_changes)
 
         updates = {
             "status": RoomStatus.OCCUPIED,  # "Đang ở"
@@ -437,74 +1495,88 @@ def check_in_reserved_room(room_id: str):
         if bk.get("check_in") is not None and bk.get("check_in_reserved") is None:
             updates["check_in_reserved"] = bk.get("check_in")
 
-        bk_ref.update(updates)
-
-        db.collection("rooms").document(room_id).update({
+        transaction.update(bk_ref, updates)
+        transaction.update(room_ref, {
             "status": RoomStatus.OCCUPIED,
         })
-        trigger_system_update()
-
+        _write_inventory(transaction, calendar_docs, calendar_changes)
+        trigger_system_update(SCOPE_ROOMS, SCOPE_BOOKINGS, writer=transaction)
         return True, booking_id
+
+    try:
+        success, result = _check_in_transaction(db.transaction())
     except Exception as e:
         return False, str(e)
+    if success:
+        _versions_committed()
+    return success, result
 
 # --- FINANCE / REPORTING ---
 
-def get_all_bookings():
+def _stream_dicts(query, fields: list | None = None) -> list:
+    """
+    stream() -> list dict. `fields`: chỉ lấy các field này (Firestore select()),
+    doc.id luôn được gán vào "id".
+    """
+    if fields:
+        query = query.select(list(fields))
+    results = []
+    for doc in query.stream():
+        data = doc.to_dict() or {}
+        if fields:
+            data.setdefault("id", doc.id)
+        results.append(data)
+    return results
+
+def get_all_bookings(fields: list | None = None):
     """Lấy toàn bộ bookings (CẢNH BÁO: CHỈ DÙNG KHI CẦN THIẾT HOẶC DATA ÍT)."""
     db = get_db()
-    docs = db.collection("bookings").stream()
-    return [doc.to_dict() for doc in docs]
+    return _stream_dicts(db.collection("bookings"), fields)
 
-def get_pending_online_bookings():
+def get_pending_online_bookings(fields: list | None = ONLINE_BOOKING_LIST_FIELDS):
     """
     Lấy danh sách booking online đang chờ xác nhận thanh toán.
-    Filter directly in Firestore.
+    Filter directly in Firestore. Mặc định chỉ lấy field hiển thị (ảnh gốc tải riêng khi xem).
     """
     db = get_db()
     # status = "pending" (chưa up ảnh) hoặc "waiting_confirm" (đã up ảnh)
     # Lưu ý: Cần composite index nếu field 'is_online' và 'online_payment_status' không có.
     # Tuy nhiên query equality + IN thường được support tốt.
     try:
-        docs = db.collection("bookings")\
+        query = db.collection("bookings")\
             .where("is_online", "==", True)\
-            .where("online_payment_status", "in", ["pending", "waiting_confirm"])\
-            .stream()
-        return [doc.to_dict() for doc in docs]
+            .where("online_payment_status", "in", ["pending", "waiting_confirm"])
+        return _stream_dicts(query, fields)
     except Exception as e:
         print(f"⚠️ Query pending bookings failed (Index missing?): {e}")
         # Fallback: load all online (ít hơn load all bookings) rồi filter
-        docs = db.collection("bookings").where("is_online", "==", True).stream()
-        results = []
-        for doc in docs:
-            data = doc.to_dict()
-            if data.get("online_payment_status") in ["pending", "waiting_confirm"]:
-                results.append(data)
-        return results
+        query = db.collection("bookings").where("is_online", "==", True)
+        return [
+            data for data in _stream_dicts(query, fields and fields + ["online_payment_status"])
+            if data.get("online_payment_status") in ["pending", "waiting_confirm"]
+        ]
 
-def get_confirmed_online_bookings(limit: int = 20):
+def get_confirmed_online_bookings(limit: int = 20, fields: list | None = ONLINE_BOOKING_LIST_FIELDS):
     """
     Lấy danh sách booking online đã được xác nhận.
     Sorted by check_in desc, limit 20.
     """
     db = get_db()
     try:
-        docs = db.collection("bookings")\
+        query = db.collection("bookings")\
             .where("is_online", "==", True)\
             .where("online_payment_status", "==", "confirmed")\
             .order_by("check_in", direction=firestore.Query.DESCENDING)\
-            .limit(limit)\
-            .stream()
-        return [doc.to_dict() for doc in docs]
+            .limit(limit)
+        return _stream_dicts(query, fields)
     except Exception as e:
         print(f"⚠️ Query confirmed bookings failed (Index missing?): {e}")
         # Fallback manual
-        docs = db.collection("bookings").where("is_online", "==", True).stream()
-        all_items = []
-        for doc in docs:
-            data = doc.to_dict()
-            if data.get("online_payment_status") == "confirmed":
-                all_items.append(data)
+        query = db.collection("bookings").where("is_online", "==", True)
+        all_items = [
+            data for data in _stream_dicts(query, fields and fields + ["online_payment_status", "check_in"])
+            if data.get("online_payment_status") == "confirmed"
+        ]
         
         all_items.sort(key=lambda x: x.get("check_in") or datetime.min, reverse=True)
         return all_items[:limit]
@@ -523,10 +1595,15 @@ def get_confirmed_online_bookings(limit: int = 20):
 
 # ... existing save_system_config ...
 
-def get_completed_bookings(start_dt: datetime | None = None, end_dt: datetime | None = None):
+def get_completed_bookings(
+    start_dt: datetime | None = None,
+    end_dt: datetime | None = None,
+    fields: list | None = None,
+):
     """
     Lấy danh sách booking đã hoàn tất (có check_out_actual) trong khoảng thời gian.
     Queries Firestore directly using 'check_out_actual' field.
+    `fields`: chỉ lấy các field này (VD: FINANCE_BOOKING_FIELDS), mặc định cả document.
     """
     db = get_db()
     
@@ -542,12 +1619,11 @@ def get_completed_bookings(start_dt: datetime | None = None, end_dt: datetime |
         query = query.where("check_out_actual", "<=", end_dt)
         
     try:
-        docs = query.stream()
-        return [doc.to_dict() for doc in docs]
+        return _stream_dicts(query, fields)
     except Exception as e:
         print(f"⚠️ Query completed bookings failed (Index or Field missing?): {e}")
         # Nếu fail (VD chưa đánh index), fallback về logic cũ (slow but safe)
-        all_bk = get_all_bookings()
+        all_bk = get_all_bookings(fields and fields + ["check_out_actual"])
         results = []
         for b in all_bk:
             ts = b.get("check_out_actual")
@@ -562,52 +1638,191 @@ def get_completed_bookings(start_dt: datetime | None = None, end_dt: datetime |
             results.append(b)
         return results
 
+# --- ẢNH CHỤP THANH TOÁN (BLOB STORE) ---
+
+@st.cache_resource
+def _get_blob_store():
+    """
+    Cloud Storage (production) hoặc thư mục local (offline / BLOB_BACKEND=local).
+    Backend "gcs" không dùng được -> raise (không lặng lẽ lưu ảnh xuống đĩa tạm của 1 instance).
+    """
+    backend = AppConfig.BLOB_BACKEND or (
+        "local" if AppConfig.STORAGE_BACKEND in ("memory", "sqlite") else "gcs"
+    )
+    if backend == "gcs":
+        try:
+            return _get_gcs_blob_store()
+        except Exception as e:
+            print(f"⚠️ Cloud Storage unavailable, payment proofs cannot be stored: {e}")
+            raise
+    local_dir = AppConfig.BLOB_LOCAL_DIR
+    if not os.path.isabs(local_dir):
+        local_dir = os.path.join(AppConfig.ROOT_DIR, local_dir)
+    return LocalBlobStore(local_dir)
+
+def _get_gcs_blob_store() -> GcsBlobStore:
+    """
+    Bucket: BLOB_BUCKET > storageBucket lúc init Firebase > bucket mặc định của project
+    (project mới: <project>.firebasestorage.app, project cũ: <project>.appspot.com).
+    Kiểm tra bucket.exists() 1 lần (kết quả được cache cùng blob store).
+    """
+    from firebase_admin import storage as fb_storage
+    get_db()  # đảm bảo Firebase App đã init
+    app = firebase_admin.get_app()
+    if AppConfig.BLOB_BUCKET:
+        candidates = [AppConfig.BLOB_BUCKET]
+    elif app.options.get("storageBucket"):
+        candidates = [app.options.get("storageBucket")]
+    else:
+        candidates = [f"{app.project_id}.firebasestorage.app", f"{app.project_id}.appspot.com"]
+    for name in candidates:
+        bucket = fb_storage.bucket(name)
+        if bucket.exists():
+            return GcsBlobStore(bucket)
+    raise RuntimeError(f"Cloud Storage bucket not found (tried: {', '.join(candidates)}); set BLOB_BUCKET")
+
 def update_online_payment_proof(
     booking_id: str,
-    screenshot_b64: str,
+    image_bytes: bytes,
     filename: str,
     mime: str,
 ):
-    """Lưu ảnh chụp thanh toán cho booking online và chuyển trạng thái sang 'waiting_confirm'."""
+    """
+    Lưu ảnh chụp thanh toán cho booking online và chuyển trạng thái sang 'waiting_confirm'.
+    Ảnh gốc lưu ở blob store; booking chỉ giữ ref + thumbnail nhỏ (base64 JPEG).
+    """
     db = get_db()
-    db.collection("bookings").document(booking_id).update(
+    ext = os.path.splitext(filename or "")[1].lower() or ".jpg"
+    ref = _get_blob_store().put(
+        f"payment_proofs/{booking_id}/{uuid.uuid4().hex[:8]}{ext}",
+        image_bytes,
+        content_type=mime or "application/octet-stream",
+    )
+    thumb = make_thumbnail(image_bytes)
+    batch = db.batch()
+    batch.update(
+        db.collection("bookings").document(booking_id),
         {
-            "payment_screenshot_b64": screenshot_b64,
+            "payment_screenshot_ref": ref,
+            "payment_screenshot_thumb_b64": base64.b64encode(thumb).decode("ascii") if thumb else None,
+            "payment_screenshot_b64": firestore.DELETE_FIELD,
             "payment_screenshot_name": filename,
             "payment_screenshot_mime": mime,
             "online_payment_status": "waiting_confirm",
         }
     )
+    trigger_system_update(SCOPE_BOOKINGS, writer=batch)
+    batch.commit()
+    _versions_committed()
+
+def get_payment_screenshot_thumbnail(booking: dict) -> bytes | None:
+    """Thumbnail để hiển thị trong danh sách (không tải ảnh gốc)."""
+    thumb = booking.get("payment_screenshot_thumb_b64")
+    if thumb:
+        return base64.b64decode(thumb)
+    return None
+
+def get_payment_screenshot(booking: dict) -> bytes | None:
+    """Ảnh gốc (tải từ blob store khi cần xem). Booking cũ: giải mã base64 lưu trong doc."""
+    ref = booking.get("payment_screenshot_ref")
+    if ref:
+        try:
+            return _load_blob(ref)
+        except Exception as e:
+            print(f"⚠️ Failed to load payment screenshot {ref}: {e}")
+            return None
+    legacy = booking.get("payment_screenshot_b64")
+    if legacy is None and booking.get("id") and booking.get("payment_screenshot_name"):
+        # Danh sách chỉ select field nhẹ -> ảnh base64 cũ phải đọc riêng
+        doc = get_db().collection("bookings").document(booking["id"]).get(
+            field_paths=["payment_screenshot_b64"]
+        )
+        legacy = (doc.to_dict() or {}).get("payment_screenshot_b64") if doc.exists else None
+    return base64.b64decode(legacy) if legacy else None
+
+@st.cache_data(ttl=3600, max_entries=50, show_spinner=False)
+def _load_blob(ref: str) -> bytes:
+    return _get_blob_store().get(ref)
+
+def migrate_payment_screenshots(limit: int = 100):
+    """
+    Chuyển ảnh base64 cũ trong booking sang blob store (mỗi lần tối đa `limit` booking).
+    Trả về số booking đã chuyển.
+    """
+    db = get_db()
+    moved = 0
+    docs = db.collection("bookings").where("is_online", "==", True).stream()
+    for doc in docs:
+        data = doc.to_dict()
+        legacy = data.get("payment_screenshot_b64")
+        if not legacy:
+            continue
+        image_bytes = base64.b64decode(legacy)
+        filename = data.get("payment_screenshot_name") or "screenshot.jpg"
+        ext = os.path.splitext(filename)[1].lower() or ".jpg"
+        ref = _get_blob_store().put(
+            f"payment_proofs/{doc.id}/{uuid.uuid4().hex[:8]}{ext}",
+            image_bytes,
+            content_type=data.get("payment_screenshot_mime") or "application/octet-stream",
+        )
+        thumb = make_thumbnail(image_bytes)
+        doc.reference.update({
+            "payment_screenshot_ref": ref,
+            "payment_screenshot_thumb_b64": base64.b64encode(thumb).decode("ascii") if thumb else None,
+            "payment_screenshot_b64": firestore.DELETE_FIELD,
+        })
+        moved += 1
+        if moved >= limit:
+            break
+    return moved
 
 def confirm_online_booking(booking_id: str):
     """Nhân viên lễ tân xác nhận đã nhận tiền đặt cọc / thanh toán.
 
     - Cập nhật online_payment_status = 'confirmed'
     - Chuyển trạng thái phòng từ 'Chờ thanh toán' -> 'Đặt trước'
+    Tất cả trong 1 transaction (cùng version rooms / bookings).
     """
     db = get_db()
-    try:
-        bk_ref = db.collection("bookings").document(booking_id)
-        bk_doc = bk_ref.get()
+    bk_ref = db.collection("bookings").document(booking_id)
+
+    @storage.transactional
+    def _confirm_in_transaction(transaction):
+        bk_doc = bk_ref.get(transaction=transaction)
         if not bk_doc.exists:
             return False, "Không tìm thấy booking"
 
         data = bk_doc.to_dict() or {}
         room_id = data.get("room_id")
+        room_ref = db.collection("rooms").document(room_id) if room_id else None
+        room_data, calendar_changes = {}, []
+        if room_ref is not None:
+            room = room_ref.get(transaction=transaction)
+            room_data = (room.to_dict() or {}) if room.exists else {}
+            if data.get("status") in ACTIVE_BOOKING_STATUSES:
+                days = inventory.stay_days(data.get("check_in"), data.get("check_out_expected"))
+                code = inventory.booking_code(dict(data, online_payment_status="confirmed"))
+                calendar_changes.append(InventoryChange(room_data.get("floor"), room_id, booking_id, days, days, code))
+        calendar_docs = _read_inventory(transaction, calendar_changes)
 
         # 1. Cập nhật trạng thái thanh toán online
-        bk_ref.update({"online_payment_status": "confirmed"})
-
-        # 2. Chuyển trạng thái phòng sang Đặt trước
-        if room_id:
-            db.collection("rooms").document(room_id).update(
-                {"status": RoomStatus.RESERVED.value}
-            )
-
-        trigger_system_update()
+        transaction.update(bk_ref, {"online_payment_status": "confirmed"})
+
+        # 2. Chuyển trạng thái phòng sang Đặt trước (chỉ khi phòng đang chờ đúng booking này;
+        #    booking xếp lịch sau thì phòng giữ nguyên)
+        if room_data.get("current_booking_id") == booking_id and room_data.get("status") == RoomStatus.PENDING_PAYMENT:
+            transaction.update(room_ref, {"status": RoomStatus.RESERVED.value})
+        _write_inventory(transaction, calendar_docs, calendar_changes)
+        trigger_system_update(SCOPE_ROOMS, SCOPE_BOOKINGS, writer=transaction)
         return True, "OK"
+
+    try:
+        success, msg = _confirm_in_transaction(db.transaction())
     except Exception as e:
         return False, str(e)
+    if success:
+        _versions_committed()
+    return success, msg
 
 # --- SYSTEM CONFIG (PAYMENT INFO) ---
 
@@ -635,32 +1850,30 @@ def get_active_bookings_dict():
     Lấy toàn bộ booking đang hoạt động (Occupied, Reserved, Checked_in)
     Trả về dict: { booking_id: booking_data }
     Giúp tránh lỗi N+1 query khi hiển thị danh sách phòng.
+    (Ưu tiên realtime mirror; nếu chưa sẵn sàng thì dùng snapshot chung của process)
     """
+    mirror = _mirror_for(BOOKINGS)
+    if mirror is not None:
+        return mirror.active_bookings()
+
+    store = _get_snapshot_store()
+    bookings = store.active_bookings.get(store.clock.get()[SCOPE_BOOKINGS])
+    return {bk_id: dict(b) for bk_id, b in bookings.items()}
+
+def _fetch_active_bookings_dict():
+    """Fetch booking đang hoạt động từ Firestore."""
     db = get_db()
-    # Statuses that imply "active"
     # Note: Querying with 'in' operator is supported in Firestore
-    statuses = [
-        BookingStatus.CONFIRMED.value,
-        BookingStatus.CHECKED_IN.value,
-        "Confirmed", 
-        "CheckedIn",
-        # RoomStatus values might be mixed in booking status in legacy data?
-        # Booking status is usually CONFIRMED or CHECKED_IN or COMPLETED.
-        # Room status is OCCUPIED/RESERVED.
-        # We need bookings where status is NOT Completed/Cancelled.
-    ]
-    
-    # Better approach: Query all bookings that are NOT Completed/Cancelled?
-    # Or query by Room Status?
-    # Actually, we rely on room.current_booking_id. 
-    # So we can just fetch ALL active bookings.
-    
-    docs = db.collection("bookings").where("status", "in", statuses).stream()
+    # We rely on room.current_booking_id, so we can just fetch ALL active bookings.
+    docs = db.collection("bookings").where("status", "in", ACTIVE_BOOKING_STATUSES).stream()
     return {doc.id: doc.to_dict() for doc in docs}
 
-@st.cache_data(ttl=300) # Cache 5 mins
 def get_system_config(key: str):
     """Lấy cấu hình hệ thống theo key (VD: 'special_days')"""
+    return _get_system_config_cached(key, get_collection_versions()[SCOPE_CONFIG])
+
+@st.cache_data(ttl=300) # Cache 5 mins (hoặc tới khi version config đổi)
+def _get_system_config_cached(key: str, version: int):
     db = get_db()
     doc = db.collection("config_system").document(key).get()
     if doc.exists:
@@ -670,74 +1883,24 @@ def get_system_config(key: str):
 def save_system_config(key: str, config: dict):
     """Lưu cấu hình hệ thống theo key"""
     db = get_db()
-    db.collection("config_system").document(key).set(config or {})
-
-def get_completed_bookings(start_dt: datetime | None = None, end_dt: datetime | None = None):
-    """
-    Lấy danh sách booking đã hoàn tất trong khoảng thời gian.
-
-    Ghi chú: Do dữ liệu trạng thái đang có thể lệch chuẩn ("Completed"/"Hoàn tất"/Enum),
-    hàm này sẽ lọc mềm và ưu tiên theo `check_out_actual`.
-    """
-    bookings = get_all_bookings()
-
-    completed_statuses = {
-        "Completed",
-        "Hoàn tất",
-        getattr(BookingStatus, "COMPLETED", None),
-    }
-    # Loại bỏ None/Enum objects, convert sang string nếu cần
-    completed_statuses = set([s.value if hasattr(s, "value") else s for s in completed_statuses if s])
-
-    def _in_range(ts: datetime | None) -> bool:
-        if ts is None:
-            return False
-        # Firestore đôi khi trả datetime có tzinfo -> bỏ tzinfo để so sánh ổn định
-        if ts.tzinfo is not None:
-            ts = ts.replace(tzinfo=None)
-        if start_dt:
-            s = start_dt.replace(tzinfo=None) if start_dt.tzinfo else start_dt
-            if ts < s:
-                return False
-        if end_dt:
-            e = end_dt.replace(tzinfo=None) if end_dt.tzinfo else end_dt
-            if ts > e:
-                return False
-        return True
-
-    results = []
-    for b in bookings:
-        status = b.get("status")
-        if hasattr(status, "value"):
-            status = status.value
-            
-        # Ưu tiên booking có check_out_actual, vì đó là phát sinh doanh thu thực
-        ts = b.get("check_out_actual")
-        
-        if ts:
-            # Nếu có dữ liệu ngày tháng, chỉ lấy nếu NẰM TRONG khoảng thời gian
-            if _in_range(ts):
-                results.append(b)
-            # Nếu có ts nhưng không khớp range -> Bỏ qua luôn, không check status nữa
-            continue
-
-        # Fallback: Chỉ check status nếu KHÔNG CÓ check_out_actual (data cũ/lỗi)
-        if status in completed_statuses:
-            # Nếu thiếu timestamp thì vẫn trả về (trang Finance sẽ loại/hiển thị cảnh báo)
-            results.append(b)
-
-    return results
-
-def get_bookings_for_today():
-    """Lấy danh sách booking có check-in hôm nay (Tối ưu query)"""
+    batch = db.batch()
+    batch.set(db.collection("config_system").document(key), config or {})
+    trigger_system_update(SCOPE_CONFIG, writer=batch)
+    batch.commit()
+    _versions_committed()
+    if key == "special_days":
+        _get_quote_cache().invalidate()
+
+def get_bookings_for_today(fields: list | None = BOOKING_LIST_FIELDS):
+    """Lấy danh sách booking có check-in hôm nay (Tối ưu query, chỉ lấy field hiển thị)"""
     db = get_db()
     today = datetime.now().date()
     start_dt = datetime.combine(today, datetime.min.time())
     end_dt = datetime.combine(today, datetime.max.time())
     
     # Query theo khoảng thời gian check_in
-    docs = db.collection("bookings").where("check_in", ">=", start_dt).where("check_in", "<=", end_dt).stream()
-    return [doc.to_dict() for doc in docs]
+    query = db.collection("bookings").where("check_in", ">=", start_dt).where("check_in", "<=", end_dt)
+    return _stream_dicts(query, fields)
 
 # --- USER MANAGEMENT & AUTH ---
 
@@ -758,44 +1921,107 @@ def get_user(username: str):
         return doc.to_dict()
     return None
 
+# --- DANH BẠ KHÁCH HÀNG (customers/{phone}) ---
+
+def normalize_phone(phone: str | None) -> str:
+    """Chuẩn hoá SĐT làm document id: chỉ giữ chữ số, +84/84xxxxxxxxx -> 0xxxxxxxxx."""
+    digits = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    if digits.startswith("84") and len(digits) == 11:
+        digits = "0" + digits[2:]
+    return digits
+
+def _upsert_customer(writer, booking, ts: datetime, visits: int = 0, spend: float = 0.0):
+    """
+    Cập nhật danh bạ khách (writer = transaction hoặc batch).
+    `booking` là Booking hoặc dict; tên/loại khách lấy theo lần gần nhất.
+    """
+    data = booking if isinstance(booking, dict) else booking.to_dict()
+    phone = normalize_phone(data.get("customer_phone"))
+    doc = {
+        "phone": phone,
+        "customer_name": data.get("customer_name", ""),
+        "customer_type": data.get("customer_type", "Khách lẻ"),
+        "last_seen": ts,
+        "last_booking_id": data.get("id"),
+    }
+    if visits:
+        doc["visit_count"] = firestore.Increment(visits)
+    if spend:
+        doc["lifetime_spend"] = firestore.Increment(float(spend))
+    writer.set(get_db().collection("customers").document(phone), doc, merge=True)
+
+def get_customer(phone: str):
+    """Lấy hồ sơ khách theo SĐT (1 document get)."""
+    phone = normalize_phone(phone)
+    if not phone:
+        return None
+    doc = get_db().collection("customers").document(phone).get()
+    return doc.to_dict() if doc.exists else None
+
+def search_customers_by_phone(prefix: str, limit: int = 10) -> list:
+    """Gợi ý khách theo đầu số điện thoại (range query trên field `phone`)."""
+    prefix = normalize_phone(prefix)
+    if len(prefix) < 3:
+        return []
+    docs = get_db().collection("customers")\
+        .where("phone", ">=", prefix)\
+        .where("phone", "<", prefix + "\uf8ff")\
+        .limit(limit).stream()
+    return [doc.to_dict() for doc in docs]
+
 def find_customer_by_phone(phone: str):
     """Tìm thông tin khách hàng gần nhất theo số điện thoại"""
     if not phone or len(phone.strip()) < 3:
         return None
-    
+
+    customer = get_customer(phone)
+    if customer:
+        return {
+            "customer_name": customer.get("customer_name"),
+            "customer_phone": customer.get("phone"),
+            "customer_type": customer.get("customer_type", "Khách lẻ"),
+        }
+
+    # Khách cũ chưa có trong danh bạ: tìm trong bookings 1 lần rồi ghi vào danh bạ
     db = get_db()
-    # Tìm trong collection bookings, order by check_in desc, limit 1
-    # Lưu ý: Cần composite index nếu sort và filter cùng lúc.
-    # Để tránh lỗi index, ta có thể filter trước rồi sort in-memory nếu số lượng ít,
-    # hoặc chỉ cần lấy 1 document bất kỳ (nếu chấp nhận không phải mới nhất).
-    # Tuy nhiên, ta muốn lấy tên mới nhất.
-    # Hãy thử query simple equality trước.
-    
     docs = db.collection("bookings").where("customer_phone", "==", phone.strip()).stream()
-    
-    # Sort in-memory to find latest
     found_bookings = [doc.to_dict() for doc in docs]
-    if not found_bookings:
+    if not found_bookings or not normalize_phone(phone):
         return None
-        
-    # Sort by created_at or check_in. Booking model has check_in.
+
+    # Sort by check_in to find latest
     def _sort_key(b):
         ts = b.get('check_in')
         if isinstance(ts, datetime):
             return ts.timestamp()
         return 0.0
-        
+
     found_bookings.sort(key=_sort_key, reverse=True)
-    
     latest = found_bookings[0]
+
+    try:
+        spend = sum(
+            float(b.get("total_amount") or 0.0)
+            for b in found_bookings if b.get("status") in COMPLETED_BOOKING_STATUSES
+        )
+        latest_ts = latest.get("check_in")
+        db.collection("customers").document(normalize_phone(phone)).set({
+            "phone": normalize_phone(phone),
+            "customer_name": latest.get("customer_name", ""),
+            "customer_type": latest.get("customer_type", "Khách lẻ"),
+            "last_seen": latest_ts if isinstance(latest_ts, datetime) else datetime.now(),
+            "last_booking_id": latest.get("id"),
+            "visit_count": len(found_bookings),
+            "lifetime_spend": spend,
+        })
+    except Exception as e:
+        print(f"⚠️ Failed to backfill customer {phone}: {e}")
+
     return {
         "customer_name": latest.get("customer_name"),
         "customer_phone": latest.get("customer_phone"), # Giữ nguyên
         "customer_type": latest.get("customer_type", "Khách lẻ")
     }
-    
-
-    return None
 
 def create_user(user_data: dict):
     """Tạo mới hoặc cập nhật user"""
@@ -803,49 +2029,121 @@ def create_user(user_data: dict):
     username = user_data.get("username")
     if username:
         db.collection("users").document(username).set(user_data)
+        _invalidate_user_cache(username)
 
 def delete_user(username: str):
     """Xóa user"""
     db = get_db()
     if username:
         db.collection("users").document(username).delete()
+        _invalidate_user_cache(username)
 
-def create_user_session(username: str) -> str:
-    """Tạo session token mới cho user và lưu vào DB"""
+# --- SESSION TOKEN (HMAC, verify không cần query) ---
+
+def _load_session_secret() -> str:
+    """Secret ký token: st.secrets -> biến môi trường -> config/auth (tự sinh lần đầu)."""
+    try:
+        if "auth" in st.secrets and st.secrets["auth"].get("session_secret"):
+            return st.secrets["auth"]["session_secret"]
+    except Exception:
+        pass  # Không có secrets.toml
+    if AppConfig.SESSION_SECRET:
+        return AppConfig.SESSION_SECRET
+
+    ref = get_db().collection("config").document("auth")
+    try:
+        ref.create({"session_secret": generate_secret(), "created_at": datetime.now()})
+    except AlreadyExists:
+        pass  # Process khác đã tạo trước
+    return ref.get().to_dict()["session_secret"]
+
+def _load_revoked_sessions() -> dict:
+    """{sid: exp_epoch} các phiên đã đăng xuất mà token chưa hết hạn."""
+    doc = get_db().collection("config").document("session_revocations").get()
+    if not doc.exists:
+        return {}
+    now = datetime.now().timestamp()
+    return {sid: exp for sid, exp in (doc.to_dict().get("revoked") or {}).items() if exp >= now}
+
+def _store_session_revocation(sid: str, exp: float):
+    """
+    Ghi sid đã thu hồi vào config/session_revocations, đồng thời xóa các sid có token đã hết hạn
+    (DELETE_FIELD cùng lần ghi) -> document không phình dần tới giới hạn 1 MiB.
+    """
+    ref = get_db().collection("config").document("session_revocations")
+    doc = ref.get()
+    now = datetime.now().timestamp()
+    revoked = (doc.to_dict().get("revoked") or {}) if doc.exists else {}
+    update = {old_sid: firestore.DELETE_FIELD for old_sid, old_exp in revoked.items() if old_exp < now}
+    update[sid] = exp
+    ref.set({"revoked": update}, merge=True)
+
+class _SessionManager:
+    """Signer + cache user + danh sách thu hồi, dùng chung toàn process."""
+
+    def __init__(self):
+        self.signer = SessionSigner(_load_session_secret(), ttl_seconds=AppConfig.SESSION_TTL_DAYS * 24 * 3600)
+        self.users = TTLCache(ttl_seconds=60)
+        self.revocations = RevocationList(_load_revoked_sessions, ttl_seconds=60)
+
+@st.cache_resource
+def _get_session_manager():
+    return _SessionManager()
+
+def _invalidate_user_cache(username: str):
+    _get_session_manager().users.invalidate(username)
+
+def create_user_session(username: str, user: dict | None = None) -> str:
+    """Tạo session token (ký HMAC) cho user. `user` = record đã đọc khi đăng nhập (đỡ 1 read)."""
     db = get_db()
-    token = str(uuid.uuid4())
-    # Lưu token vào document của user
+    if user is None:
+        user = get_user(username) or {}
     db.collection("users").document(username).update({
-        "session_token": token,
         "last_login": datetime.now()
     })
-    return token
+    return _get_session_manager().signer.issue(username, user.get("session_version", 0))
 
 def verify_user_session(token: str):
-    """Kiểm tra token hợp lệ và trả về user info"""
+    """
+    Kiểm tra token hợp lệ và trả về user info.
+    Chữ ký / hạn dùng kiểm tra cục bộ; user record & danh sách thu hồi lấy từ cache (TTL 60s).
+    """
     if not token:
         return None
-    
-    db = get_db()
-    # Tìm user có session_token khớp
-    docs = db.collection("users").where("session_token", "==", token).limit(1).stream()
-    
-    for doc in docs:
-        user_data = doc.to_dict()
-        if user_data.get("is_active", True):
-            return user_data
-            
-    return None
 
-def delete_user_session(username: str):
-    """Xóa session token khi logout"""
+    manager = _get_session_manager()
+    payload = manager.signer.verify(token)
+    if payload is None or manager.revocations.is_revoked(payload.get("sid")):
+        return None
+
+    user_data = manager.users.get(payload["u"], get_user)
+    if not user_data or not user_data.get("is_active", True):
+        return None
+    # Đổi mật khẩu -> session_version tăng -> token cũ hết hiệu lực
+    if user_data.get("session_version", 0) != payload.get("v", 0):
+        return None
+    return dict(user_data)
+
+def delete_user_session(username: str, token: str | None = None):
+    """
+    Đăng xuất.
+    - Có `token`: chỉ thu hồi phiên đó (thiết bị khác vẫn đăng nhập).
+    - Không có `token`: thu hồi mọi phiên của user (tăng session_version).
+    """
     if not username: 
         return
     db = get_db()
+    manager = _get_session_manager()
     try:
-        db.collection("users").document(username).update({
-            "session_token": firestore.DELETE_FIELD
-        })
+        payload = manager.signer.verify(token) if token else None
+        if payload:
+            manager.revocations.add(payload["sid"], payload["exp"])
+            _store_session_revocation(payload["sid"], payload["exp"])
+        else:
+            db.collection("users").document(username).update({
+                "session_version": firestore.Increment(1)
+            })
+            _invalidate_user_cache(username)
     except Exception:
         pass
 
@@ -867,7 +2165,12 @@ def update_user_password(username: str, new_password: str):
         return
     db = get_db()
     new_hash = hash_password(new_password)
-    db.collection("users").document(username).update({"password_hash": new_hash})
+    # Tăng session_version -> các phiên đang đăng nhập bằng mật khẩu cũ phải đăng nhập lại
+    db.collection("users").document(username).update({
+        "password_hash": new_hash,
+        "session_version": firestore.Increment(1)
+    })
+    _invalidate_user_cache(username)
 
 def get_all_users():
     """Lấy danh sách tất cả users"""
@@ -901,8 +2204,24 @@ def delete_service(service_id: str):
     # Ok, delete thật cho gọn.
     db.collection("services").document(service_id).delete()
 
+def _service_order_summary(order_data: dict) -> dict:
+    """Tóm tắt gọn 1 order để lưu kèm booking (hiển thị khi checkout, không cần query)."""
+    return {
+        "order_id": order_data.get("id"),
+        "created_at": order_data.get("created_at"),
+        "total": float(order_data.get("total_value", 0) or 0),
+        "items": [
+            {"name": i.get("name", ""), "qty": i.get("qty", 0), "total": i.get("total", 0)}
+            for i in order_data.get("items", [])
+        ],
+    }
+
 def add_service_order(order_data: dict):
-    """Tạo order dịch vụ mới"""
+    """
+    Tạo order dịch vụ mới.
+    Cùng 1 transaction: ghi order + cộng dồn service_total / service_order_count / service_items trên booking.
+    Booking không tồn tại (id sai / đã xóa) -> vẫn lưu order, chỉ bỏ phần cộng dồn.
+    """
     db = get_db()
     if not order_data.get("id"):
         order_data["id"] = str(uuid.uuid4())[:8]
@@ -910,9 +2229,33 @@ def add_service_order(order_data: dict):
     # Auto add timestamp
     if not order_data.get("created_at"):
         order_data["created_at"] = datetime.now()
-    
-    # 1. Lưu Order
-    db.collection("service_orders").document(order_data["id"]).set(order_data)
+
+    booking_ref = db.collection("bookings").document(order_data["booking_id"]) if order_data.get("booking_id") else None
+
+    @storage.transactional
+    def _add_in_transaction(transaction):
+        booking_exists = booking_ref is not None and booking_ref.get(transaction=transaction).exists
+        # 1. Lưu Order
+        transaction.set(db.collection("service_orders").document(order_data["id"]), order_data)
+        # 2. Cộng dồn lên booking
+        if booking_exists:
+            transaction.update(booking_ref, {
+                "service_total": firestore.Increment(float(order_data.get("total_value", 0) or 0)),
+                "service_order_count": firestore.Increment(1),
+                "service_items": firestore.ArrayUnion([_service_order_summary(order_data)]),
+            })
+            trigger_system_update(SCOPE_BOOKINGS, writer=transaction)
+        return booking_exists
+
+    try:
+        aggregated = _add_in_transaction(db.transaction())
+    except Exception as e:
+        print(f"⚠️ Failed to add service order: {e}")
+        return False
+    if booking_ref is not None and not aggregated:
+        print(f"⚠️ Service order {order_data['id']} saved but booking {order_data['booking_id']} not found")
+    if aggregated:
+        _versions_committed()
     return True
 
 def get_orders_by_booking(booking_id: str):
@@ -926,6 +2269,68 @@ def calculate_service_total(booking_id: str):
     orders = get_orders_by_booking(booking_id)
     return sum(o.get("total_value", 0) for o in orders)
 
+def get_booking_service_total(booking: dict) -> float:
+    """Tổng tiền dịch vụ từ booking đã đọc (booking cũ chưa có field -> query service_orders)."""
+    if "service_total" in booking:
+        return float(booking.get("service_total") or 0.0)
+    return calculate_service_total(booking.get("id"))
+
+def get_booking_service_items(booking: dict) -> list:
+    """Danh sách order (dạng tóm tắt) của booking, sắp theo thời gian."""
+    if "service_items" in booking:
+        items = list(booking.get("service_items") or [])
+    else:
+        items = [_service_order_summary(o) for o in get_orders_by_booking(booking.get("id"))]
+    items.sort(key=lambda o: o["created_at"].timestamp() if isinstance(o.get("created_at"), datetime) else 0.0)
+    return items
+
+def reconcile_service_totals(booking_ids: list | None = None):
+    """
+    Đối soát: tính lại service_total / service_order_count / service_items từ service_orders
+    và sửa các booking bị lệch. Mặc định kiểm tra các booking đang hoạt động.
+    Trả về (số booking đã kiểm tra, số booking đã sửa).
+    """
+    db = get_db()
+    if booking_ids is None:
+        bookings = get_active_bookings_dict()
+    else:
+        bookings = {}
+        for bid in booking_ids:
+            b = get_booking_by_id(bid)
+            if b: bookings[bid] = b
+    ids = list(bookings.keys())
+
+    orders_by_booking = {bid: [] for bid in ids}
+    # Firestore giới hạn toán tử "in" tối đa 30 giá trị
+    for i in range(0, len(ids), 30):
+        docs = db.collection("service_orders").where("booking_id", "in", ids[i:i + 30]).stream()
+        for doc in docs:
+            o = doc.to_dict()
+            orders_by_booking.setdefault(o.get("booking_id"), []).append(o)
+
+    fixes = []
+    for bid in ids:
+        orders = orders_by_booking.get(bid, [])
+        total = float(sum(o.get("total_value", 0) or 0 for o in orders))
+        b = bookings[bid]
+        if (abs(float(b.get("service_total") or 0.0) - total) > 0.5
+                or b.get("service_order_count", 0) != len(orders)
+                or "service_items" not in b):
+            fixes.append((bid, {
+                "service_total": total,
+                "service_order_count": len(orders),
+                "service_items": [_service_order_summary(o) for o in orders if o.get("id")],
+            }))
+
+    for i in range(0, len(fixes), 400):
+        batch = db.batch()
+        for bid, data in fixes[i:i + 400]:
+            batch.update(db.collection("bookings").document(bid), data)
+        batch.commit()
+    if fixes:
+        print(f"✅ Reconciled service totals for {len(fixes)} booking(s).")
+    return len(ids), len(fixes)
+
 def get_recent_service_orders(limit=50):
     """Lấy danh sách các order gần đây nhất (In-memory sort for safety)"""
     db = get_db()
@@ -946,6 +2351,21 @@ def get_recent_service_orders(limit=50):
 
 # --- 7. PERMISSION MANAGEMENT ---
 
+@st.cache_resource
+def _get_permission_resolver():
+    """Resolver quyền dùng chung toàn process (biên dịch role -> frozenset, theo version config)."""
+    from src.models import UserRole
+    return PermissionResolver(
+        _load_all_role_permissions,
+        superuser_roles=[UserRole.ADMIN.value],
+        ttl_seconds=300,
+        version_fn=lambda: get_collection_versions()[SCOPE_CONFIG],
+    )
+
+def get_permission_check_stats():
+    """Thống kê resolver quyền (số lần load, số lần kiểm tra theo trang)."""
+    return _get_permission_resolver().stats()
+
 def get_role_permissions(role: str):
     """
     Lấy danh sách quyền của một vai trò.
@@ -953,23 +2373,7 @@ def get_role_permissions(role: str):
     Nếu chưa có cấu hình trong DB, sẽ trả về cấu hình mặc định.
     Trả về: List[str] - danh sách permission values
     """
-    from src.models import DEFAULT_ROLE_PERMISSIONS, UserRole
-    
-    db = get_db()
-    doc = db.collection("config_permissions").document(role).get()
-    
-    if doc.exists:
-        data = doc.to_dict()
-        return data.get("permissions", [])
-    
-    # Fallback: Trả về default
-    try:
-        role_enum = UserRole(role)
-        default_perms = DEFAULT_ROLE_PERMISSIONS.get(role_enum, [])
-        # Convert Permission enum to string values
-        return [p.value if hasattr(p, 'value') else p for p in default_perms]
-    except:
-        return []
+    return sorted(_get_permission_resolver().permissions_for(role))
 
 def save_role_permissions(role: str, permissions: list):
     """
@@ -980,22 +2384,30 @@ def save_role_permissions(role: str, permissions: list):
         permissions: List các permission values (strings)
     """
     db = get_db()
-    db.collection("config_permissions").document(role).set({
+    batch = db.batch()
+    batch.set(db.collection("config_permissions").document(role), {
         "role": role,
         "permissions": permissions,
         "updated_at": datetime.now()
     })
-    # Clear cache if exists
-    if hasattr(get_all_role_permissions, 'clear'):
-        get_all_role_permissions.clear()
+    # Version config đổi -> mọi process biên dịch lại quyền ở lần kiểm tra kế tiếp
+    trigger_system_update(SCOPE_CONFIG, writer=batch)
+    batch.commit()
+    _versions_committed()
+    _get_permission_resolver().invalidate()
 
-@st.cache_data(ttl=300)  # Cache 5 minutes
 def get_all_role_permissions():
     """
     Lấy tất cả cấu hình phân quyền.
     
     Trả về: Dict[str, List[str]] - {role: [permissions]}
     """
+    from src.models import UserRole
+    resolver = _get_permission_resolver()
+    return {role.value: sorted(resolver.permissions_for(role.value)) for role in UserRole}
+
+def _load_all_role_permissions():
+    """Đọc toàn bộ config_permissions (1 query), bổ sung mặc định cho role chưa cấu hình."""
     from src.models import UserRole, DEFAULT_ROLE_PERMISSIONS
     
     db = get_db()
@@ -1006,7 +2418,7 @@ def get_all_role_permissions():
     
     for doc in docs:
         data = doc.to_dict()
-        role = data.get("role")
+        role = data.get("role") or doc.id
         if role:
             result[role] = data.get("permissions", [])
             configured_roles.add(role)
@@ -1042,5 +2454,4 @@ def init_default_permissions():
             save_role_permissions(role, perm_values)
     
     # Clear cache
-    if hasattr(get_all_role_permissions, 'clear'):
-        get_all_role_permissions.clear()
+    _get_permission_resolver().invalidate()
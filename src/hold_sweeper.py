@@ -0,0 +1,292 @@
+"""
+Nhả phòng giữ chỗ (TEMP_LOCKED) hết hạn ở thread nền, thay cho việc ghi trong lúc đọc.
+
+- `ExpiryHeap`: min-heap (locked_until, room_id); entry cũ (phòng đã gia hạn / đã nhả)
+  bị bỏ qua khi pop.
+- `LeaseLock`: chỉ 1 process làm leader (doc `config/hold_sweeper_lease`, gia hạn theo lease).
+- `HoldSweeper`: leader quét định kỳ, nhả các phòng đến hạn theo batch (transaction kiểm tra
+  lại từng phòng trước khi ghi), đo thời gian quét và số phòng đã nhả.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime
+
+from firebase_admin import firestore
+
+from src import storage
+from src.models import RoomStatus
+
+
+class ExpiryHeap:
+    """Min-heap thời điểm hết hạn giữ phòng, mỗi room chỉ giữ expiry mới nhất."""
+
+    def __init__(self):
+        self._heap = []
+        self._latest = {}  # room_id -> expiry hiện hành
+        self._lock = threading.Lock()
+
+    def push(self, room_id: str, expiry: datetime):
+        with self._lock:
+            self._latest[room_id] = expiry
+            heapq.heappush(self._heap, (expiry, room_id))
+
+    def discard(self, room_id: str):
+        with self._lock:
+            self._latest.pop(room_id, None)
+
+    def pop_due(self, now: datetime) -> list:
+        """Lấy (và bỏ khỏi heap) các room_id có expiry <= now."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expiry, room_id = heapq.heappop(self._heap)
+                if self._latest.get(room_id) == expiry:
+                    del self._latest[room_id]
+                    due.append(room_id)
+        return due
+
+    def next_expiry(self):
+        with self._lock:
+            while self._heap and self._latest.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._latest = {}
+
+    def __len__(self):
+        return len(self._latest)
+
+
+class LeaseLock:
+    """
+    Lease leader qua 1 document: {owner, lease_until (epoch giây)}.
+
+    `acquire()` lấy lease nếu trống / hết hạn / đang là của mình (gia hạn), trong transaction.
+    """
+
+    def __init__(self, db, doc_ref, owner_id: str, lease_seconds: float = 30.0):
+        self._db = db
+        self._ref = doc_ref
+        self.owner_id = owner_id
+        self._lease_seconds = lease_seconds
+
+    def acquire(self) -> bool:
+        @storage.transactional
+        def _acquire(transaction, ref, owner, lease_seconds):
+            snapshot = ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else {}
+            now = time.time()
+            if data.get("owner") not in (None, owner) and data.get("lease_until", 0) > now:
+                return False
+            transaction.set(ref, {"owner": owner, "lease_until": now + lease_seconds})
+            return True
+
+        return _acquire(self._db.transaction(), self._ref, self.owner_id, self._lease_seconds)
+
+    def release(self):
+        @storage.transactional
+        def _release(transaction, ref, owner):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get("owner") == owner:
+                transaction.set(ref, {"owner": None, "lease_until": 0})
+
+        _release(self._db.transaction(), self._ref, self.owner_id)
+
+
+class HoldSweeper:
+    """
+    Thread nền nhả phòng TEMP_LOCKED hết hạn.
+
+    Args:
+        db: Firestore client (hoặc client cục bộ cùng API).
+        owner_id: Định danh process (cho lease).
+        expiry_of: Hàm nhận data phòng, trả về locked_until (datetime naive, cùng múi với `now_fn`).
+        stage_version: (optional) Hàm(transaction) ghi version cùng transaction nhả phòng.
+        on_released: Callback(số phòng đã nhả) sau mỗi lần quét có nhả phòng.
+        interval_seconds: Chu kỳ quét tối đa (thức dậy sớm hơn nếu có hold sắp hết hạn).
+        rescan_seconds: Chu kỳ query lại các phòng TEMP_LOCKED (bắt hold do process khác tạo).
+        batch_size: Số phòng tối đa mỗi transaction.
+    """
+
+    LEASE_DOC = ("config", "hold_sweeper_lease")
+
+    def __init__(
+        self,
+        db,
+        owner_id: str,
+        expiry_of,
+        stage_version=None,
+        on_released=None,
+        interval_seconds: float = 10.0,
+        lease_seconds: float = 30.0,
+        rescan_seconds: float = 60.0,
+        batch_size: int = 400,
+        now_fn=datetime.now,
+    ):
+        self._db = db
+        self._expiry_of = expiry_of
+        self._stage_version = stage_version
+        self._on_released = on_released
+        self._interval = interval_seconds
+        self._rescan_seconds = rescan_seconds
+        self._batch_size = batch_size
+        self._now = now_fn
+        self._lease = LeaseLock(
+            db, db.collection(self.LEASE_DOC[0]).document(self.LEASE_DOC[1]), owner_id, lease_seconds
+        )
+        self._heap = ExpiryHeap()
+        self._last_rescan = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.is_leader = False
+        self.sweeps = 0
+        self.released_total = 0
+        self.last_released = 0
+        self.last_sweep_ms = 0.0
+        self.max_sweep_ms = 0.0
+        self.total_sweep_ms = 0.0
+        self.last_sweep_at = None
+        self.last_error = None
+
+    # --- Vòng đời ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.is_leader:
+            try:
+                self._lease.release()
+            except Exception:
+                pass
+            self.is_leader = False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Hold sweep failed: {e}")
+            self._wake.wait(self._next_wait())
+            self._wake.clear()
+
+    def _next_wait(self) -> float:
+        nxt = self._heap.next_expiry() if self.is_leader else None
+        if nxt is None:
+            return self._interval
+        return min(self._interval, max(0.5, (nxt - self._now()).total_seconds()))
+
+    # --- API ---
+
+    def schedule(self, room_id: str, expiry: datetime):
+        """Báo cho sweeper biết 1 hold mới / vừa gia hạn (process hiện tại)."""
+        if room_id and expiry is not None:
+            self._heap.push(room_id, expiry)
+
+    def sweep_once(self) -> int:
+        """1 lượt quét: giữ lease, nạp lại heap nếu cần, nhả các hold đến hạn. Trả về số phòng đã nhả."""
+        t0 = time.perf_counter()
+        self.is_leader = self._lease.acquire()
+        if not self.is_leader:
+            # Không phải leader: heap sẽ được nạp lại đầy đủ khi giành được lease
+            self._last_rescan = None
+            return 0
+
+        now = self._now()
+        if self._last_rescan is None or time.monotonic() - self._last_rescan >= self._rescan_seconds:
+            self._rescan()
+
+        due = self._heap.pop_due(now)
+        released = 0
+        for i in range(0, len(due), self._batch_size):
+            released += self._release_batch(due[i:i + self._batch_size], now)
+
+        if released and self._on_released:
+            self._on_released(released)
+        self._record(released, (time.perf_counter() - t0) * 1000)
+        return released
+
+    def _rescan(self):
+        """Nạp lại heap từ các phòng đang TEMP_LOCKED (chỉ đọc các phòng đang giữ)."""
+        docs = self._db.collection("rooms").where("status", "==", RoomStatus.TEMP_LOCKED.value).stream()
+        self._heap.clear()
+        for doc in docs:
+            expiry = self._expiry_of(doc.to_dict())
+            if expiry is not None:
+                self._heap.push(doc.id, expiry)
+        self._last_rescan = time.monotonic()
+
+    def _release_batch(self, room_ids: list, now: datetime) -> int:
+        """Kiểm tra lại trong transaction: chỉ nhả phòng vẫn TEMP_LOCKED và đã hết hạn."""
+        refs = [self._db.collection("rooms").document(rid) for rid in room_ids]
+
+        @storage.transactional
+        def _release(transaction, refs):
+            released, rescheduled = 0, []
+            for snapshot in transaction.get_all(refs):
+                if not snapshot.exists:
+                    continue
+                data = snapshot.to_dict()
+                if data.get("status") != RoomStatus.TEMP_LOCKED:
+                    continue
+                expiry = self._expiry_of(data)
+                if expiry is not None and expiry > now:
+                    rescheduled.append((snapshot.id, expiry))  # Đã được gia hạn
+                    continue
+                transaction.update(snapshot.reference, {
+                    "status": RoomStatus.AVAILABLE.value,
+                    "locked_until": firestore.DELETE_FIELD,
+                    "locked_by": firestore.DELETE_FIELD,
+                })
+                released += 1
+            if released and self._stage_version:
+                self._stage_version(transaction)
+            return released, rescheduled
+
+        released, rescheduled = _release(self._db.transaction(), refs)
+        for room_id, expiry in rescheduled:
+            self._heap.push(room_id, expiry)
+        return released
+
+    def _record(self, released: int, elapsed_ms: float):
+        with self._stats_lock:
+            self.sweeps += 1
+            self.released_total += released
+            self.last_released = released
+            self.last_sweep_ms = elapsed_ms
+            self.max_sweep_ms = max(self.max_sweep_ms, elapsed_ms)
+            self.total_sweep_ms += elapsed_ms
+            self.last_sweep_at = datetime.now()
+            self.last_error = None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "owner": self._lease.owner_id,
+                "is_leader": self.is_leader,
+                "sweeps": self.sweeps,
+                "released_total": self.released_total,
+                "last_released": self.last_released,
+                "last_sweep_ms": round(self.last_sweep_ms, 2),
+                "avg_sweep_ms": round(self.total_sweep_ms / self.sweeps, 2) if self.sweeps else 0.0,
+                "max_sweep_ms": round(self.max_sweep_ms, 2),
+                "pending_holds": len(self._heap),
+                "next_expiry": self._heap.next_expiry(),
+                "last_sweep_at": self.last_sweep_at,
+                "last_error": self.last_error,
+            }
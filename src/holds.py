@@ -0,0 +1,156 @@
+"""
+Lease giữ phòng theo session (thay cho gọi hold_room() mỗi lần render).
+
+`HoldLeaseManager` nhớ cục bộ các phòng session đang giữ và hạn giữ:
+- acquire / sync idempotent: phòng còn hạn xa thì không gọi DB (rerun trang không tạo transaction).
+- heartbeat(): chỉ gia hạn các lease sắp hết (còn <= renew_margin), gộp 1 lần gọi; khách không thao tác
+  quá `max_minutes` thì thôi gia hạn (lease tự hết); phòng không còn do session giữ (bị sweeper nhả /
+  đã đặt) -> bỏ khỏi lease.
+- release_all(): nhả hết khi rời trang (page khác gọi) hoặc khi session kết thúc (manager bị thu hồi
+  cùng session_state -> weakref.finalize).
+
+Các hàm DB được truyền vào (acquire = hold_rooms, renew = renew_room_holds, release = release_room_holds)
+để module không phụ thuộc Streamlit / Firestore.
+"""
+import threading
+import weakref
+from datetime import datetime, timedelta
+
+
+def _release_leftover(release, session_id: str, leases: dict):
+    """Finalizer: nhả các phòng còn giữ khi manager bị thu hồi (session kết thúc)."""
+    if leases:
+        try:
+            release(list(leases), session_id)
+        except Exception as e:
+            print(f"⚠️ Failed to release holds of ended session: {e}")
+        leases.clear()
+
+
+class HoldLeaseManager:
+    """
+    Các lease giữ phòng của 1 session.
+
+    Args:
+        session_id: Session giữ phòng (locked_by).
+        acquire: fn(room_ids, session_id, minutes) -> (ok, [room_id] | {room_id: lý do}).
+        renew: fn(room_ids, session_id, minutes) -> [room_id đã gia hạn].
+        release: fn(room_ids, session_id) -> [room_id đã nhả].
+        lease_minutes: Thời hạn mỗi lần giữ / gia hạn.
+        renew_margin_seconds: Chỉ gia hạn khi lease còn ít hơn bấy nhiêu giây.
+        max_minutes: Heartbeat không gia hạn nữa nếu quá bấy nhiêu phút kể từ lần acquire / sync cuối.
+        clock: Hàm lấy giờ hiện tại (giờ local, naive).
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        acquire,
+        renew,
+        release,
+        lease_minutes: int = 5,
+        renew_margin_seconds: int = 60,
+        max_minutes: int = 30,
+        clock=datetime.now,
+    ):
+        self.session_id = session_id
+        self.page = None  # Trang đã giữ phòng (rời trang -> nhả)
+        self._acquire = acquire
+        self._renew = renew
+        self._release = release
+        self._lease_minutes = lease_minutes
+        self._lease = timedelta(minutes=lease_minutes)
+        self._margin = timedelta(seconds=renew_margin_seconds)
+        self._max = timedelta(minutes=max_minutes)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._leases = {}  # room_id -> hạn giữ
+        self._touched_at = {}  # room_id -> lần acquire / sync cuối (khách còn thao tác)
+        self.rpc_calls = 0
+        self._finalizer = weakref.finalize(self, _release_leftover, release, session_id, self._leases)
+
+    def _fresh(self, room_id: str, now: datetime) -> bool:
+        expires = self._leases.get(room_id)
+        return expires is not None and expires - self._margin > now
+
+    def acquire(self, room_ids: list, page: str | None = None):
+        """
+        Giữ các phòng (thêm vào lease hiện có). Phòng đã giữ và còn hạn xa -> không gọi DB.
+        Trả về (True, [room_id, ...]) hoặc (False, {room_id: lý do}) như hold_rooms (không giữ phòng nào mới).
+        """
+        room_ids = list(dict.fromkeys(rid for rid in room_ids if rid))
+        with self._lock:
+            now = self._clock()
+            need = [rid for rid in room_ids if not self._fresh(rid, now)]
+            if need:
+                self.rpc_calls += 1
+                ok, result = self._acquire(need, self.session_id, self._lease_minutes)
+                if not ok:
+                    return False, result
+                for rid in need:
+                    self._leases[rid] = now + self._lease
+            for rid in room_ids:
+                self._touched_at[rid] = now
+            if page is not None:
+                self.page = page
+            return True, room_ids
+
+    def sync(self, room_ids: list, page: str | None = None):
+        """Chỉ giữ đúng `room_ids`: nhả phòng đang giữ mà không còn chọn, giữ phòng mới chọn."""
+        wanted = set(room_ids)
+        self.release([rid for rid in list(self._leases) if rid not in wanted])
+        return self.acquire(room_ids, page)
+
+    def heartbeat(self) -> list:
+        """
+        Gia hạn các lease sắp hết (1 lần gọi DB, không gọi nếu chưa cần). Lease hết hạn / quá
+        `max_minutes` / không gia hạn được bị bỏ. Trả về các phòng vừa mất.
+        """
+        with self._lock:
+            now = self._clock()
+            lost = [rid for rid, expires in self._leases.items() if expires <= now]
+            due = [
+                rid for rid, expires in self._leases.items()
+                if now < expires and expires - self._margin <= now and now - self._touched_at[rid] < self._max
+            ]
+            if due:
+                self.rpc_calls += 1
+                renewed = set(self._renew(due, self.session_id, self._lease_minutes))
+                for rid in due:
+                    if rid in renewed:
+                        self._leases[rid] = now + self._lease
+                    else:
+                        lost.append(rid)
+            for rid in lost:
+                self._leases.pop(rid, None)
+                self._touched_at.pop(rid, None)
+            return lost
+
+    def release(self, room_ids: list) -> list:
+        """Nhả các phòng (chỉ phòng đang có lease). Trả về các phòng đã nhả trên DB."""
+        with self._lock:
+            room_ids = [rid for rid in room_ids if rid in self._leases]
+            if not room_ids:
+                return []
+            for rid in room_ids:
+                self._leases.pop(rid, None)
+                self._touched_at.pop(rid, None)
+            self.rpc_calls += 1
+            return self._release(room_ids, self.session_id)
+
+    def release_all(self) -> list:
+        released = self.release(list(self._leases))
+        self.page = None
+        return released
+
+    def forget(self, room_ids: list):
+        """Bỏ lease mà không gọi DB (booking đã tạo, hold đã được chuyển thành đặt phòng)."""
+        with self._lock:
+            for rid in room_ids:
+                self._leases.pop(rid, None)
+                self._touched_at.pop(rid, None)
+
+    def held(self) -> dict:
+        """{room_id: hạn giữ} các phòng đang giữ."""
+        with self._lock:
+            return dict(self._leases)
@@ -0,0 +1,224 @@
+"""
+Lịch tồn phòng dựng sẵn (inventory calendar): phòng x ngày -> mã trạng thái + booking_id.
+
+Lưu 1 document / khu vực / tháng trong collection `inventory_calendar`, id `{khu vực}_{YYYY-MM}`:
+    {
+        "area": "Khu A", "month": "2026-10", "days": 31,
+        "rooms": {"101": {"s": "..RRRO.....", "b": ["", "", "bk1", ...]}},
+    }
+- "s": chuỗi mã trạng thái theo ngày (FREE "." / RESERVED "R" / PENDING "P" / OCCUPIED "O").
+- "b": booking_id chiếm phòng ngày đó ("" = trống).
+
+Một ngày thuộc booking nếu đêm của ngày đó nằm trong [check_in, check_out) (ngày trả phòng không
+tính); booking trong ngày (theo giờ) chiếm đúng ngày check-in. Mỗi ô chỉ giữ 1 booking: booking đến
+sau không ghi đè ô đã có booking khác (theo giờ chen giữa 2 lượt ở).
+
+Tạo / hủy / gia hạn / nhận phòng / trả phòng cập nhật tăng dần (`apply_change`) trong transaction của
+thao tác đó; `build_month_docs` dựng lại toàn bộ từ booking đang hoạt động (sửa sai lệch).
+Lưới 90 ngày x 200 phòng chỉ cần đọc (số khu vực x 3-4 tháng) document (`InventoryGrid`).
+"""
+import calendar as _calendar
+from datetime import date, datetime, timedelta
+
+from src.models import BookingStatus
+
+COLLECTION = "inventory_calendar"
+
+FREE, RESERVED, PENDING, OCCUPIED = ".", "R", "P", "O"
+CODE_LABELS = {FREE: "Trống", RESERVED: "Đặt trước", PENDING: "Chờ thanh toán", OCCUPIED: "Đang ở"}
+NO_AREA = "_"
+
+
+def _local_date(value) -> date | None:
+    """Ngày (giờ tường) của giờ booking: ghi dạng naive, Firestore trả về gắn UTC -> chỉ bỏ tzinfo."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None).date()
+    return value
+
+
+def month_key(d: date) -> str:
+    return d.strftime("%Y-%m")
+
+
+def doc_id(area: str | None, month: str) -> str:
+    """Id document: `{khu vực}_{YYYY-MM}` ("/" không được phép trong id Firestore)."""
+    return f"{(area or NO_AREA).replace('/', '-')}_{month}"
+
+
+def stay_days(check_in, check_out) -> list:
+    """Các ngày (date) booking chiếm phòng: đêm [check_in, check_out), tối thiểu ngày check-in."""
+    start, end = _local_date(check_in), _local_date(check_out)
+    if start is None:
+        return []
+    if end is None or end <= start:
+        return [start]
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+def booking_code(booking: dict) -> str:
+    """Mã ô lịch cho booking đang hoạt động."""
+    if booking.get("status") in (BookingStatus.CHECKED_IN.value, "CheckedIn"):
+        return OCCUPIED
+    if booking.get("is_online") and booking.get("online_payment_status") != "confirmed":
+        return PENDING
+    return RESERVED
+
+
+def months_of(days) -> list:
+    return sorted({month_key(d) for d in days})
+
+
+def empty_month(area: str | None, month: str) -> dict:
+    year, mon = int(month[:4]), int(month[5:7])
+    return {"area": area or NO_AREA, "month": month, "days": _calendar.monthrange(year, mon)[1], "rooms": {}}
+
+
+def _row(doc: dict, room_id: str) -> dict:
+    row = doc["rooms"].get(room_id)
+    if row is None:
+        row = {"s": FREE * doc["days"], "b": [""] * doc["days"]}
+        doc["rooms"][room_id] = row
+    return row
+
+
+class InventoryChange:
+    """
+    1 thay đổi lịch của 1 booking trên 1 phòng: bỏ các ngày `old_days`, đánh dấu `new_days` bằng `code`.
+    Tạo booking: old_days = []; hủy: new_days = []; gia hạn / trả phòng: cả hai.
+    """
+
+    def __init__(self, area, room_id: str, booking_id: str, old_days=(), new_days=(), code: str = RESERVED):
+        self.area = area or NO_AREA
+        self.room_id = room_id
+        self.booking_id = booking_id
+        self.old_days = list(old_days)
+        self.new_days = list(new_days)
+        self.code = code
+
+    def doc_ids(self) -> list:
+        return [doc_id(self.area, m) for m in months_of(self.old_days + self.new_days)]
+
+
+def apply_change(docs: dict, change: InventoryChange) -> set:
+    """
+    Áp dụng `change` lên `docs` {doc_id: doc} (tạo doc tháng còn thiếu). Trả về tập doc_id đã đổi.
+    Chỉ xóa ô đang thuộc booking này; chỉ ghi ô trống hoặc đã thuộc booking này.
+    """
+    changed = set()
+
+    def _doc(d: date) -> dict:
+        key = doc_id(change.area, month_key(d))
+        if key not in docs:
+            docs[key] = empty_month(change.area, month_key(d))
+        changed.add(key)
+        return docs[key]
+
+    for d in change.old_days:
+        row = _row(_doc(d), change.room_id)
+        i = d.day - 1
+        if row["b"][i] == change.booking_id:
+            row["b"][i] = ""
+            row["s"] = row["s"][:i] + FREE + row["s"][i + 1:]
+    for d in change.new_days:
+        row = _row(_doc(d), change.room_id)
+        i = d.day - 1
+        if row["b"][i] in ("", change.booking_id):
+            row["b"][i] = change.booking_id
+            row["s"] = row["s"][:i] + change.code + row["s"][i + 1:]
+    return changed
+
+
+def build_month_docs(rooms: list, bookings, months: list) -> dict:
+    """
+    Dựng lại các doc tháng `months` ("YYYY-MM") cho mọi khu vực từ booking đang hoạt động.
+    Phòng không có booking vẫn có hàng trống (lưới hiển thị đủ phòng).
+    """
+    if isinstance(bookings, dict):
+        bookings = [dict(b, id=b.get("id") or bk_id) for bk_id, b in bookings.items()]
+    area_of = {r["id"]: r.get("floor") or NO_AREA for r in rooms if r.get("id")}
+    wanted = set(months)
+    docs = {}
+    for room_id, area in area_of.items():
+        for month in months:
+            doc = docs.setdefault(doc_id(area, month), empty_month(area, month))
+            _row(doc, room_id)
+    # Booking đến trước giữ ô trước (giống thứ tự ghi khi tạo tăng dần)
+    for bk in sorted(bookings, key=lambda b: _local_date(b.get("check_in")) or date.min):
+        room_id = bk.get("room_id")
+        if room_id not in area_of:
+            continue
+        days = [d for d in stay_days(bk.get("check_in"), bk.get("check_out_expected")) if month_key(d) in wanted]
+        if days:
+            apply_change(docs, InventoryChange(area_of[room_id], room_id, bk.get("id"), (), days, booking_code(bk)))
+    return docs
+
+
+def month_range(start: date, days: int) -> list:
+    """Các tháng ("YYYY-MM") phủ [start, start + days)."""
+    end = start + timedelta(days=max(days, 1) - 1)
+    months, d = [], start.replace(day=1)
+    while d <= end:
+        months.append(month_key(d))
+        d = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return months
+
+
+class InventoryGrid:
+    """
+    Lưới phòng x ngày [start, start + days) ghép từ các doc tháng.
+
+    Args:
+        docs: Các doc tháng (dict như lưu trong `inventory_calendar`).
+        start: Ngày đầu lưới.
+        days: Số ngày.
+    """
+
+    def __init__(self, docs, start: date, days: int):
+        self.start = start
+        self.days = days
+        self.dates = [start + timedelta(days=i) for i in range(days)]
+        by_month = {}
+        for doc in docs:
+            by_month.setdefault(doc["month"], []).append(doc)
+        # Cắt mỗi doc tháng 1 lần cho mỗi phòng: (tháng, index đầu, index cuối) trong chuỗi "s"
+        spans = []
+        for month in month_range(start, days):
+            first = max(start, date(int(month[:4]), int(month[5:7]), 1))
+            last = min(self.dates[-1], first.replace(day=_calendar.monthrange(first.year, first.month)[1]))
+            spans.append((month, first.day - 1, last.day))
+
+        self.area_of = {}
+        parts = {}
+        for k, (month, lo, hi) in enumerate(spans):
+            for doc in by_month.get(month, []):
+                for room_id, row in doc["rooms"].items():
+                    self.area_of.setdefault(room_id, doc["area"])
+                    parts.setdefault(room_id, [None] * len(spans))[k] = (row["s"][lo:hi], row["b"][lo:hi])
+
+        # Tháng chưa có doc cho phòng (chưa dựng lịch) -> coi như trống
+        self.codes, self.booking_ids = {}, {}
+        for room_id, room_parts in parts.items():
+            codes, ids = [], []
+            for (_, lo, hi), part in zip(spans, room_parts):
+                codes.append(part[0] if part else FREE * (hi - lo))
+                ids.extend(part[1] if part else [""] * (hi - lo))
+            self.codes[room_id] = "".join(codes)
+            self.booking_ids[room_id] = ids
+
+    def row(self, room_id: str) -> str:
+        return self.codes.get(room_id, FREE * self.days)
+
+    def rooms(self, area: str | None = None) -> list:
+        return sorted(r for r, a in self.area_of.items() if area is None or a == area)
+
+    def is_free(self, room_id: str, first: date, last: date) -> bool:
+        """Phòng trống mọi ngày trong [first, last] (lọc thô theo ngày; giờ chính xác do index lịch trống)."""
+        lo, hi = (first - self.start).days, (last - self.start).days + 1
+        return FREE * (hi - lo) == self.row(room_id)[max(lo, 0):hi]
+
+    def occupancy(self) -> list:
+        """Tỷ lệ phòng có khách / đặt trước theo từng ngày."""
+        total = len(self.codes) or 1
+        return [sum(1 for s in self.codes.values() if s[i] != FREE) / total for i in range(self.days)]
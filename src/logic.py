@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import math
 from src.models import PriceConfig, BookingType
+from src.pricing import hourly_price
 
 def calculate_estimated_price(
     check_in: datetime,
@@ -36,7 +37,7 @@ def calculate_estimated_price(
     elif booking_type == BookingType.OVERNIGHT:
         return float(price_config.get("overnight_price", 0))
 
-    # 3. Giá theo giờ (Phức tạp nhất)
+    # 3. Giá theo giờ: bảng block đã biên dịch (bisect) + phụ thu lố giờ + trần giá ngày
     elif booking_type == BookingType.HOURLY:
         duration = check_out - check_in
         hours = duration.total_seconds() / 3600
@@ -45,25 +46,7 @@ def calculate_estimated_price(
         # Đảm bảo tối thiểu là 1 giờ
         if hours_ceil < 1: hours_ceil = 1
         
-        blocks = price_config.get("hourly_blocks", {})
-        # blocks dạng: {"1": 50000, "2": 90000...}
-        
-        key = str(hours_ceil)
-        
-        if key in blocks:
-            return float(blocks[key])
-        else:
-            # Logic: Nếu ở lố giờ trong bảng giá (VD bảng max 3h, khách ở 5h)
-            if blocks:
-                # Tìm key lớn nhất
-                max_h = max([int(k) for k in blocks.keys()])
-                # Giá của giờ lớn nhất
-                base_price = float(blocks.get(str(max_h), 0))
-                
-                # Logic phụ thu thêm giờ (nếu có cấu hình, tạm thời lấy giá max)
-                # Có thể mở rộng logic: (hours_ceil - max_h) * phụ_thu_mỗi_giờ
-                return base_price
-            return 0.0
+        return hourly_price(price_config, hours_ceil)
             
     return 0.0
 
@@ -102,4 +85,30 @@ def get_applicable_price_config(check_in_date: datetime.date, room_type_data: di
             return price_weekend
 
     # 3. Mặc định
-    return price_regular
\ No newline at end of file
+    return price_regular
+
+def calculate_stay_price(
+    check_in: datetime,
+    check_out: datetime,
+    booking_type: BookingType,
+    room_type_data: dict,
+    system_config: dict
+) -> float:
+    """
+    Tiền phòng theo lịch: Theo ngày cộng giá từng đêm (đêm thứ k theo loại ngày của check-in + k ngày),
+    nên kỳ nghỉ vắt qua cuối tuần / Lễ Tết được tính đúng từng đêm.
+    Theo giờ / Qua đêm: giá của ngày check-in (như cũ).
+    Bản scalar tham chiếu của PriceTable.quote.
+    """
+    if booking_type != BookingType.DAILY:
+        price_config = get_applicable_price_config(check_in.date(), room_type_data, system_config)
+        return calculate_estimated_price(check_in, check_out, booking_type, price_config)
+
+    ci = check_in.replace(tzinfo=None) if check_in.tzinfo is not None else check_in
+    co = check_out.replace(tzinfo=None) if check_out.tzinfo is not None else check_out
+    days = max(math.ceil((co - ci).total_seconds() / 86400), 1)
+    total = 0.0
+    for k in range(days):
+        night_config = get_applicable_price_config(ci.date() + timedelta(days=k), room_type_data, system_config)
+        total += float(night_config.get("daily_price", 0)) if night_config else 0.0
+    return total
@@ -0,0 +1,413 @@
+"""
+Đếm thao tác Firestore (read / write / transaction / bytes / latency) theo từng lần chạy trang.
+
+- `InstrumentedClient`: bọc client Firestore (hoặc client cục bộ cùng API); mọi query / document /
+  batch / transaction đi qua proxy để ghi nhận số document đọc, số write và thời gian.
+- `OpRecorder`: gom số liệu theo lần rerun của mỗi session (`begin_run`), cộng dồn theo trang,
+  giữ nhật ký cuộn các lần chạy gần nhất và cảnh báo khi 1 lần chạy vượt ngân sách read của trang.
+- Byte là ước lượng theo quy tắc tính dung lượng document của Firestore (không serialize thật).
+"""
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime
+
+BACKGROUND = "(background)"
+_DB_MODULE_SUFFIX = "db.py"
+
+
+def estimate_size(value) -> int:
+    """Ước lượng dung lượng (byte) của 1 giá trị theo cách Firestore tính."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime, date)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + 1 + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_size(v) for v in value)
+    return 8
+
+
+def parse_budgets(text: str) -> dict:
+    """"main=200,1_Dashboard=100" -> {"main": 200, "1_Dashboard": 100}."""
+    budgets = {}
+    for item in (text or "").split(","):
+        page, _, limit = item.partition("=")
+        if page.strip() and limit.strip().isdigit():
+            budgets[page.strip()] = int(limit)
+    return budgets
+
+
+def current_session_and_page():
+    """(session_id, page_name) của lần chạy Streamlit hiện tại; (None, BACKGROUND) nếu ở thread nền."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return None, BACKGROUND
+        page = ctx.pages_manager.get_pages().get(ctx.pages_manager.current_page_script_hash, {})
+        return ctx.session_id, page.get("page_name") or "main"
+    except Exception:
+        return None, BACKGROUND
+
+
+def _caller_name() -> str:
+    """Tên hàm trong src/db.py đã gây ra thao tác (để biết hàm nào tốn read)."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if frame.f_code.co_filename.endswith(_DB_MODULE_SUFFIX) and not name.startswith("<"):
+            return name
+        frame = frame.f_back
+    return "?"
+
+
+class RunStats:
+    """Số liệu của 1 lần chạy trang (1 rerun)."""
+
+    __slots__ = ("page", "session_id", "started_at", "reads", "writes", "transactions", "bytes",
+                 "latency_ms", "ops", "calls", "over_budget")
+
+    def __init__(self, page: str, session_id=None):
+        self.page = page
+        self.session_id = session_id
+        self.started_at = datetime.now()
+        self.reads = 0
+        self.writes = 0
+        self.transactions = 0
+        self.bytes = 0
+        self.latency_ms = 0.0
+        self.ops = 0
+        self.calls = Counter()  # tên hàm db.py -> số read
+        self.over_budget = False
+
+    def add(self, reads=0, writes=0, transactions=0, nbytes=0, latency_ms=0.0, caller="?"):
+        self.reads += reads
+        self.writes += writes
+        self.transactions += transactions
+        self.bytes += nbytes
+        self.latency_ms += latency_ms
+        self.ops += 1
+        if reads:
+            self.calls[caller] += reads
+
+    def to_dict(self) -> dict:
+        return {
+            "page": self.page,
+            "started_at": self.started_at,
+            "reads": self.reads,
+            "writes": self.writes,
+            "transactions": self.transactions,
+            "bytes": self.bytes,
+            "latency_ms": round(self.latency_ms, 1),
+            "ops": self.ops,
+            "top_calls": dict(self.calls.most_common(5)),
+            "over_budget": self.over_budget,
+        }
+
+
+class OpRecorder:
+    """
+    Args:
+        budgets: {page_name: số read tối đa mỗi lần chạy}.
+        default_budget: Ngân sách cho trang không khai báo (0 = không giới hạn).
+        log_size: Số lần chạy giữ trong nhật ký cuộn.
+    """
+
+    MAX_OPEN_RUNS = 500
+
+    def __init__(self, budgets: dict | None = None, default_budget: int = 0, log_size: int = 200):
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+        self._lock = threading.Lock()
+        self._runs = {}  # session_id -> RunStats đang chạy
+        self._pages = {}  # page -> tổng cộng dồn
+        self.log = deque(maxlen=log_size)
+
+    def budget_for(self, page: str) -> int:
+        return self.budgets.get(page, self.default_budget)
+
+    def set_budgets(self, budgets: dict, default_budget: int | None = None):
+        with self._lock:
+            self.budgets = dict(budgets)
+            if default_budget is not None:
+                self.default_budget = default_budget
+
+    # --- Vòng đời 1 lần chạy ---
+
+    def begin_run(self, session_id, page: str):
+        """Bắt đầu lần chạy mới của session; lần chạy trước được chốt vào nhật ký."""
+        with self._lock:
+            previous = self._runs.pop(session_id, None)
+            if previous is not None:
+                self._finish(previous)
+            if len(self._runs) >= self.MAX_OPEN_RUNS:
+                # Session đã đóng không bao giờ gọi begin_run nữa -> chốt lần chạy cũ nhất
+                oldest = min(self._runs, key=lambda k: self._runs[k].started_at)
+                self._finish(self._runs.pop(oldest))
+            self._runs[session_id] = RunStats(page, session_id)
+
+    def last_run(self, session_id) -> dict | None:
+        """Lần chạy đã chốt gần nhất của session."""
+        with self._lock:
+            for run in reversed(self.log):
+                if run["session_id"] == session_id:
+                    return run
+        return None
+
+    def _finish(self, run: RunStats):
+        entry = run.to_dict()
+        entry["session_id"] = run.session_id
+        entry["budget"] = self.budget_for(run.page)
+        self.log.append(entry)
+        totals = self._pages.setdefault(run.page, {
+            "runs": 0, "reads": 0, "writes": 0, "transactions": 0, "bytes": 0,
+            "latency_ms": 0.0, "max_reads": 0, "over_budget_runs": 0,
+        })
+        totals["runs"] += 1
+        totals["reads"] += run.reads
+        totals["writes"] += run.writes
+        totals["transactions"] += run.transactions
+        totals["bytes"] += run.bytes
+        totals["latency_ms"] += run.latency_ms
+        totals["max_reads"] = max(totals["max_reads"], run.reads)
+        totals["over_budget_runs"] += int(run.over_budget)
+
+    # --- Ghi nhận thao tác ---
+
+    def record(self, reads=0, writes=0, transactions=0, nbytes=0, latency_ms=0.0):
+        session_id, page = current_session_and_page()
+        caller = _caller_name()
+        with self._lock:
+            run = self._runs.get(session_id)
+            if run is None or session_id is None:
+                # Thread nền / trang chưa gọi begin_run: cộng thẳng vào tổng theo trang
+                run = self._runs.setdefault((session_id, page), RunStats(page, session_id))
+            run.add(reads, writes, transactions, nbytes, latency_ms, caller)
+            budget = self.budget_for(run.page)
+            if budget and run.reads > budget and not run.over_budget and run.session_id is not None:
+                run.over_budget = True
+                print(f"⚠️ DB read budget exceeded on page '{run.page}': {run.reads} reads > {budget} "
+                      f"(top: {dict(run.calls.most_common(3))})")
+
+    def flush_background(self):
+        """Chốt số liệu của thread nền / trang không có begin_run vào nhật ký."""
+        with self._lock:
+            for key in [k for k in self._runs if isinstance(k, tuple)]:
+                self._finish(self._runs.pop(key))
+
+    def page_stats(self) -> dict:
+        self.flush_background()
+        with self._lock:
+            result = {}
+            for page, totals in self._pages.items():
+                runs = totals["runs"] or 1
+                result[page] = {
+                    **totals,
+                    "latency_ms": round(totals["latency_ms"], 1),
+                    "avg_reads": round(totals["reads"] / runs, 1),
+                    "budget": self.budget_for(page),
+                }
+            return result
+
+    def recent_runs(self, limit: int = 50) -> list:
+        with self._lock:
+            return list(self.log)[-limit:][::-1]
+
+    def reset(self):
+        with self._lock:
+            self._pages.clear()
+            self.log.clear()
+
+
+# --- Proxy ---
+
+class _Proxy:
+    __slots__ = ("_target", "_recorder")
+
+    def __init__(self, target, recorder: OpRecorder):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_recorder", recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __eq__(self, other):
+        return self._target == _raw(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def _wrap(self, result):
+        if isinstance(result, _Proxy) or result is None:
+            return result
+        if hasattr(result, "stream"):
+            return _QueryProxy(result, self._recorder)
+        if hasattr(result, "update") and hasattr(result, "collection"):
+            return _DocumentProxy(result, self._recorder)
+        return result
+
+
+def _raw(obj):
+    return obj._target if isinstance(obj, _Proxy) else obj
+
+
+def _raw_kwargs(kwargs: dict) -> dict:
+    if "transaction" in kwargs:
+        kwargs["transaction"] = _raw(kwargs["transaction"])
+    return kwargs
+
+
+class _SnapshotProxy(_Proxy):
+    """Snapshot có `.reference` là proxy (để ghi qua doc.reference cũng được đếm)."""
+
+    __slots__ = ()
+
+    @property
+    def reference(self):
+        return _DocumentProxy(self._target.reference, self._recorder)
+
+
+def _doc_size(snapshot) -> int:
+    if not getattr(snapshot, "exists", True):
+        return 0
+    to_dict = getattr(snapshot, "to_dict", None)
+    return estimate_size(to_dict() or {}) if to_dict else 0
+
+
+class _QueryProxy(_Proxy):
+    """Collection / Query: đếm mỗi document trả về là 1 read (query rỗng vẫn tính 1 read)."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if callable(attr) and name not in ("stream", "get", "on_snapshot"):
+            def _call(*args, **kwargs):
+                return self._wrap(attr(*args, **kwargs))
+            return _call
+        return attr
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._target.document(*args, **kwargs), self._recorder)
+
+    def stream(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        count = nbytes = 0
+        try:
+            for snapshot in self._target.stream(*args, **_raw_kwargs(kwargs)):
+                count += 1
+                nbytes += _doc_size(snapshot)
+                yield _SnapshotProxy(snapshot, self._recorder)
+        finally:
+            self._recorder.record(reads=max(count, 1), nbytes=nbytes,
+                                  latency_ms=(time.perf_counter() - t0) * 1000)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+
+class _DocumentProxy(_Proxy):
+    __slots__ = ()
+
+    def collection(self, *args, **kwargs):
+        return _QueryProxy(self._target.collection(*args, **kwargs), self._recorder)
+
+    def get(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        snapshot = self._target.get(*args, **_raw_kwargs(kwargs))
+        self._recorder.record(reads=1, nbytes=_doc_size(snapshot),
+                              latency_ms=(time.perf_counter() - t0) * 1000)
+        return _SnapshotProxy(snapshot, self._recorder)
+
+    def _write(self, method, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = getattr(self._target, method)(*args, **kwargs)
+        nbytes = estimate_size(args[0]) if args and isinstance(args[0], dict) else 0
+        self._recorder.record(writes=1, nbytes=nbytes, latency_ms=(time.perf_counter() - t0) * 1000)
+        return result
+
+    def set(self, *args, **kwargs):
+        return self._write("set", *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write("create", *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write("update", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write("delete", *args, **kwargs)
+
+
+class _WriterProxy(_Proxy):
+    """WriteBatch / Transaction: đếm write khi thêm thao tác, read (transaction) khi get."""
+
+    __slots__ = ()
+
+    def _add_write(self, method, reference, *args, **kwargs):
+        getattr(self._target, method)(_raw(reference), *args, **kwargs)
+        nbytes = estimate_size(args[0]) if args and isinstance(args[0], dict) else 0
+        self._recorder.record(writes=1, nbytes=nbytes)
+        return self
+
+    def set(self, reference, *args, **kwargs):
+        return self._add_write("set", reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._add_write("create", reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._add_write("update", reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._add_write("delete", reference, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = self._target.commit(*args, **kwargs)
+        self._recorder.record(latency_ms=(time.perf_counter() - t0) * 1000)
+        return result
+
+    def get_all(self, references, *args, **kwargs):
+        t0 = time.perf_counter()
+        snapshots = list(self._target.get_all([_raw(r) for r in references], *args, **kwargs))
+        self._recorder.record(reads=len(snapshots), nbytes=sum(_doc_size(s) for s in snapshots),
+                              latency_ms=(time.perf_counter() - t0) * 1000)
+        return iter([_SnapshotProxy(s, self._recorder) for s in snapshots])
+
+    def get(self, ref_or_query, *args, **kwargs):
+        t0 = time.perf_counter()
+        snapshots = list(self._target.get(_raw(ref_or_query), *args, **kwargs))
+        self._recorder.record(reads=max(len(snapshots), 1), nbytes=sum(_doc_size(s) for s in snapshots),
+                              latency_ms=(time.perf_counter() - t0) * 1000)
+        return iter([_SnapshotProxy(s, self._recorder) for s in snapshots])
+
+
+class InstrumentedClient(_Proxy):
+    """Client Firestore có đếm thao tác. Các thuộc tính khác chuyển thẳng cho client gốc."""
+
+    __slots__ = ()
+
+    def collection(self, *args, **kwargs):
+        return _QueryProxy(self._target.collection(*args, **kwargs), self._recorder)
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._target.document(*args, **kwargs), self._recorder)
+
+    def batch(self, *args, **kwargs):
+        return _WriterProxy(self._target.batch(*args, **kwargs), self._recorder)
+
+    def transaction(self, *args, **kwargs):
+        self._recorder.record(transactions=1)
+        return _WriterProxy(self._target.transaction(*args, **kwargs), self._recorder)
+
+    def get_all(self, references, *args, **kwargs):
+        return _WriterProxy.get_all(self, references, *args, **kwargs)
@@ -17,6 +17,12 @@ class PriceConfig(BaseModel):
     extra_adult_surcharge: float = 0.0
     extra_adult_surcharge: float = 0.0
     extra_child_surcharge: float = 0.0
+
+    # --- Theo giờ: ở lố block cuối ---
+    # Mỗi giờ vượt block lớn nhất cộng thêm hourly_overflow_price (0 = giữ giá block lớn nhất).
+    # hourly_daily_cap: tự chuyển sang giá ngày (daily_price x số ngày) nếu rẻ hơn.
+    hourly_overflow_price: float = 0.0
+    hourly_daily_cap: bool = True
     
     # --- Cấu hình cho phép loại hình thuê ---
     enable_hourly: bool = True
@@ -103,14 +109,23 @@ class Booking(BaseModel):
     service_fee: float = 0.0  # Phụ thu / Dịch vụ
     payment_method: str = ""
 
+    # Snapshot bảng giá lúc đặt (PriceTable.rate_plan): trả phòng tính tiền từ đây, không đọc lại loại phòng
+    rate_plan: Optional[Dict] = None
+
     # --- Trường phục vụ đặt phòng online ---
     is_online: bool = False                           # Booking được tạo từ trang khách tự đặt
     online_payment_type: str = ""                    # "full" hoặc "deposit"
     online_payment_status: str = "pending"           # "pending" / "waiting_confirm" / "confirmed"
-    payment_screenshot_b64: Optional[str] = None     # Ảnh chụp màn hình thanh toán (base64)
+    payment_screenshot_ref: str = ""                 # Tham chiếu ảnh gốc trong blob store (gs://... / local://...)
+    payment_screenshot_thumb_b64: Optional[str] = None  # Thumbnail nhỏ (JPEG base64) để hiển thị danh sách
     payment_screenshot_name: str = ""                # Tên file ảnh
     payment_screenshot_mime: str = ""                # MIME type ảnh
 
+    # --- Dịch vụ đã gọi (cộng dồn bởi add_service_order) ---
+    service_total: float = 0.0                       # Tổng tiền gọi món
+    service_order_count: int = 0                     # Số order
+    service_items: List[Dict] = Field(default_factory=list)  # Tóm tắt từng order
+
     def to_dict(self):
         try: return self.model_dump()
         except AttributeError: return self.dict()
@@ -0,0 +1,83 @@
+"""
+Bộ phân giải quyền (role -> permission) đã biên dịch sẵn.
+
+- Load toàn bộ `config_permissions` 1 lần (qua `loader`), mỗi role -> frozenset.
+- Kiểm tra quyền = 1 phép `in` trên frozenset, không tốn read Firestore.
+- Load lại khi version cấu hình (`version_fn`) đổi -> quyền bị thu hồi ở process khác có hiệu lực
+  ngay lần kiểm tra kế tiếp; `invalidate()` cho process vừa lưu; `ttl_seconds` chỉ là lưới an toàn.
+- Đếm số lần kiểm tra theo từng trang (`stats()`).
+"""
+import threading
+import time
+from collections import Counter
+
+
+class PermissionResolver:
+    """
+    Args:
+        loader: Hàm trả về {role: [permission values]} (đã gộp cấu hình mặc định).
+        superuser_roles: Các role luôn có mọi quyền (Admin).
+        ttl_seconds: Thời gian dùng lại tối đa bản đã biên dịch.
+        version_fn: (optional) Hàm trả về version cấu hình hiện tại; version đổi -> biên dịch lại.
+    """
+
+    def __init__(self, loader, superuser_roles=(), ttl_seconds: float = 300.0, version_fn=None):
+        self._loader = loader
+        self._superusers = frozenset(superuser_roles)
+        self._ttl = ttl_seconds
+        self._version_fn = version_fn
+        self._lock = threading.Lock()
+        self._compiled = None
+        self._version = None
+        self._loaded_at = 0.0
+        self.loads = 0
+        self.checks = Counter()
+
+    def _fresh(self, version):
+        if self._compiled is None or self._version != version:
+            return None
+        if time.monotonic() - self._loaded_at >= self._ttl:
+            return None
+        return self._compiled
+
+    def _roles(self) -> dict:
+        version = self._version_fn() if self._version_fn else None
+        compiled = self._fresh(version)
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            compiled = self._fresh(version)
+            if compiled is not None:
+                return compiled
+            raw = self._loader() or {}
+            self._compiled = {
+                role: frozenset(p.value if hasattr(p, "value") else p for p in perms)
+                for role, perms in raw.items()
+            }
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+            return self._compiled
+
+    def permissions_for(self, role: str) -> frozenset:
+        return self._roles().get(role, frozenset())
+
+    def allowed(self, role: str, permission, page: str | None = None) -> bool:
+        """True nếu `role` có `permission` (Permission enum hoặc string)."""
+        self.checks[page or "?"] += 1
+        if role in self._superusers:
+            return True
+        perm_value = permission.value if hasattr(permission, "value") else permission
+        return perm_value in self.permissions_for(role)
+
+    def invalidate(self):
+        with self._lock:
+            self._compiled = None
+
+    def stats(self) -> dict:
+        return {
+            "loads": self.loads,
+            "version": self._version,
+            "total_checks": sum(self.checks.values()),
+            "checks_by_page": dict(self.checks.most_common()),
+        }
@@ -0,0 +1,475 @@
+"""
+Bảng giá biên dịch sẵn + báo giá hàng loạt (NumPy).
+
+`PriceTable` biên dịch toàn bộ loại phòng x loại ngày (thường / cuối tuần / lễ) thành mảng:
+- daily[t, d], overnight[t, d]: giá theo ngày / qua đêm
+- hourly[t, d, h]: giá theo số giờ h <= max_hours (từ `HourlyBlocks`: block nhỏ nhất >= h); lố block
+  cuối thì cộng `hourly_overflow_price` mỗi giờ, và chuyển sang giá ngày nếu rẻ hơn (`hourly_daily_cap`)
+
+`DayTypeCalendar` đánh dấu sẵn cuối tuần / ngày lễ theo từng năm (mảng uint8 theo day-of-year), tra
+loại ngày bằng index mảng thay cho dò danh sách chuỗi `holidays`.
+
+`quote()` nhận mảng (hoặc scalar, tự broadcast) loại phòng / loại hình / giờ vào / giờ ra và trả về
+mảng giá, cho kết quả giống `calculate_stay_price(...)`: Theo ngày cộng giá từng đêm theo loại ngày
+của đêm đó; Theo giờ / Qua đêm lấy giá của ngày check-in.
+
+`PriceTable.rate_plan()` tạo snapshot bảng giá gọn (giá theo loại ngày + lịch loại ngày của kỳ ở) để lưu
+lên booking; `quote_rate_plan()` tính lại tiền chỉ từ snapshot đó (trả phòng, gia hạn...).
+
+`QuoteCache`: LRU báo giá theo (loại phòng, loại hình, giờ vào / ra làm tròn phút, version bảng giá của
+loại phòng + special_days), để các lần rerun trang không tính lại cùng 1 báo giá.
+"""
+import hashlib
+import json
+import math
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from src.models import BookingType
+
+REGULAR, WEEKEND, HOLIDAY = 0, 1, 2
+DAY_TYPES = (REGULAR, WEEKEND, HOLIDAY)
+
+# Mã loại ngày trong rate plan lưu trên booking (lịch dạng chuỗi "RRWWH...")
+DAY_CODES = {REGULAR: "R", WEEKEND: "W", HOLIDAY: "H"}
+# Lịch trong rate plan phủ thêm bấy nhiêu ngày sau giờ ra dự kiến (khách ở quá hạn / gia hạn)
+RATE_PLAN_PAD_DAYS = 31
+
+# Cờ trong DayTypeCalendar (1 ngày lễ có thể đồng thời là cuối tuần)
+WEEKEND_FLAG, HOLIDAY_FLAG = 1, 2
+
+MODE_HOURLY, MODE_OVERNIGHT, MODE_DAILY = 0, 1, 2
+_MODE_CODES = {
+    BookingType.HOURLY.value: MODE_HOURLY,
+    BookingType.OVERNIGHT.value: MODE_OVERNIGHT,
+    BookingType.DAILY.value: MODE_DAILY,
+}
+
+
+def _mode_code(booking_type) -> int:
+    value = booking_type.value if hasattr(booking_type, "value") else booking_type
+    return _MODE_CODES.get(value, -1)
+
+
+def _special_pricing_enabled(pricing: dict | None) -> bool:
+    """Giá cuối tuần / lễ chỉ áp dụng khi có daily hoặc overnight > 0 (giống get_applicable_price_config)."""
+    return bool(pricing) and (pricing.get("daily_price", 0) > 0 or pricing.get("overnight_price", 0) > 0)
+
+
+def _naive(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+
+def round_to_minute(dt: datetime) -> datetime:
+    return _naive(dt).replace(second=0, microsecond=0)
+
+
+def _version_hash(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def to_datetime64(values) -> np.ndarray:
+    """datetime (có / không tzinfo) -> datetime64[us], bỏ tzinfo như hàm scalar."""
+    if isinstance(values, datetime):
+        return np.datetime64(_naive(values), "us")
+    if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[us]")
+    return np.array([_naive(v) for v in values], dtype="datetime64[us]")
+
+
+class HourlyBlocks:
+    """
+    Bảng giá theo giờ đã biên dịch: số giờ (int, tăng dần) + giá tương ứng.
+
+    `price(h)`: block nhỏ nhất có số giờ >= h (bisect); h lố block cuối -> giá block cuối +
+    (h - giờ block cuối) x overflow_price.
+    """
+
+    def __init__(self, blocks: dict, overflow_price: float = 0.0):
+        items = sorted((int(k), float(v)) for k, v in (blocks or {}).items())
+        self._hours = [h for h, _ in items]
+        self._prices = [p for _, p in items]
+        self.hours = np.array(self._hours, dtype=np.int64)
+        self.prices = np.array(self._prices, dtype=np.float64)
+        self.overflow_price = float(overflow_price or 0) if items else 0.0
+
+    @property
+    def last_hour(self) -> int:
+        return self._hours[-1] if self._hours else 0
+
+    @property
+    def last_price(self) -> float:
+        return self._prices[-1] if self._prices else 0.0
+
+    def price(self, hours: int) -> float:
+        if not self._hours:
+            return 0.0
+        i = bisect_left(self._hours, hours)
+        if i < len(self._hours):
+            return self._prices[i]
+        return self.last_price + (hours - self.last_hour) * self.overflow_price
+
+    def prices_for(self, hours: np.ndarray) -> np.ndarray:
+        hours = np.asarray(hours, dtype=np.int64)
+        if not self._hours:
+            return np.zeros(hours.shape)
+        i = np.searchsorted(self.hours, hours, side="left")
+        in_table = i < len(self._hours)
+        overflow = self.last_price + (hours - self.last_hour) * self.overflow_price
+        return np.where(in_table, self.prices[np.minimum(i, len(self._hours) - 1)], overflow)
+
+
+@lru_cache(maxsize=256)
+def _compile_hourly_blocks(items: tuple, overflow_price: float) -> HourlyBlocks:
+    return HourlyBlocks(dict(items), overflow_price)
+
+
+def compile_hourly_blocks(price_config: dict) -> HourlyBlocks:
+    """HourlyBlocks của 1 cấu hình giá (cache theo nội dung bảng giá)."""
+    price_config = price_config or {}
+    items = tuple(sorted((price_config.get("hourly_blocks") or {}).items()))
+    return _compile_hourly_blocks(items, float(price_config.get("hourly_overflow_price", 0) or 0))
+
+
+def hourly_price(price_config: dict, hours: int) -> float:
+    """Giá Theo giờ cho `hours` giờ (đã làm tròn lên), gồm phụ thu lố giờ và trần giá ngày."""
+    price = compile_hourly_blocks(price_config).price(hours)
+    daily = float((price_config or {}).get("daily_price", 0) or 0)
+    if (price_config or {}).get("hourly_daily_cap", True) and daily > 0:
+        price = min(price, daily * math.ceil(hours / 24))
+    return price
+
+
+class DayTypeCalendar:
+    """
+    Lịch loại ngày: mỗi năm 1 mảng uint8[366] (index = day-of-year, 0 = 1/1), giá trị là tổ hợp
+    WEEKEND_FLAG / HOLIDAY_FLAG. Năm được dựng khi tra lần đầu.
+
+    Args:
+        system_config: Cấu hình `special_days` ({"holidays": ["2025-04-30", ...], "weekend_weekdays": [5, 6]}).
+    """
+
+    def __init__(self, system_config: dict | None = None):
+        system_config = system_config or {}
+        weekend_mask = np.zeros(7, dtype=bool)
+        weekend_mask[[int(w) for w in system_config.get("weekend_weekdays", [])]] = True
+        self._weekend_mask = weekend_mask
+
+        self._holidays_by_year = {}
+        for value in system_config.get("holidays", []):
+            try:
+                day = np.datetime64(str(value), "D")
+            except ValueError:
+                print(f"⚠️ Ngày lễ không hợp lệ, bỏ qua: {value}")
+                continue
+            year = int(day.astype("datetime64[Y]").astype(np.int64)) + 1970
+            self._holidays_by_year.setdefault(year, []).append(day)
+        self._years = {}
+
+    def year(self, year: int) -> np.ndarray:
+        flags = self._years.get(year)
+        if flags is None:
+            start = np.datetime64(f"{year:04d}-01-01", "D")
+            days = np.arange(start, np.datetime64(f"{year + 1:04d}-01-01", "D"))
+            flags = np.zeros(366, dtype=np.uint8)
+            weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 là thứ Năm (Mon=0)
+            flags[:len(days)] = np.where(self._weekend_mask[weekday], WEEKEND_FLAG, 0)
+            holidays = self._holidays_by_year.get(year)
+            if holidays:
+                flags[(np.array(holidays) - start).astype(np.int64)] |= HOLIDAY_FLAG
+            self._years[year] = flags
+        return flags
+
+    def flags(self, days: np.ndarray) -> np.ndarray:
+        """Cờ loại ngày cho mảng datetime64[D] (cùng shape)."""
+        days = np.asarray(days, dtype="datetime64[D]")
+        year_start = days.astype("datetime64[Y]")
+        years = year_start.astype(np.int64) + 1970
+        doy = (days - year_start.astype("datetime64[D]")).astype(np.int64)
+        unique_years = np.unique(years)
+        if unique_years.size == 0:
+            return np.zeros(days.shape, dtype=np.uint8)
+        table = np.stack([self.year(int(y)) for y in unique_years])
+        return table[np.searchsorted(unique_years, years), doy]
+
+
+class PriceTable:
+    """
+    Args:
+        room_types: Danh sách loại phòng (dict như trong `config_room_types`).
+        system_config: Cấu hình `special_days` ({"holidays": [...], "weekend_weekdays": [...]}).
+    """
+
+    def __init__(self, room_types: list, system_config: dict | None = None):
+        system_config = system_config or {}
+        self.type_index = {t.get("type_code"): i for i, t in enumerate(room_types)}
+        special_days_hash = _version_hash(system_config)
+        # Version bảng giá theo loại phòng (giá thường / cuối tuần / lễ + special_days) cho QuoteCache
+        self.type_versions = {
+            t.get("type_code"): _version_hash(
+                t.get("pricing"), t.get("pricing_weekend"), t.get("pricing_holiday"), special_days_hash
+            )
+            for t in room_types
+        }
+        n = len(room_types)
+
+        # Cấu hình theo (loại phòng, loại ngày). Giá lễ / cuối tuần chỉ dùng khi đã cấu hình (valid)
+        configs = [
+            {
+                REGULAR: t.get("pricing") or {},
+                WEEKEND: t.get("pricing_weekend") or {},
+                HOLIDAY: t.get("pricing_holiday") or {},
+            }
+            for t in room_types
+        ]
+        self._configs = configs
+        self._weekend_valid = np.array([_special_pricing_enabled(c[WEEKEND]) for c in configs] + [False])
+        self._holiday_valid = np.array([_special_pricing_enabled(c[HOLIDAY]) for c in configs] + [False])
+
+        self.max_hours = max(
+            [int(k) for c in configs for cfg in c.values() for k in (cfg.get("hourly_blocks") or {})] or [1]
+        )
+        self.daily = np.zeros((n + 1, 3))  # Hàng cuối: loại phòng không tồn tại -> giá 0
+        self.overnight = np.zeros((n + 1, 3))
+        self.hourly = np.zeros((n + 1, 3, self.max_hours + 1))
+        self.hourly_last_hour = np.zeros((n + 1, 3), dtype=np.int64)
+        self.hourly_last_price = np.zeros((n + 1, 3))
+        self.hourly_overflow = np.zeros((n + 1, 3))
+        self.hourly_daily_cap = np.zeros((n + 1, 3), dtype=bool)
+        hour_range = np.arange(self.max_hours + 1)
+        for i, c in enumerate(configs):
+            for d in DAY_TYPES:
+                cfg = c[d]
+                if not cfg:
+                    continue
+                self.daily[i, d] = float(cfg.get("daily_price", 0))
+                self.overnight[i, d] = float(cfg.get("overnight_price", 0))
+                blocks = compile_hourly_blocks(cfg)
+                self.hourly[i, d] = blocks.prices_for(hour_range)
+                self.hourly_last_hour[i, d] = blocks.last_hour
+                self.hourly_last_price[i, d] = blocks.last_price
+                self.hourly_overflow[i, d] = blocks.overflow_price
+                self.hourly_daily_cap[i, d] = bool(cfg.get("hourly_daily_cap", True)) and self.daily[i, d] > 0
+
+        self.calendar = DayTypeCalendar(system_config)
+
+    def day_types(self, days: np.ndarray, type_idx: np.ndarray) -> np.ndarray:
+        """
+        Loại giá áp dụng cho từng (ngày, loại phòng), cùng thứ tự ưu tiên với
+        get_applicable_price_config: Lễ (nếu có giá lễ) > Cuối tuần (nếu có giá cuối tuần) > Thường.
+        """
+        flags = self.calendar.flags(days)
+        return np.where(
+            (flags & HOLIDAY_FLAG).astype(bool) & self._holiday_valid[type_idx],
+            HOLIDAY,
+            np.where((flags & WEEKEND_FLAG).astype(bool) & self._weekend_valid[type_idx], WEEKEND, REGULAR),
+        )
+
+    def _daily_totals(self, type_idx: np.ndarray, start_days: np.ndarray, nights: np.ndarray) -> np.ndarray:
+        """
+        Tổng giá Theo ngày = cộng giá từng đêm (đêm k tính theo loại ngày của check-in + k ngày).
+        Dùng prefix sum theo lịch trên khoảng ngày của cả lô -> O(1) mỗi phần tử.
+        """
+        if start_days.size == 0:
+            return np.zeros(0)
+        first = start_days.min()
+        span = int((start_days - first).astype(np.int64).max() + nights.max())
+        days = first + np.arange(span)
+        all_types = np.arange(len(self._configs) + 1)[:, None]
+        rates = self.daily[all_types, self.day_types(days[None, :], all_types)]
+        prefix = np.zeros((rates.shape[0], span + 1))
+        np.cumsum(rates, axis=1, out=prefix[:, 1:])
+        offset = (start_days - first).astype(np.int64)
+        return prefix[type_idx, offset + nights] - prefix[type_idx, offset]
+
+    def type_indices(self, type_codes) -> np.ndarray:
+        missing = len(self._configs)
+        if isinstance(type_codes, str):
+            return np.array(self.type_index.get(type_codes, missing))
+        return np.array([self.type_index.get(c, missing) for c in type_codes], dtype=np.int64)
+
+    def quote(self, type_codes, booking_types, check_ins, check_outs) -> np.ndarray:
+        """
+        Báo giá hàng loạt. Mỗi tham số là 1 giá trị hoặc 1 list (cùng độ dài / broadcast được).
+        Trả về mảng float giá tiền phòng.
+        """
+        t = self.type_indices(type_codes)
+        if isinstance(booking_types, (list, tuple, np.ndarray)):
+            modes = np.array([_mode_code(b) for b in booking_types], dtype=np.int64)
+        else:
+            modes = np.array(_mode_code(booking_types))
+        ci = to_datetime64(check_ins)
+        co = to_datetime64(check_outs)
+        t, modes, ci, co = np.broadcast_arrays(t, modes, ci, co)
+
+        ci_days = ci.astype("datetime64[D]")
+        d = self.day_types(ci_days, t)
+        seconds = (co - ci).astype("timedelta64[us]").astype(np.float64) / 1e6
+
+        nights = np.maximum(np.ceil(seconds / 86400), 1).astype(np.int64)
+        hours = np.maximum(np.ceil(seconds / 3600), 1).astype(np.int64)
+
+        is_daily = modes == MODE_DAILY
+        daily = np.zeros(t.shape)
+        daily[is_daily] = self._daily_totals(t[is_daily], ci_days[is_daily], nights[is_daily])
+
+        return np.select(
+            [is_daily, modes == MODE_OVERNIGHT, modes == MODE_HOURLY],
+            [daily, self.overnight[t, d], self._hourly_prices(t, d, hours)],
+            default=0.0,
+        )
+
+    def _hourly_prices(self, t: np.ndarray, d: np.ndarray, hours: np.ndarray) -> np.ndarray:
+        """Tra bảng hourly (h <= max_hours) hoặc công thức lố giờ, rồi áp trần giá ngày."""
+        in_table = self.hourly[t, d, np.minimum(hours, self.max_hours)]
+        overflow = self.hourly_last_price[t, d] + (hours - self.hourly_last_hour[t, d]) * self.hourly_overflow[t, d]
+        prices = np.where(hours <= self.max_hours, in_table, overflow)
+        daily_equiv = self.daily[t, d] * np.ceil(hours / 24)
+        return np.where(self.hourly_daily_cap[t, d], np.minimum(prices, daily_equiv), prices)
+
+    def quote_one(self, type_code: str, booking_type, check_in: datetime, check_out: datetime) -> float:
+        return float(self.quote(type_code, booking_type, check_in, check_out))
+
+    def special_nights(self, type_code: str, booking_type, check_in: datetime, check_out: datetime) -> int:
+        """Số đêm (Theo ngày) hoặc 1/0 (Theo giờ / Qua đêm) đang tính theo giá lễ / cuối tuần."""
+        idx = self.type_index.get(type_code)
+        if idx is None:
+            return 0
+        first = np.datetime64(_naive(check_in).date(), "D")
+        if _mode_code(booking_type) == MODE_DAILY:
+            seconds = (_naive(check_out) - _naive(check_in)).total_seconds()
+            days = first + np.arange(max(int(np.ceil(seconds / 86400)), 1))
+        else:
+            days = np.array([first])
+        return int(np.count_nonzero(self.day_types(days, np.full(days.shape, idx)) != REGULAR))
+
+    def rate_plan(self, type_code: str, booking_type, check_in: datetime, check_out: datetime) -> dict | None:
+        """
+        Snapshot bảng giá đã biên dịch của 1 loại phòng cho kỳ ở [check_in, check_out] (+ RATE_PLAN_PAD_DAYS):
+        {"version", "type_code", "mode", "start", "calendar": "RRWWH...", "rates": {"R": {...}, "W": {...}}}.
+        Mỗi rate là cấu hình giá gọn (daily / overnight / hourly_blocks / lố giờ) của loại ngày đó.
+        """
+        idx = self.type_index.get(type_code)
+        if idx is None:
+            return None
+        first = _naive(check_in).date()
+        seconds = (_naive(check_out) - _naive(check_in)).total_seconds()
+        nights = max(math.ceil(seconds / 86400), 1)
+        days = np.datetime64(first, "D") + np.arange(nights + RATE_PLAN_PAD_DAYS)
+        day_types = self.day_types(days, np.full(days.shape, idx)).tolist()
+        mode = booking_type.value if hasattr(booking_type, "value") else booking_type
+        return {
+            "version": self.type_versions.get(type_code),
+            "type_code": type_code,
+            "mode": mode,
+            "start": first.isoformat(),
+            "calendar": "".join(DAY_CODES[d] for d in day_types),
+            "rates": {DAY_CODES[d]: self._compact_rate(idx, d) for d in {REGULAR, *day_types}},
+        }
+
+    def _compact_rate(self, idx: int, day_type: int) -> dict:
+        blocks = compile_hourly_blocks(self._configs[idx][day_type])
+        return {
+            "daily_price": float(self.daily[idx, day_type]),
+            "overnight_price": float(self.overnight[idx, day_type]),
+            "hourly_blocks": {str(h): p for h, p in zip(blocks.hours.tolist(), blocks.prices.tolist())},
+            "hourly_overflow_price": blocks.overflow_price,
+            "hourly_daily_cap": bool(self.hourly_daily_cap[idx, day_type]),
+        }
+
+
+def quote_rate_plan(rate_plan: dict, check_in: datetime, check_out: datetime, booking_type=None) -> float:
+    """
+    Tiền phòng tính chỉ từ rate plan lưu trên booking (không đọc loại phòng / special_days).
+    Ngày nằm ngoài lịch của snapshot tính theo giá thường.
+    """
+    if not rate_plan:
+        return 0.0
+    start = date.fromisoformat(rate_plan["start"])
+    calendar = rate_plan.get("calendar", "")
+    rates = rate_plan.get("rates", {})
+
+    def rate_for(day: date) -> dict:
+        k = (day - start).days
+        code = calendar[k] if 0 <= k < len(calendar) else "R"
+        return rates.get(code) or rates.get("R") or {}
+
+    ci, co = _naive(check_in), _naive(check_out)
+    mode = _mode_code(booking_type if booking_type is not None else rate_plan.get("mode"))
+    seconds = (co - ci).total_seconds()
+    if mode == MODE_DAILY:
+        nights = max(math.ceil(seconds / 86400), 1)
+        return float(sum(rate_for(ci.date() + timedelta(days=k)).get("daily_price", 0) for k in range(nights)))
+    if mode == MODE_OVERNIGHT:
+        return float(rate_for(ci.date()).get("overnight_price", 0))
+    if mode == MODE_HOURLY:
+        return hourly_price(rate_for(ci.date()), max(math.ceil(seconds / 3600), 1))
+    return 0.0
+
+
+class QuoteCache:
+    """
+    LRU báo giá (thread-safe, tối đa `maxsize` entry).
+
+    Key: (loại phòng, loại hình, giờ vào, giờ ra làm tròn phút, version bảng giá của loại phòng).
+    Giá được tính trên giờ đã làm tròn nên kết quả không phụ thuộc giây lúc rerun trang.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def quote(self, table: PriceTable, type_codes, booking_type, check_in: datetime, check_out: datetime) -> list:
+        """Giá cho từng loại phòng trong `type_codes` (cùng thứ tự); các miss được tính chung 1 lần quote()."""
+        ci, co = round_to_minute(check_in), round_to_minute(check_out)
+        mode = booking_type.value if hasattr(booking_type, "value") else booking_type
+        keys = {code: (code, mode, ci, co, table.type_versions.get(code)) for code in dict.fromkeys(type_codes)}
+
+        prices, missing = {}, []
+        with self._lock:
+            for code, key in keys.items():
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    prices[code] = self._data[key]
+                    self.hits += 1
+                else:
+                    missing.append(code)
+                    self.misses += 1
+
+        if missing:
+            computed = table.quote(missing, booking_type, ci, co).tolist()
+            with self._lock:
+                for code, price in zip(missing, computed):
+                    prices[code] = price
+                    self._data[keys[code]] = price
+                    self._data.move_to_end(keys[code])
+                while len(self._data) > self._maxsize:
+                    self._data.popitem(last=False)
+        return [prices[code] for code in type_codes]
+
+    def invalidate(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self._maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
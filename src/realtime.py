@@ -0,0 +1,264 @@
+"""
+Real-time mirror của trạng thái phòng (rooms / bookings đang hoạt động / loại phòng).
+
+- Nguồn thay đổi (ChangeSource) đẩy sự kiện ADDED / MODIFIED / REMOVED vào mirror.
+- Mirror vá dữ liệu trong bộ nhớ theo từng document -> các trang đọc 0 read/rerun.
+- Listener chết (lỗi quyền, watch bị đóng, mất mạng lâu hơn số lần thử lại của SDK) -> `check_health()`
+  ngừng phục vụ collection đó (người đọc quay về snapshot cache) và đăng ký lại; snapshot ban đầu
+  của listener mới đưa collection về trạng thái sẵn sàng.
+- `FirestoreChangeSource`: dùng `on_snapshot` của Firestore (listener chạy nền).
+- `LocalChangeSource`: bản thay thế cục bộ để chạy/kiểm thử không cần project thật.
+"""
+import threading
+import time
+from datetime import datetime
+
+ADDED = "ADDED"
+MODIFIED = "MODIFIED"
+REMOVED = "REMOVED"
+
+# Các collection được mirror
+ROOMS = "rooms"
+BOOKINGS = "bookings"
+ROOM_TYPES = "config_room_types"
+MIRRORED_COLLECTIONS = (ROOMS, BOOKINGS, ROOM_TYPES)
+
+
+class ChangeSource:
+    """
+    Interface nguồn thay đổi.
+
+    `subscribe(collection, callback)` đăng ký nhận sự kiện cho 1 collection.
+    callback(changes, is_initial) với changes = [(kind, doc_id, data), ...].
+    `is_alive(collection)` False khi listener đã dừng hẳn; `resubscribe(collection)` đăng ký lại
+    (listener mới gửi lại snapshot ban đầu). `close()` hủy toàn bộ đăng ký.
+    """
+
+    def subscribe(self, collection: str, callback):
+        raise NotImplementedError
+
+    def is_alive(self, collection: str) -> bool:
+        return True
+
+    def resubscribe(self, collection: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FirestoreChangeSource(ChangeSource):
+    """Nguồn thay đổi từ Firestore `on_snapshot` (listener chạy ở thread nền của SDK)."""
+
+    def __init__(self, db, active_booking_statuses: list):
+        self._db = db
+        self._active_statuses = active_booking_statuses
+        self._callbacks = {}
+        self._watches = {}
+
+    def _query_for(self, collection: str):
+        ref = self._db.collection(collection)
+        if collection == BOOKINGS:
+            # Chỉ mirror booking đang hoạt động; booking hoàn tất/hủy sẽ rơi khỏi query (REMOVED)
+            return ref.where("status", "in", self._active_statuses)
+        return ref
+
+    def subscribe(self, collection: str, callback):
+        self._callbacks[collection] = callback
+        self._watches[collection] = self._watch(collection, callback)
+
+    def _watch(self, collection: str, callback):
+        state = {"initial": True}
+
+        def _on_snapshot(col_snapshot, changes, read_time):
+            events = []
+            for change in changes:
+                kind = change.type.name  # ADDED / MODIFIED / REMOVED
+                doc = change.document
+                events.append((kind, doc.id, doc.to_dict() if kind != REMOVED else None))
+            is_initial = state["initial"]
+            state["initial"] = False
+            callback(events, is_initial)
+
+        return self._query_for(collection).on_snapshot(_on_snapshot)
+
+    def is_alive(self, collection: str) -> bool:
+        # Watch tự đóng khi RPC lỗi không phục hồi được (SDK chỉ log, không gọi callback)
+        watch = self._watches.get(collection)
+        return watch is not None and watch.is_active
+
+    def resubscribe(self, collection: str):
+        old = self._watches.pop(collection, None)
+        if old is not None:
+            try:
+                old.unsubscribe()
+            except Exception:
+                pass
+        self.subscribe(collection, self._callbacks[collection])
+
+    def close(self):
+        for w in self._watches.values():
+            try:
+                w.unsubscribe()
+            except Exception:
+                pass
+        self._watches = {}
+
+
+class LocalChangeSource(ChangeSource):
+    """
+    Nguồn thay đổi cục bộ (stand-in), dùng khi test hoặc chạy offline.
+
+    Gọi `load()` để đẩy snapshot ban đầu, `push()` / `remove()` để giả lập thay đổi,
+    `fail()` để giả lập listener bị đóng (resubscribe gửi lại snapshot hiện tại).
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._docs = {}
+        self._dead = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, collection: str, callback):
+        with self._lock:
+            self._subscribers.setdefault(collection, []).append(callback)
+
+    def _emit(self, collection: str, events: list, is_initial: bool):
+        with self._lock:
+            if collection in self._dead:
+                return
+            callbacks = list(self._subscribers.get(collection, []))
+        for cb in callbacks:
+            cb(events, is_initial)
+
+    def load(self, collection: str, docs: dict):
+        """Snapshot ban đầu: docs = {doc_id: data}."""
+        self._docs[collection] = dict(docs)
+        self._emit(collection, [(ADDED, k, v) for k, v in docs.items()], True)
+
+    def push(self, collection: str, doc_id: str, data: dict):
+        self._docs.setdefault(collection, {})[doc_id] = data
+        self._emit(collection, [(MODIFIED, doc_id, data)], False)
+
+    def remove(self, collection: str, doc_id: str):
+        self._docs.setdefault(collection, {}).pop(doc_id, None)
+        self._emit(collection, [(REMOVED, doc_id, None)], False)
+
+    def fail(self, collection: str):
+        """Giả lập listener bị đóng: không gửi sự kiện nữa cho tới khi resubscribe."""
+        with self._lock:
+            self._dead.add(collection)
+
+    def is_alive(self, collection: str) -> bool:
+        with self._lock:
+            return collection not in self._dead
+
+    def resubscribe(self, collection: str):
+        with self._lock:
+            self._dead.discard(collection)
+        self.load(collection, self._docs.get(collection, {}))
+
+    def close(self):
+        with self._lock:
+            self._subscribers = {}
+
+
+class LiveMirror:
+    """
+    Bản sao trong bộ nhớ của các collection, được vá từng document theo sự kiện.
+
+    Chỉ phục vụ đọc khi collection đã nhận snapshot ban đầu và listener còn sống (`is_ready`).
+
+    Args:
+        source: Nguồn thay đổi.
+        health_check_seconds: Khoảng cách tối thiểu giữa 2 lần `check_health()` kiểm tra listener.
+    """
+
+    def __init__(self, source: ChangeSource, health_check_seconds: float = 5.0):
+        self._source = source
+        self._lock = threading.RLock()
+        self._docs = {name: {} for name in MIRRORED_COLLECTIONS}
+        self._ready = set()
+        self._health_check_seconds = health_check_seconds
+        self._checked_at = 0.0
+        self.events_applied = 0
+        self.last_event_at = None
+        self.last_snapshot_at = {}  # collection -> lần nhận sự kiện cuối
+        self.resubscribes = 0
+
+    def start(self):
+        for name in MIRRORED_COLLECTIONS:
+            self._source.subscribe(name, self._make_callback(name))
+        return self
+
+    def stop(self):
+        self._source.close()
+        with self._lock:
+            self._ready.clear()
+
+    def _make_callback(self, collection: str):
+        def _callback(events, is_initial):
+            self.apply(collection, events, is_initial)
+        return _callback
+
+    def apply(self, collection: str, events: list, is_initial: bool = False):
+        """Vá dữ liệu theo danh sách sự kiện [(kind, doc_id, data), ...]."""
+        with self._lock:
+            docs = self._docs[collection]
+            if is_initial:
+                docs.clear()
+            for kind, doc_id, data in events:
+                if kind == REMOVED:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = data or {}
+            self._ready.add(collection)
+            self.events_applied += len(events)
+            self.last_event_at = datetime.now()
+            self.last_snapshot_at[collection] = self.last_event_at
+
+    def is_ready(self, collection: str) -> bool:
+        return collection in self._ready
+
+    def check_health(self, force: bool = False) -> list:
+        """
+        Kiểm tra listener (tối đa 1 lần / health_check_seconds). Listener đã dừng -> collection thôi
+        sẵn sàng (đọc quay về snapshot cache) và đăng ký lại. Trả về các collection vừa phát hiện chết.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self._health_check_seconds:
+            return []
+        self._checked_at = now
+        dead = [name for name in MIRRORED_COLLECTIONS if not self._source.is_alive(name)]
+        for name in dead:
+            with self._lock:
+                self._ready.discard(name)
+            self.resubscribes += 1
+            try:
+                self._source.resubscribe(name)
+            except Exception as e:
+                print(f"⚠️ Failed to resubscribe realtime mirror for {name}: {e}")
+        return dead
+
+    def rooms(self) -> list:
+        with self._lock:
+            return [dict(r) for r in self._docs[ROOMS].values()]
+
+    def active_bookings(self) -> dict:
+        with self._lock:
+            return {k: dict(v) for k, v in self._docs[BOOKINGS].items()}
+
+    def room_types(self) -> list:
+        with self._lock:
+            return [dict(t) for t in self._docs[ROOM_TYPES].values()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": sorted(self._ready),
+                "counts": {k: len(v) for k, v in self._docs.items()},
+                "events_applied": self.events_applied,
+                "last_event_at": self.last_event_at,
+                "last_snapshot_at": dict(self.last_snapshot_at),
+                "resubscribes": self.resubscribes,
+            }
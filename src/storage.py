@@ -0,0 +1,985 @@
+"""
+Storage backend cho src/db.py.
+
+db.py chỉ dùng một phần Firestore client API (collection / document / where / stream /
+batch / transaction / on_snapshot). Phần API đó chính là "interface" của storage backend:
+
+- "firestore" (mặc định): firebase_admin Firestore client (production).
+- "memory": LocalClient, toàn bộ dữ liệu trong RAM (benchmark, load test).
+- "sqlite": LocalClient ghi xuống file SQLite, query bằng SQL (dataset lớn, giữ lại giữa các lần chạy).
+
+LocalClient giữ ngữ nghĩa transaction của Firestore:
+- Mọi lệnh đọc phải đứng trước lệnh ghi (ReadAfterWriteError).
+- Optimistic concurrency: lúc commit kiểm tra lại version của document đã đọc
+  và kết quả các query đã đọc; có thay đổi -> TransactionConflict, tự retry.
+- Batch / transaction ghi nguyên khối (all-or-nothing), tối đa 500 thao tác.
+
+Chọn backend bằng biến môi trường STORAGE_BACKEND (firestore | memory | sqlite).
+"""
+import json
+import random
+import sqlite3
+import string
+import threading
+import time
+from datetime import datetime, timezone
+from enum import Enum
+
+from firebase_admin import firestore
+from google.api_core.exceptions import Aborted, AlreadyExists, NotFound
+from google.cloud.firestore_v1 import transforms
+
+DOCUMENT_ID = "__name__"
+MAX_TRANSACTION_ATTEMPTS = 5
+MAX_WRITES_PER_COMMIT = 500
+
+# Field được đánh index (expression index) trong backend SQLite
+SQLITE_INDEXED_FIELDS = [
+    "status",
+    "room_id",
+    "booking_id",
+    "customer_phone",
+    "is_online",
+    "check_in",
+    "check_out_actual",
+    "phone",
+]
+
+
+class TransactionConflict(Aborted):
+    """Transaction bị hủy do dữ liệu đã đọc bị transaction khác thay đổi."""
+
+
+class ReadAfterWriteError(ValueError):
+    """Firestore yêu cầu mọi lệnh đọc trong transaction đứng trước lệnh ghi."""
+
+
+class ChangeType(Enum):
+    """Giống google.cloud.firestore_v1.watch.ChangeType (dùng `.name`)."""
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+_MISSING = object()
+
+
+# --- 1. VALUE HELPERS ---
+
+def _normalize(value):
+    """
+    Chuẩn hoá giá trị trước khi lưu (Enum -> value, datetime -> UTC naive).
+    Giống Firestore SDK: datetime không có tzinfo được coi là UTC.
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _copy(value):
+    """Copy sâu cho dict/list (nhanh hơn copy.deepcopy với dữ liệu JSON-like)."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _to_client(value):
+    """Giống Firestore: timestamp trả về luôn là datetime UTC có tzinfo."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {k: _to_client(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_client(v) for v in value]
+    return value
+
+
+def _get_field(data: dict, field_path: str):
+    cur = data
+    for part in field_path.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return _MISSING
+        cur = cur[part]
+    return cur
+
+
+def _resolve(current, value):
+    """Áp dụng transform (Increment, ArrayUnion, SERVER_TIMESTAMP...) lên giá trị hiện tại."""
+    if value is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, transforms.Maximum):
+        return value.value if not isinstance(current, (int, float)) else max(current, value.value)
+    if isinstance(value, transforms.Minimum):
+        return value.value if not isinstance(current, (int, float)) else min(current, value.value)
+    if isinstance(value, transforms.ArrayUnion):
+        result = list(current) if isinstance(current, list) else []
+        for v in value.values:
+            v = _normalize(v)
+            if v not in result:
+                result.append(v)
+        return result
+    if isinstance(value, transforms.ArrayRemove):
+        removed = [_normalize(v) for v in value.values]
+        return [v for v in (current if isinstance(current, list) else []) if v not in removed]
+    return _copy(_normalize(value))
+
+
+def _merge(base: dict, data: dict) -> dict:
+    """Gộp `data` vào bản copy của `base` (ngữ nghĩa set(..., merge=True))."""
+    result = dict(base) if isinstance(base, dict) else {}
+    for key, value in data.items():
+        if value is transforms.DELETE_FIELD:
+            result.pop(key, None)
+        elif isinstance(value, dict):
+            result[key] = _merge(result.get(key), value)
+        else:
+            result[key] = _resolve(result.get(key), value)
+    return result
+
+
+def _set_path(data: dict, field_path: str, value):
+    """Ghi 1 field theo field path (ngữ nghĩa update())."""
+    parts = field_path.split(".")
+    cur = data
+    for part in parts[:-1]:
+        if not isinstance(cur.get(part), dict):
+            cur[part] = {}
+        cur[part] = dict(cur[part])
+        cur = cur[part]
+    last = parts[-1]
+    if value is transforms.DELETE_FIELD:
+        cur.pop(last, None)
+    elif isinstance(value, dict):
+        cur[last] = _merge({}, value)
+    else:
+        cur[last] = _resolve(cur.get(last), value)
+
+
+def _apply_write(old, write) -> dict | None:
+    """Tính document mới sau 1 thao tác ghi. Trả về None nếu document bị xóa."""
+    op, path, data, merge = write
+    if op == "delete":
+        return None
+    if op == "create":
+        if old is not None:
+            raise AlreadyExists(f"Document already exists: {path}")
+        return _merge({}, data)
+    if op == "set":
+        return _merge(old, data) if merge else _merge({}, data)
+    if op == "update":
+        if old is None:
+            raise NotFound(f"No document to update: {path}")
+        new = dict(old)
+        for field_path, value in data.items():
+            _set_path(new, field_path, value)
+        return new
+    raise ValueError(f"Unknown write op: {op}")
+
+
+def _sort_key(value):
+    """Thứ tự giữa các kiểu giống Firestore: null < bool < number < timestamp < string."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _matches_filter(doc_id: str, data: dict, field_path: str, op: str, value) -> bool:
+    actual = doc_id if field_path == DOCUMENT_ID else _get_field(data, field_path)
+    if actual is _MISSING:
+        return False
+    try:
+        if op == "==":
+            return actual == value
+        if op == "!=":
+            return actual != value and actual is not None
+        if op == "in":
+            return actual in value
+        if op == "not-in":
+            return actual not in value and actual is not None
+        if op == "array_contains":
+            return isinstance(actual, list) and value in actual
+        if op == "array_contains_any":
+            return isinstance(actual, list) and any(v in actual for v in value)
+        if op == "<":
+            return actual < value
+        if op == "<=":
+            return actual <= value
+        if op == ">":
+            return actual > value
+        if op == ">=":
+            return actual >= value
+    except TypeError:
+        # Khác kiểu dữ liệu -> Firestore không so sánh được -> không khớp
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _project(data: dict, field_paths) -> dict:
+    """Chỉ giữ lại các field được select()."""
+    result = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is _MISSING:
+            continue
+        parts = field_path.split(".")
+        cur = result
+        for part in parts[:-1]:
+            cur = cur.setdefault(part, {})
+        cur[parts[-1]] = _copy(value)
+    return result
+
+
+def _random_id(length: int = 20) -> str:
+    alphabet = string.ascii_letters + string.digits
+    return "".join(random.choice(alphabet) for _ in range(length))
+
+
+def _split_path(path: str) -> tuple[str, str]:
+    collection, _, doc_id = path.rpartition("/")
+    return collection, doc_id
+
+
+# --- 2. QUERY SPEC ---
+
+class QuerySpec:
+    """Mô tả 1 query (immutable): collection + filters + order + limit + projection."""
+
+    __slots__ = ("collection", "filters", "orders", "limit", "offset", "select")
+
+    def __init__(self, collection, filters=(), orders=(), limit=None, offset=0, select=None):
+        self.collection = collection
+        self.filters = tuple(filters)
+        self.orders = tuple(orders)
+        self.limit = limit
+        self.offset = offset
+        self.select = tuple(select) if select is not None else None
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return QuerySpec(**values)
+
+    def matches(self, doc_id: str, data: dict) -> bool:
+        if data is None:
+            return False
+        for field_path, op, value in self.filters:
+            if not _matches_filter(doc_id, data, field_path, op, value):
+                return False
+        for field_path, _direction in self.orders:
+            # Firestore bỏ qua document thiếu field dùng để order_by
+            if field_path != DOCUMENT_ID and _get_field(data, field_path) is _MISSING:
+                return False
+        return True
+
+    def sort_and_slice(self, rows: list) -> list:
+        """rows = [(doc_id, data, version)] đã lọc -> sắp xếp, offset, limit."""
+        rows.sort(key=lambda r: r[0])
+        for field_path, direction in reversed(self.orders):
+            if field_path == DOCUMENT_ID:
+                rows.sort(key=lambda r: r[0], reverse=(direction == firestore.Query.DESCENDING))
+            else:
+                rows.sort(
+                    key=lambda r: _sort_key(_get_field(r[1], field_path)),
+                    reverse=(direction == firestore.Query.DESCENDING),
+                )
+        if self.offset:
+            rows = rows[self.offset:]
+        if self.limit is not None:
+            rows = rows[:self.limit]
+        return rows
+
+
+# --- 3. STORES ---
+
+class _Store:
+    """
+    Phần chung của các store cục bộ: commit nguyên khối + kiểm tra xung đột + listener.
+
+    Subclass cài đặt: _get(path), _query(spec), _begin(), _put(path, data, version),
+    _delete(path), _end().
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dispatch_lock = threading.Lock()
+        self._listeners = {}
+        self._pending_events = []
+        self._seq = 0
+
+    # --- Read ---
+    def get(self, path: str):
+        """Trả về (data, version) hoặc None nếu không tồn tại."""
+        with self._lock:
+            return self._get(path)
+
+    def query(self, spec: QuerySpec) -> list:
+        """Trả về [(doc_id, data, version)] theo thứ tự của query."""
+        with self._lock:
+            return self._query(spec)
+
+    # --- Write ---
+    def commit(self, writes: list, read_versions: dict | None = None, read_queries: list | None = None) -> int:
+        """
+        Ghi nguyên khối danh sách `writes` = [(op, path, data, merge)].
+
+        `read_versions` {path: version} và `read_queries` [(spec, {doc_id: version})]
+        là những gì transaction đã đọc; nếu đã bị thay đổi -> TransactionConflict.
+        """
+        if len(writes) > MAX_WRITES_PER_COMMIT:
+            raise ValueError(f"Maximum {MAX_WRITES_PER_COMMIT} writes allowed per request")
+
+        with self._lock:
+            for path, version in (read_versions or {}).items():
+                current = self._get(path)
+                if (current[1] if current else 0) != version:
+                    raise TransactionConflict(f"Document changed during transaction: {path}")
+            for spec, seen in (read_queries or []):
+                now = {doc_id: version for doc_id, _data, version in self._query(spec)}
+                if now != seen:
+                    raise TransactionConflict(f"Query result changed during transaction: {spec.collection}")
+
+            # Tính toàn bộ kết quả trước khi ghi -> lỗi (NotFound...) không để lại ghi dở dang
+            staged, before = {}, {}
+            for write in writes:
+                path = write[1]
+                if path in staged:
+                    old = staged[path]
+                else:
+                    current = self._get(path)
+                    old = current[0] if current else None
+                    before[path] = old
+                staged[path] = _apply_write(old, write)
+
+            self._seq += 1
+            version = self._seq
+            if staged:
+                self._begin()
+                try:
+                    for path, data in staged.items():
+                        if data is None:
+                            self._delete(path)
+                        else:
+                            self._put(path, data, version)
+                finally:
+                    self._end()
+                self._queue_events(before, staged)
+
+        self._dispatch()
+        return version
+
+    # --- Listeners (on_snapshot) ---
+    def add_listener(self, spec: QuerySpec, callback) -> int:
+        listener_id = id(callback) ^ int(time.monotonic_ns())
+        with self._lock:
+            self._listeners[listener_id] = (spec, callback)
+            rows = self._query(spec)
+            # Snapshot ban đầu: mọi document đều là ADDED
+            self._pending_events.append((spec, callback, rows, [(ChangeType.ADDED, r) for r in rows]))
+        self._dispatch()
+        return listener_id
+
+    def remove_listener(self, listener_id: int):
+        with self._lock:
+            self._listeners.pop(listener_id, None)
+
+    def has_listener(self, listener_id: int) -> bool:
+        with self._lock:
+            return listener_id in self._listeners
+
+    def _queue_events(self, before: dict, after: dict):
+        for spec, callback in self._listeners.values():
+            changes = []
+            for path, new_data in after.items():
+                collection, doc_id = _split_path(path)
+                if collection != spec.collection:
+                    continue
+                was = spec.matches(doc_id, before.get(path))
+                now = spec.matches(doc_id, new_data)
+                if now:
+                    kind = ChangeType.MODIFIED if was else ChangeType.ADDED
+                    changes.append((kind, (doc_id, new_data, self._seq)))
+                elif was:
+                    changes.append((ChangeType.REMOVED, (doc_id, before[path], self._seq)))
+            if changes:
+                self._pending_events.append((spec, callback, None, changes))
+
+    def _dispatch(self):
+        # Gửi sự kiện theo đúng thứ tự commit, ngoài store lock (callback có thể đọc lại store)
+        with self._dispatch_lock:
+            while True:
+                with self._lock:
+                    if not self._pending_events:
+                        return
+                    spec, callback, rows, changes = self._pending_events.pop(0)
+                    if rows is None:
+                        rows = self._query(spec)
+                try:
+                    callback(rows, changes)
+                except Exception as e:
+                    print(f"⚠️ Snapshot listener error: {e}")
+
+    # --- Bulk load (seed dữ liệu, không qua listener) ---
+    def bulk_load(self, collection: str, docs):
+        """Nạp nhanh [(doc_id, data)] vào collection (dùng cho seed dataset)."""
+        with self._lock:
+            self._seq += 1
+            self._begin()
+            try:
+                for doc_id, data in docs:
+                    self._put(f"{collection}/{doc_id}", _normalize(data), self._seq)
+            finally:
+                self._end()
+
+    def close(self):
+        pass
+
+
+class MemoryStore(_Store):
+    """Store trong RAM, có index bằng (equality) tự tạo khi query lần đầu."""
+
+    def __init__(self):
+        super().__init__()
+        self._collections = {}
+        self._indexes = {}
+
+    def _get(self, path):
+        collection, doc_id = _split_path(path)
+        return self._collections.get(collection, {}).get(doc_id)
+
+    def _index_for(self, collection: str, field_path: str) -> dict:
+        by_field = self._indexes.setdefault(collection, {})
+        if field_path not in by_field:
+            index = {}
+            for doc_id, (data, _v) in self._collections.get(collection, {}).items():
+                value = _get_field(data, field_path)
+                if value is not _MISSING and _hashable(value):
+                    index.setdefault(value, set()).add(doc_id)
+            by_field[field_path] = index
+        return by_field[field_path]
+
+    def _reindex(self, collection: str, doc_id: str, old, new):
+        for field_path, index in self._indexes.get(collection, {}).items():
+            if old is not None:
+                value = _get_field(old, field_path)
+                if value is not _MISSING and _hashable(value):
+                    ids = index.get(value)
+                    if ids:
+                        ids.discard(doc_id)
+            if new is not None:
+                value = _get_field(new, field_path)
+                if value is not _MISSING and _hashable(value):
+                    index.setdefault(value, set()).add(doc_id)
+
+    def _query(self, spec: QuerySpec):
+        docs = self._collections.get(spec.collection, {})
+        candidates = None
+        for field_path, op, value in spec.filters:
+            if field_path == DOCUMENT_ID or op not in ("==", "in"):
+                continue
+            values = [value] if op == "==" else list(value)
+            if not all(_hashable(v) for v in values):
+                continue
+            index = self._index_for(spec.collection, field_path)
+            ids = set()
+            for v in values:
+                ids |= index.get(v, set())
+            candidates = ids if candidates is None else candidates & ids
+
+        items = docs.items() if candidates is None else ((i, docs[i]) for i in candidates if i in docs)
+        rows = [(doc_id, data, version) for doc_id, (data, version) in items if spec.matches(doc_id, data)]
+        return spec.sort_and_slice(rows)
+
+    def _begin(self):
+        pass
+
+    def _put(self, path, data, version):
+        collection, doc_id = _split_path(path)
+        docs = self._collections.setdefault(collection, {})
+        old = docs.get(doc_id)
+        docs[doc_id] = (data, version)
+        self._reindex(collection, doc_id, old[0] if old else None, data)
+
+    def _delete(self, path):
+        collection, doc_id = _split_path(path)
+        old = self._collections.get(collection, {}).pop(doc_id, None)
+        if old:
+            self._reindex(collection, doc_id, old[0], None)
+
+    def _end(self):
+        pass
+
+
+def _hashable(value) -> bool:
+    return isinstance(value, (str, int, float, bool, datetime)) or value is None
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat(timespec="microseconds")}
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1 and "__dt__" in obj:
+        return datetime.fromisoformat(obj["__dt__"])
+    return obj
+
+
+def _sql_field(field_path: str) -> str:
+    """Biểu thức SQL lấy giá trị field (datetime lưu dạng {"__dt__": iso} -> so sánh theo chuỗi ISO)."""
+    json_path = "$." + ".".join('"%s"' % p.replace('"', '\\"').replace("'", "''") for p in field_path.split("."))
+    return (
+        f"COALESCE(json_extract(data, '{json_path}.\"__dt__\"'), json_extract(data, '{json_path}'))"
+    )
+
+
+def _sql_param(value):
+    if isinstance(value, Enum):
+        value = value.value
+    if isinstance(value, datetime):
+        return _normalize(value).isoformat(timespec="microseconds")
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class SqliteStore(_Store):
+    """Store ghi xuống file SQLite; filter/order/limit chạy bằng SQL (có expression index)."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " collection TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, version INTEGER NOT NULL,"
+            " PRIMARY KEY (collection, id))"
+        )
+        for field_path in SQLITE_INDEXED_FIELDS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_docs_{field_path} ON docs (collection, {_sql_field(field_path)})"
+            )
+        row = self._conn.execute("SELECT COALESCE(MAX(version), 0) FROM docs").fetchone()
+        self._seq = row[0]
+
+    def _decode(self, text: str) -> dict:
+        return json.loads(text, object_hook=_json_object_hook)
+
+    def _get(self, path):
+        collection, doc_id = _split_path(path)
+        row = self._conn.execute(
+            "SELECT data, version FROM docs WHERE collection = ? AND id = ?", (collection, doc_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._decode(row[0]), row[1]
+
+    def _query(self, spec: QuerySpec):
+        where, params = ["collection = ?"], [spec.collection]
+        for field_path, op, value in spec.filters:
+            expr = "id" if field_path == DOCUMENT_ID else _sql_field(field_path)
+            if op == "==":
+                if value is None:
+                    where.append(f"json_type(data, '$.{field_path}') = 'null'")
+                else:
+                    where.append(f"{expr} = ?")
+                    params.append(_sql_param(value))
+            elif op in ("<", "<=", ">", ">="):
+                where.append(f"{expr} {op} ?")
+                params.append(_sql_param(value))
+            elif op == "!=":
+                where.append(f"{expr} IS NOT NULL AND {expr} != ?")
+                params.append(_sql_param(value))
+            elif op in ("in", "not-in"):
+                values = list(value)
+                if not values:
+                    where.append("0" if op == "in" else "1")
+                    continue
+                marks = ", ".join("?" for _ in values)
+                if op == "in":
+                    where.append(f"{expr} IN ({marks})")
+                else:
+                    where.append(f"{expr} IS NOT NULL AND {expr} NOT IN ({marks})")
+                params.extend(_sql_param(v) for v in values)
+            elif op in ("array_contains", "array_contains_any"):
+                values = [value] if op == "array_contains" else list(value)
+                marks = ", ".join("?" for _ in values)
+                json_path = "$." + field_path
+                where.append(f"EXISTS (SELECT 1 FROM json_each(data, '{json_path}') WHERE json_each.value IN ({marks}))")
+                params.extend(_sql_param(v) for v in values)
+            else:
+                raise ValueError(f"Unsupported operator: {op}")
+
+        order_sql = []
+        for field_path, direction in spec.orders:
+            expr = "id" if field_path == DOCUMENT_ID else _sql_field(field_path)
+            if field_path != DOCUMENT_ID:
+                where.append(f"{expr} IS NOT NULL")
+            order_sql.append(f"{expr} {'DESC' if direction == firestore.Query.DESCENDING else 'ASC'}")
+        order_sql.append("id ASC")
+
+        sql = f"SELECT id, data, version FROM docs WHERE {' AND '.join(where)} ORDER BY {', '.join(order_sql)}"
+        if spec.limit is not None:
+            sql += f" LIMIT {int(spec.limit)}"
+            if spec.offset:
+                sql += f" OFFSET {int(spec.offset)}"
+        elif spec.offset:
+            sql += f" LIMIT -1 OFFSET {int(spec.offset)}"
+
+        rows = []
+        for doc_id, text, version in self._conn.execute(sql, params):
+            rows.append((doc_id, self._decode(text), version))
+        return rows
+
+    def _begin(self):
+        self._conn.execute("BEGIN")
+
+    def _put(self, path, data, version):
+        collection, doc_id = _split_path(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO docs (collection, id, data, version) VALUES (?, ?, ?, ?)",
+            (collection, doc_id, json.dumps(data, default=_json_default, ensure_ascii=False), version),
+        )
+
+    def _delete(self, path):
+        collection, doc_id = _split_path(path)
+        self._conn.execute("DELETE FROM docs WHERE collection = ? AND id = ?", (collection, doc_id))
+
+    def _end(self):
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+
+# --- 4. FIRESTORE-COMPATIBLE CLIENT ---
+
+class LocalDocumentSnapshot:
+    def __init__(self, reference, data, version: int = 0, read_time=None):
+        self.reference = reference
+        self._data = data
+        self.version = version
+        self.read_time = read_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return _to_client(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _to_client(value)
+
+
+class LocalDocumentChange:
+    def __init__(self, change_type: ChangeType, document: LocalDocumentSnapshot):
+        self.type = change_type
+        self.document = document
+        self.old_index = -1
+        self.new_index = -1
+
+
+class _Watch:
+    """Giống google.cloud.firestore_v1.watch.Watch (chỉ cần unsubscribe / is_active)."""
+
+    def __init__(self, store: _Store, listener_id: int):
+        self._store = store
+        self._listener_id = listener_id
+
+    @property
+    def is_active(self) -> bool:
+        return self._store.has_listener(self._listener_id)
+
+    def unsubscribe(self):
+        self._store.remove_listener(self._listener_id)
+
+
+class LocalQuery:
+    def __init__(self, client, spec: QuerySpec):
+        self._client = client
+        self._spec = spec
+
+    def _with(self, **changes):
+        return LocalQuery(self._client, self._spec.replace(**changes))
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if field_path == DOCUMENT_ID:
+            value = [getattr(v, "id", v) for v in value] if op_string in ("in", "not-in") else getattr(value, "id", value)
+        return self._with(filters=self._spec.filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path, direction=firestore.Query.ASCENDING):
+        return self._with(orders=self._spec.orders + ((field_path, direction),))
+
+    def limit(self, count: int):
+        return self._with(limit=count)
+
+    def offset(self, num_to_skip: int):
+        return self._with(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._with(select=list(field_paths))
+
+    def _snapshots(self, rows):
+        collection = self._client.collection(self._spec.collection)
+        now = datetime.now(timezone.utc)
+        for doc_id, data, version in rows:
+            if self._spec.select is not None:
+                data = _project(data, self._spec.select)
+            yield LocalDocumentSnapshot(collection.document(doc_id), data, version, now)
+
+    def stream(self, transaction=None):
+        if transaction is not None:
+            return transaction.get(self)
+        return self._snapshots(self._client._store.query(self._spec))
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        def _listener(rows, changes):
+            docs = list(self._snapshots(rows))
+            doc_changes = [
+                LocalDocumentChange(kind, next(self._snapshots([row])))
+                for kind, row in changes
+            ]
+            callback(docs, doc_changes, datetime.now(timezone.utc))
+
+        return _Watch(self._client._store, self._client._store.add_listener(self._spec, _listener))
+
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, client, path: str):
+        super().__init__(client, QuerySpec(path))
+        self._path = path
+
+    @property
+    def id(self):
+        return self._path.rpartition("/")[2]
+
+    def document(self, document_id: str | None = None):
+        return LocalDocumentReference(self._client, self._path, document_id or _random_id())
+
+    def add(self, document_data: dict, document_id: str | None = None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id, _d, _v in self._client._store.query(self._spec)]
+
+
+class LocalDocumentReference:
+    def __init__(self, client, collection_path: str, document_id: str):
+        if not document_id or "/" in document_id:
+            raise ValueError(f"Invalid document id: {document_id!r}")
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self):
+        return LocalCollectionReference(self._client, self._collection_path)
+
+    def collection(self, collection_id: str):
+        return LocalCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        if transaction is not None:
+            return next(transaction.get(self))
+        current = self._client._store.get(self.path)
+        data, version = current if current else (None, 0)
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        return LocalDocumentSnapshot(self, data, version, datetime.now(timezone.utc))
+
+    def _commit(self, op, data=None, merge=False):
+        self._client._store.commit([(op, self.path, data, merge)])
+
+    def create(self, document_data: dict):
+        self._commit("create", document_data)
+
+    def set(self, document_data: dict, merge=False):
+        self._commit("set", document_data, merge)
+
+    def update(self, field_updates: dict):
+        self._commit("update", field_updates)
+
+    def delete(self):
+        self._commit("delete")
+
+    def on_snapshot(self, callback):
+        query = LocalQuery(self._client, QuerySpec(self._collection_path, [(DOCUMENT_ID, "==", self.id)]))
+        return query.on_snapshot(callback)
+
+
+class LocalWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(("create", reference.path, document_data, False))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference.path, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(("update", reference.path, field_updates, False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference.path, None, False))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        self._client._store.commit(writes)
+        return writes
+
+
+class LocalTransaction(LocalWriteBatch):
+    """Transaction optimistic: ghi lại những gì đã đọc, kiểm tra lại lúc commit."""
+
+    def __init__(self, client, max_attempts: int = MAX_TRANSACTION_ATTEMPTS):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_versions = {}
+        self._read_queries = []
+
+    def _reset(self):
+        self._writes = []
+        self._read_versions = {}
+        self._read_queries = []
+
+    def get(self, ref_or_query):
+        """Giống Firestore: trả về generator DocumentSnapshot cho cả document lẫn query."""
+        if self._writes:
+            raise ReadAfterWriteError("Firestore transactions require all reads to be executed before all writes.")
+        if isinstance(ref_or_query, LocalDocumentReference):
+            return self.get_all([ref_or_query])
+        spec = ref_or_query._spec
+        rows = self._client._store.query(spec)
+        self._read_queries.append((spec, {doc_id: version for doc_id, _d, version in rows}))
+        return ref_or_query._snapshots(rows)
+
+    def get_all(self, references):
+        if self._writes:
+            raise ReadAfterWriteError("Firestore transactions require all reads to be executed before all writes.")
+        snapshots = []
+        for ref in references:
+            snap = ref.get()
+            self._read_versions[ref.path] = snap.version
+            snapshots.append(snap)
+        return iter(snapshots)
+
+    def _run(self, func, *args, **kwargs):
+        for attempt in range(self._max_attempts):
+            self._reset()
+            result = func(self, *args, **kwargs)
+            try:
+                self._client._store.commit(self._writes, self._read_versions, self._read_queries)
+                return result
+            except TransactionConflict:
+                if attempt == self._max_attempts - 1:
+                    raise
+                # Backoff ngẫu nhiên để các transaction tranh chấp không đụng nhau lần nữa
+                time.sleep(random.uniform(0, 0.002 * (attempt + 1)))
+            finally:
+                self._writes = []
+
+
+class LocalClient:
+    """Client cục bộ tương thích phần Firestore API mà db.py sử dụng."""
+
+    def __init__(self, store: _Store):
+        self._store = store
+
+    @property
+    def store(self) -> _Store:
+        return self._store
+
+    def collection(self, path: str):
+        return LocalCollectionReference(self, path)
+
+    def document(self, path: str):
+        collection, doc_id = _split_path(path)
+        return LocalDocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def transaction(self, max_attempts: int = MAX_TRANSACTION_ATTEMPTS, **kwargs):
+        return LocalTransaction(self, max_attempts)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        if transaction is not None:
+            return transaction.get_all(references)
+        return iter([ref.get(field_paths=field_paths) for ref in references])
+
+    def close(self):
+        self._store.close()
+
+
+def transactional(func):
+    """
+    Thay cho `firestore.transactional`: chạy được với cả Firestore Transaction
+    lẫn LocalTransaction (retry khi xung đột).
+    """
+    def wrapper(transaction, *args, **kwargs):
+        # Proxy đếm thao tác (src/metrics.py) bọc transaction thật trong `_target`
+        target = getattr(transaction, "_target", transaction)
+        if isinstance(target, LocalTransaction):
+            return target._run(lambda _tx, *a, **kw: func(transaction, *a, **kw), *args, **kwargs)
+        return firestore.transactional(func)(transaction, *args, **kwargs)
+    return wrapper
+
+
+def create_local_client(backend: str, path: str | None = None) -> LocalClient:
+    """Tạo client cục bộ: backend = 'memory' hoặc 'sqlite' (cần `path`)."""
+    if backend == "memory":
+        return LocalClient(MemoryStore())
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("SQLite backend requires a database path")
+        return LocalClient(SqliteStore(path))
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -2,8 +2,9 @@
 UI Helper Functions - CSS và styling chung cho toàn bộ app
 """
 import streamlit as st
-from src.db import authenticate_user, get_all_users, create_user, hash_password, create_user_session, verify_user_session, delete_user_session, get_db
-from src.models import User, UserRole
+from src.db import authenticate_user, get_all_users, create_user, hash_password, create_user_session, verify_user_session, delete_user_session, get_db, begin_db_run, get_last_db_run
+from src.models import User, UserRole, Permission
+from src.config import AppConfig
 import time
 import os
 import extra_streamlit_components as stx
@@ -19,6 +20,22 @@ def get_manager():
     # Best practice with stx is often:
     return stx.CookieManager(key="auth_cookie_manager")
 
+def _read_auth_cookie(cookie_manager=None):
+    """
+    Đọc cookie auth_token.
+    Ưu tiên st.context.cookies (đọc đồng bộ từ HTTP request, có ngay ở lần chạy đầu);
+    CookieManager chỉ là dự phòng vì component cần vài lần rerun mới sync.
+    """
+    try:
+        token = st.context.cookies.get("auth_token")
+        if token:
+            return token
+    except Exception:
+        pass
+    if cookie_manager is not None:
+        return cookie_manager.get(cookie="auth_token")
+    return None
+
 def load_custom_css():
     """Load global CSS from methods"""
     css_file = os.path.join(os.path.dirname(__file__), "styles.css")
@@ -93,13 +110,10 @@ def login_form(cookie_manager=None):
                 if user:
                     st.session_state["user"] = user
                     
-                    # Clear retry count
-                    if "auth_retry_count" in st.session_state:
-                        del st.session_state["auth_retry_count"]
-                    
-                    # 2. Tạo session token & lưu cookie (7 ngày)
-                    token = create_user_session(username)
-                    cookie_manager.set("auth_token", token, expires_at=datetime.now() + timedelta(days=7))
+                    # 2. Tạo session token (ký HMAC) & lưu cookie
+                    token = create_user_session(username, user)
+                    st.session_state["auth_token"] = token
+                    cookie_manager.set("auth_token", token, expires_at=datetime.now() + timedelta(days=AppConfig.SESSION_TTL_DAYS))
                     
                     st.success(f"Chào mừng {user.get('full_name')}!")
                     # Increase sleep to ensure cookie is set on frontend before rerun
@@ -116,43 +130,25 @@ def require_login():
     Nếu chưa login -> Hiện form login -> Chặn render nội dung bằng st.stop()
     Nếu đã login -> Hiển thị nút Logout ở sidebar.
     """
+    # Bắt đầu đếm read/write Firestore cho lần chạy trang này
+    begin_db_run()
     init_default_admin()
     
-    # 0. Init Cookie Manager
+    # 0. Init Cookie Manager (dùng để ghi / xóa cookie)
     cookie_manager = get_manager()
     
-    # If we are logged in, clear retry count to keep state clean
-    if "user" in st.session_state:
-        if "auth_retry_count" in st.session_state:
-             del st.session_state["auth_retry_count"]
-    
     # 1. Check if already logged in session
     if "user" not in st.session_state:
-        # 2. Try to get cookie
-        auth_token = cookie_manager.get(cookie="auth_token")
-        
-        if auth_token:
-            user = verify_user_session(auth_token)
-            if user:
-                # 1. Update session state
-                st.session_state["user"] = user
-                st.rerun() # Reload để áp dụng state
-        
-        # 3. Retry mechanism (Fix Flicker on Cloud)
-        # Cookie manager check might be slow on Cloud (async). 
-        # We try to wait/rerun a few times before deciding user is NOT logged in.
-        if "auth_retry_count" not in st.session_state:
-            st.session_state["auth_retry_count"] = 0
-            
-        if st.session_state["auth_retry_count"] < 5: # Increase retries to 5
-            st.session_state["auth_retry_count"] += 1
-            # Wait varying time to allow frontend to sync
-            time.sleep(0.5) # Increase wait time
-            st.rerun()
-            
-        # 4. Exhausted retries -> Show Login Form
-        login_form(cookie_manager)
-        st.stop() # Dừng render nội dung bên dưới
+        # 2. Khôi phục phiên từ cookie: token ký HMAC -> kiểm tra cục bộ, không query DB
+        auth_token = _read_auth_cookie(cookie_manager)
+        user = verify_user_session(auth_token) if auth_token else None
+        if user:
+            st.session_state["user"] = user
+            st.session_state["auth_token"] = auth_token
+        else:
+            # 3. Không có phiên hợp lệ -> Show Login Form
+            login_form(cookie_manager)
+            st.stop() # Dừng render nội dung bên dưới
     
     # Nếu đã login, hiển thị thông tin user ở sidebar
     user = st.session_state["user"]
@@ -166,15 +162,33 @@ def require_login():
         """, unsafe_allow_html=True)
         
         if st.button("Đăng xuất", type="secondary", key="btn_logout"):
-            # Clear DB Session
-            delete_user_session(user.get("username"))
+            # Thu hồi phiên hiện tại
+            token = st.session_state.pop("auth_token", None) or _read_auth_cookie(cookie_manager)
+            if token:
+                delete_user_session(user.get("username"), token)
             # Clear Cookie
             cookie_manager.delete("auth_token")
             # Clear Session State
             st.session_state.pop("user")
-            st.session_state.pop("auth_retry_count", None)
             st.rerun()
 
+        if has_permission(Permission.MANAGE_SYSTEM_CONFIG):
+            _render_last_db_run()
+
+def _render_last_db_run():
+    """Admin: số read/write Firestore của lần chạy trước (cảnh báo nếu vượt ngân sách của trang)."""
+    last = get_last_db_run()
+    if not last:
+        return
+    text = (
+        f"🔥 DB lần chạy trước ({last['page']}): {last['reads']} read · {last['writes']} write · "
+        f"{last['bytes'] / 1024:.0f} KB · {last['latency_ms']:.0f} ms"
+    )
+    if last["over_budget"]:
+        st.warning(f"{text} — vượt ngân sách {last['budget']} read")
+    else:
+        st.caption(text)
+
 def apply_sidebar_style():
     """
     Áp dụng CSS tùy chỉnh cho sidebar (left menu) trên tất cả các trang.
@@ -464,9 +478,20 @@ def create_custom_sidebar_menu():
 
 # --- PERMISSION HELPERS ---
 
+def _current_page_name() -> str:
+    """Tên trang đang chạy (dùng cho thống kê kiểm tra quyền)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        page = ctx.pages_manager.get_pages().get(ctx.pages_manager.current_page_script_hash, {})
+        return page.get("page_name") or "main"
+    except Exception:
+        return "?"
+
 def has_permission(permission: str) -> bool:
     """
     Kiểm tra xem user hiện tại có quyền cụ thể không.
+    Dùng resolver đã biên dịch (frozenset theo role) -> O(1), không tốn read.
     
     Args:
         permission: Permission value (string) hoặc Permission enum
@@ -474,26 +499,15 @@ def has_permission(permission: str) -> bool:
     Returns:
         True nếu user có quyền, False nếu không
     """
-    from src.db import get_role_permissions
-    from src.models import UserRole
+    from src.db import _get_permission_resolver
     
     # Lấy user hiện tại
     user = st.session_state.get("user")
     if not user:
         return False
     
-    # Admin luôn có tất cả quyền
-    user_role = user.get("role", "")
-    if user_role == UserRole.ADMIN.value:
-        return True
-    
-    # Lấy danh sách quyền của role
-    permissions = get_role_permissions(user_role)
-    
-    # Convert permission to string value if it's enum
-    perm_value = permission.value if hasattr(permission, 'value') else permission
-    
-    return perm_value in permissions
+    # Admin luôn có tất cả quyền (resolver xử lý)
+    return _get_permission_resolver().allowed(user.get("role", ""), permission, page=_current_page_name())
 
 def require_permission(permission: str, error_message: str = None):
     """
@@ -0,0 +1,9 @@
+"""Chạy test trên local backend (không cần Firestore / thread nền)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("REALTIME_MIRROR", "0")
+os.environ.setdefault("HOLD_SWEEPER", "0")
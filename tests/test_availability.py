@@ -0,0 +1,52 @@
+"""Index lịch trống với giờ đọc từ Firestore (UTC có tzinfo) trên máy chủ không ở múi giờ UTC."""
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.availability import AvailabilityIndex
+from src.models import BookingStatus, RoomStatus
+
+
+@pytest.fixture
+def utc_plus_7(monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Ho_Chi_Minh")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _index(room: dict | None = None, now: datetime | None = None) -> AvailabilityIndex:
+    # Booking ghi giờ local naive 20/10 14:00 -> 21/10 12:00; Firestore trả về cùng giá trị, gắn tzinfo UTC
+    booking = {
+        "id": "b1", "room_id": "101", "status": BookingStatus.CONFIRMED.value,
+        "check_in": datetime(2026, 10, 20, 14, 0, tzinfo=timezone.utc),
+        "check_out_expected": datetime(2026, 10, 21, 12, 0, tzinfo=timezone.utc),
+    }
+    room = room or {"id": "101", "room_type_code": "STD", "status": RoomStatus.RESERVED.value}
+    return AvailabilityIndex([room], [booking], now=now or datetime(2026, 10, 18, 9, 0))
+
+
+def test_stay_read_back_from_firestore_keeps_wall_time(utc_plus_7):
+    index = _index()
+    now = datetime(2026, 10, 18, 9, 0)
+
+    assert index.conflict("101", datetime(2026, 10, 20, 15, 0), datetime(2026, 10, 20, 16, 0), now=now)
+    assert index.conflict("101", datetime(2026, 10, 21, 13, 0), datetime(2026, 10, 22, 12, 0), now=now) is None
+    assert index.conflict("101", datetime(2026, 10, 19, 14, 0), datetime(2026, 10, 20, 13, 0), now=now) is None
+    assert index.next_reservation("101", datetime(2026, 10, 20, 14, 0)) == "b1"
+
+
+def test_hold_expiry_stays_an_absolute_instant(utc_plus_7):
+    now = datetime(2026, 10, 18, 9, 0)
+    room = {
+        "id": "101", "room_type_code": "STD", "status": RoomStatus.TEMP_LOCKED.value,
+        "locked_by": "s1", "locked_until": (now + timedelta(minutes=5)).astimezone(timezone.utc),
+    }
+    index = _index(room, now)
+    request = (datetime(2026, 10, 25, 14, 0), datetime(2026, 10, 26, 12, 0))
+
+    assert index.conflict("101", *request, session_id="s2", now=now) == "đang được người khác giữ"
+    assert index.conflict("101", *request, session_id="s1", now=now) is None
+    assert index.conflict("101", *request, session_id="s2", now=now + timedelta(minutes=6)) is None
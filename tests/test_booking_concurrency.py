@@ -0,0 +1,103 @@
+"""Chống overbooking: nhiều luồng cùng đặt vài phòng (memory backend, transaction optimistic như Firestore)."""
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import db
+from src.availability import to_seconds
+from src.models import Booking, BookingType, RoomStatus
+
+
+def _seed_rooms(room_ids: list):
+    db.get_db().store.bulk_load("rooms", [
+        (rid, {"id": rid, "room_type_code": "STD", "floor": "Khu A", "status": RoomStatus.AVAILABLE.value})
+        for rid in room_ids
+    ])
+    db.trigger_system_update(db.SCOPE_ROOMS)  # bulk_load không tăng version -> index lịch trống dựng lại
+
+
+def _booking(room_id: str, i: int, check_in: datetime, nights: int) -> Booking:
+    return Booking(
+        room_id=room_id, customer_name=f"Khách {i}", customer_phone=f"09{i:08d}",
+        booking_type=BookingType.DAILY, check_in=check_in,
+        check_out_expected=check_in + timedelta(days=nights), price_original=500000,
+    )
+
+
+def _active_bookings(room_ids: list) -> list:
+    docs = db.get_db().collection("bookings").where("status", "in", db.ACTIVE_BOOKING_STATUSES).stream()
+    return [d.to_dict() for d in docs if d.to_dict()["room_id"] in room_ids]
+
+
+@pytest.fixture
+def utc_plus_7(monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Ho_Chi_Minh")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_concurrent_create_bookings_never_double_book():
+    room_ids = [f"CC{i}" for i in range(3)]
+    _seed_rooms(room_ids)
+    rng = random.Random(7)
+    base = datetime.now().replace(hour=14, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    plans = [
+        (rng.random() < 0.25, _booking(rng.choice(room_ids), i, base + timedelta(days=rng.randrange(0, 6)), rng.randint(1, 3)))
+        for i in range(60)
+    ]
+    # Walk-in: nhận phòng ngay (tranh chấp cả trạng thái phòng)
+    for walk_in, booking in plans:
+        if walk_in:
+            booking.check_in = datetime.now()
+            booking.check_out_expected = booking.check_in + timedelta(days=1)
+
+    barrier = threading.Barrier(len(plans))
+    results = [None] * len(plans)
+
+    def worker(i, walk_in, booking):
+        barrier.wait()
+        results[i] = db.create_bookings([booking], is_checkin_now=walk_in, session_id=f"s{i}")
+
+    threads = [threading.Thread(target=worker, args=(i, w, b)) for i, (w, b) in enumerate(plans)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    unexpected = [
+        result for (ok, result), (_, booking) in zip(results, plans)
+        if not ok and not result.startswith(f"Phòng {booking.room_id} ") and "changed during transaction" not in result
+    ]
+    assert not unexpected
+    assert any(ok for ok, _ in results)
+
+    bookings = _active_bookings(room_ids)
+    for rid in room_ids:
+        spans = sorted(
+            (to_seconds(b["check_in"]), to_seconds(b["check_out_expected"])) for b in bookings if b["room_id"] == rid
+        )
+        assert all(b[0] >= a[1] for a, b in zip(spans, spans[1:])), f"double booking on {rid}"
+
+
+def test_overlap_guard_uses_wall_time_off_utc(utc_plus_7):
+    _seed_rooms(["TZ1"])
+    check_in = datetime.now().replace(hour=14, minute=0, second=0, microsecond=0) + timedelta(days=2)
+
+    def _stay(i, start_hours, end_hours):
+        booking = _booking("TZ1", i, check_in + timedelta(hours=start_hours), 1)
+        booking.check_out_expected = check_in + timedelta(hours=end_hours)
+        return db.create_booking(booking, is_checkin_now=False)
+
+    ok, first_id = _stay(1, 0, 1)
+    assert ok
+    # Sau lượt ở đầu (trong 7 giờ lệch múi): trống, phòng vẫn trỏ tới lượt sớm hơn
+    assert _stay(2, 2, 3)[0]
+    assert db.get_db().collection("rooms").document("TZ1").get().to_dict()["current_booking_id"] == first_id
+    # Chồng lên lượt ở đầu: trùng lịch
+    ok, msg = _stay(3, 0.5, 1.5)
+    assert not ok and msg.startswith("Phòng TZ1 ")
@@ -0,0 +1,53 @@
+"""Gia hạn / nhả phòng giữ chỗ: ghép snapshot theo id, không theo thứ tự get_all trả về."""
+import pytest
+
+from src import db, storage
+from src.models import RoomStatus
+
+
+@pytest.fixture
+def shuffled_get_all(monkeypatch):
+    """Firestore không đảm bảo get_all trả về đúng thứ tự yêu cầu: đảo ngược để kiểm tra."""
+    original = storage.LocalTransaction.get_all
+
+    def _reversed(self, references):
+        return iter(list(original(self, references))[::-1])
+
+    monkeypatch.setattr(storage.LocalTransaction, "get_all", _reversed)
+
+
+def _seed_holds(prefix: str):
+    mine, other = f"{prefix}1", f"{prefix}2"
+    db.get_db().store.bulk_load("rooms", [
+        (rid, {"id": rid, "room_type_code": "STD", "floor": "Khu A", "status": RoomStatus.AVAILABLE.value})
+        for rid in (mine, other)
+    ])
+    assert db.hold_rooms([mine], "s-mine", 5)[0]
+    assert db.hold_rooms([other], "s-other", 5)[0]
+    return mine, other
+
+
+def _room(room_id: str) -> dict:
+    return db.get_db().collection("rooms").document(room_id).get().to_dict()
+
+
+def test_renew_extends_only_rooms_held_by_session(shuffled_get_all):
+    mine, other = _seed_holds("RN")
+    mine_before, other_before = _room(mine)["locked_until"], _room(other)["locked_until"]
+
+    assert db.renew_room_holds([mine, other], "s-mine", 30) == [mine]
+
+    assert _room(mine)["locked_until"] > mine_before
+    assert _room(other)["locked_until"] == other_before
+    assert _room(other)["locked_by"] == "s-other"
+
+
+def test_release_frees_only_rooms_held_by_session(shuffled_get_all):
+    mine, other = _seed_holds("RL")
+
+    assert db.release_room_holds([mine, other], "s-mine") == [mine]
+
+    assert _room(mine)["status"] == RoomStatus.AVAILABLE.value
+    assert "locked_by" not in _room(mine)
+    assert _room(other)["status"] == RoomStatus.TEMP_LOCKED.value
+    assert _room(other)["locked_by"] == "s-other"
@@ -0,0 +1,89 @@
+"""Kiểm thử LiveMirror qua LocalChangeSource (không cần Firestore)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.realtime import BOOKINGS, ROOM_TYPES, ROOMS, LiveMirror, LocalChangeSource  # noqa: E402
+
+
+def _started_mirror():
+    source = LocalChangeSource()
+    mirror = LiveMirror(source, health_check_seconds=0).start()
+    return source, mirror
+
+
+def test_initial_snapshot_makes_collection_ready():
+    source, mirror = _started_mirror()
+    assert not mirror.is_ready(ROOMS)
+
+    source.load(ROOMS, {"101": {"id": "101", "status": "Trống"}, "102": {"id": "102", "status": "Trống"}})
+
+    assert mirror.is_ready(ROOMS)
+    assert not mirror.is_ready(BOOKINGS)
+    assert sorted(r["id"] for r in mirror.rooms()) == ["101", "102"]
+
+
+def test_initial_snapshot_replaces_previous_docs():
+    source, mirror = _started_mirror()
+    source.load(ROOM_TYPES, {"STD": {"type_code": "STD"}})
+    source.load(ROOM_TYPES, {"VIP": {"type_code": "VIP"}})
+
+    assert [t["type_code"] for t in mirror.room_types()] == ["VIP"]
+
+
+def test_apply_and_remove_patch_documents():
+    source, mirror = _started_mirror()
+    source.load(BOOKINGS, {"b1": {"room_id": "101", "status": "Đã đặt"}})
+
+    source.push(BOOKINGS, "b1", {"room_id": "101", "status": "Đang ở"})
+    source.push(BOOKINGS, "b2", {"room_id": "102", "status": "Đã đặt"})
+    assert mirror.active_bookings() == {
+        "b1": {"room_id": "101", "status": "Đang ở"},
+        "b2": {"room_id": "102", "status": "Đã đặt"},
+    }
+
+    source.remove(BOOKINGS, "b1")
+    assert list(mirror.active_bookings()) == ["b2"]
+    assert mirror.stats()["events_applied"] == 4
+
+
+def test_reads_return_copies():
+    source, mirror = _started_mirror()
+    source.load(ROOMS, {"101": {"id": "101", "status": "Trống"}})
+
+    mirror.rooms()[0]["status"] = "Đang ở"
+
+    assert mirror.rooms()[0]["status"] == "Trống"
+
+
+def test_dead_listener_stops_serving_and_resubscribes():
+    source, mirror = _started_mirror()
+    for name in (ROOMS, BOOKINGS, ROOM_TYPES):
+        source.load(name, {})
+    source.push(ROOMS, "101", {"id": "101", "status": "Trống"})
+
+    source.fail(ROOMS)
+    # Thay đổi trong lúc listener chết không tới được mirror
+    source.push(ROOMS, "101", {"id": "101", "status": "Đang ở"})
+    assert mirror.rooms()[0]["status"] == "Trống"
+
+    # Phát hiện listener chết -> đăng ký lại, snapshot ban đầu mới đưa dữ liệu về đúng
+    assert mirror.check_health() == [ROOMS]
+    assert mirror.is_ready(ROOMS)
+    assert mirror.rooms() == [{"id": "101", "status": "Đang ở"}]
+    assert mirror.stats()["resubscribes"] == 1
+
+
+def test_collection_not_ready_while_resubscribe_fails():
+    source, mirror = _started_mirror()
+    source.load(ROOMS, {"101": {"id": "101"}})
+
+    def _broken_resubscribe(collection):
+        raise RuntimeError("permission denied")
+
+    source.resubscribe = _broken_resubscribe
+    source.fail(ROOMS)
+
+    assert mirror.check_health() == [ROOMS]
+    assert not mirror.is_ready(ROOMS)